@@ -0,0 +1,262 @@
+"""
+Result artifacts: the .docx copies of an analysis' inputs and its formatted
+findings, written on a background pool instead of the request path.
+
+Each rendered file is kept once in a content-addressed store and hard-linked
+into every results folder that needs it, so an unchanged input (the
+reference corpus above all) is neither rebuilt nor rewritten per analysis.
+A results folder's artifacts.json records what is pending, written or failed
+there, which lets any worker process answer /download-results.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import ARTIFACT_WRITES, span
+
+ARTIFACTS = {
+    "formatted_analysis": "formatted_analysis.docx",
+    "analyzed_document": "analyzed_document.docx",
+    "operational_testing_section": "operational_testing_section.docx",
+    "proprietary_documents_input": "proprietary_documents_input.docx",
+}
+# Comma-separated artifact names to write, or "all" / "none"
+RESULT_ARTIFACTS = os.getenv("RESULT_ARTIFACTS", "all")
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", ".artifact_store")
+ARTIFACT_WORKERS = int(os.getenv("ARTIFACT_WORKERS", "1"))
+# Store files no results folder links to (or, with copies, none has used) are removed after this long
+ARTIFACT_STORE_RETENTION_SECONDS = int(os.getenv("ARTIFACT_STORE_RETENTION_SECONDS", str(24 * 3600)))
+MANIFEST = "artifacts.json"
+
+
+def enabled_artifacts(setting=None):
+    setting = (RESULT_ARTIFACTS if setting is None else setting).strip().lower()
+    if setting == "all":
+        return set(ARTIFACTS)
+    if setting in ("", "none"):
+        return set()
+    names = {name.strip() for name in setting.split(",") if name.strip()}
+    unknown = names - set(ARTIFACTS)
+    if unknown:
+        raise ValueError(f"Unknown artifacts in RESULT_ARTIFACTS: {', '.join(sorted(unknown))}")
+    return names
+
+
+def read_manifest(results_dir):
+    try:
+        with open(os.path.join(results_dir, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class ArtifactWriter:
+    """
+    Renders and places result artifacts on a small thread pool. Renders of
+    the same content are deduplicated through the store, including ones
+    already in flight.
+    """
+
+    def __init__(self, store_dir=ARTIFACT_STORE, enabled=None, max_workers=ARTIFACT_WORKERS):
+        self.store_dir = store_dir
+        self.enabled = enabled_artifacts() if enabled is None else set(enabled)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="artifacts")
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._manifest_locks = {}
+        self._pending = set()
+        self._last_prune = 0.0
+        self.rendered = 0
+        self.linked = 0
+        self.failed = 0
+        os.makedirs(store_dir, exist_ok=True)
+
+    def submit(self, results_dir, name, key, produce, render):
+        """
+        Queues artifact `name` for `results_dir`. `produce()` returns its text
+        and `render(text, path)` writes the .docx; `key` identifies the content
+        (e.g. a hash of the text), so `produce` isn't even called when that
+        content has been rendered before. Returns the artifact's path, or None
+        if the artifact is disabled.
+        """
+        if name not in self.enabled:
+            return None
+        path = os.path.join(results_dir, ARTIFACTS[name])
+        self._set_state(results_dir, name, {"status": "pending", "file": ARTIFACTS[name]})
+        future = self._executor.submit(self._write, results_dir, name, key, produce, render)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return path
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def _store_path(self, key, render):
+        digest = hashlib.sha256(f"{render.__name__}\0{key}".encode("utf-8")).hexdigest()
+        return os.path.join(self.store_dir, f"{digest}.docx")
+
+    def _write(self, results_dir, name, key, produce, render):
+        stored = self._store_path(key, render)
+        path = os.path.join(results_dir, ARTIFACTS[name])
+        try:
+            with span(f"artifact.{name}") as attrs:
+                with self._key_lock(stored):
+                    attrs["rendered"] = not os.path.exists(stored)
+                    if attrs["rendered"]:
+                        _render(stored, produce, render)
+                    try:
+                        linked = _place(stored, path)
+                    except FileNotFoundError:
+                        # pruned by another worker process between the check and the link
+                        attrs["rendered"] = True
+                        _render(stored, produce, render)
+                        linked = _place(stored, path)
+                    if not linked:
+                        os.utime(stored)  # a copy doesn't raise st_nlink; the mtime marks the file as in use
+        except Exception as e:
+            print(f"❌ Writing {ARTIFACTS[name]} failed: {e}")
+            ARTIFACT_WRITES.inc(artifact=name, outcome="failed")
+            with self._lock:
+                self.failed += 1
+            self._set_state(results_dir, name, {"status": "failed", "file": ARTIFACTS[name], "error": str(e)})
+            return
+        outcome = "rendered" if attrs["rendered"] else "linked"
+        ARTIFACT_WRITES.inc(artifact=name, outcome=outcome)
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+        self._set_state(results_dir, name, {"status": "written", "file": ARTIFACTS[name]})
+        self._maybe_prune()
+
+    def _key_lock(self, stored):
+        with self._lock:
+            return self._key_locks.setdefault(stored, threading.Lock())
+
+    def _set_state(self, results_dir, name, state):
+        with self._lock:
+            lock = self._manifest_locks.setdefault(results_dir, threading.Lock())
+        with lock:
+            manifest = read_manifest(results_dir)
+            manifest[name] = state
+            tmp_path = os.path.join(results_dir, f"{MANIFEST}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, os.path.join(results_dir, MANIFEST))
+
+    def _maybe_prune(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_prune < 3600:
+                return
+            self._last_prune = now
+        self.prune()
+
+    def prune(self, retention_seconds=ARTIFACT_STORE_RETENTION_SECONDS):
+        """
+        Removes store files no results folder links to and none has used
+        (copied) within `retention_seconds`.
+        """
+        cutoff = time.time() - retention_seconds
+        removed = 0
+        for entry in os.scandir(self.store_dir):
+            if not entry.name.endswith(".docx"):
+                continue
+            # under the key lock, so a write in this process can't be placing it meanwhile
+            with self._key_lock(entry.path):
+                try:
+                    stat = os.stat(entry.path)
+                    if stat.st_nlink <= 1 and stat.st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    continue
+        with self._lock:
+            self._key_locks = {k: v for k, v in self._key_locks.items() if v.locked() or os.path.exists(k)}
+        return removed
+
+    def flush(self, timeout=None):
+        """Waits until every queued artifact is written (e.g. before a CLI run exits)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                return True
+            for future in pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                try:
+                    future.result(remaining)
+                except Exception:
+                    return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": sorted(self.enabled),
+                "pending": len(self._pending),
+                "rendered": self.rendered,
+                "linked": self.linked,
+                "failed": self.failed,
+            }
+
+
+def _temp_beside(path):
+    """
+    A new empty file with a unique name next to `path` (same directory, so
+    os.replace onto `path` is atomic), safe against other threads and processes.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f".{os.path.basename(path)}.",
+                                    suffix=".tmp")
+    os.close(fd)
+    return tmp_path
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _render(stored, produce, render):
+    tmp_path = _temp_beside(stored)
+    try:
+        render(produce(), tmp_path)
+        os.replace(tmp_path, stored)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
+
+def _place(stored, path):
+    """
+    Puts the stored file at `path`: a hard link where possible, else a copy;
+    atomic either way. Returns whether it's a link. Raises FileNotFoundError
+    if the stored file is gone.
+    """
+    if os.path.exists(path) and os.path.samefile(stored, path):
+        return True
+    tmp_path = _temp_beside(path)
+    link_path = f"{tmp_path}.link"  # os.link won't replace a file; this name is ours as long as tmp_path is
+    try:
+        try:
+            os.link(stored, link_path)
+            os.replace(link_path, path)
+            return True
+        except FileNotFoundError:
+            raise
+        except OSError:  # another filesystem, or links not supported
+            shutil.copyfile(stored, tmp_path)
+            os.replace(tmp_path, path)
+            return False
+    finally:
+        _discard(link_path)
+        _discard(tmp_path)
@@ -0,0 +1,234 @@
+"""
+Analyzes every test plan (.docx) in a directory with the same pipeline as
+/analyze, without the web server.
+
+    python batch_analyze.py audits/2024-Q3 --workers 4
+    python batch_analyze.py audits/2024-Q3 --out batch_results/q3 --retry-failed
+
+Each finished file is appended to <out>/checkpoint.jsonl as soon as it
+completes. Re-running with the same --out skips files already in the
+checkpoint with the same content hash, so an interrupted run resumes
+without paying for those analyses again. Per-file workspaces (the uploaded
+copy and the formatted result .docx) are kept under <out>/<path>-<hash>/,
+where <path> is the file's path relative to the directory with sub-folder
+separators written as "__". Ctrl-C starts no new analyses but still
+checkpoints the ones already running; a second Ctrl-C stops at once.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Payload fields copied into the checkpoint next to the result text
+CHECKPOINT_FIELDS = (
+    "result", "tokens_used", "cost", "cached_prompt_tokens", "elapsed_time", "wall_clock_time",
+    "stage_timings", "index_generation", "saved_path", "cached",
+)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_test_plans(directory, recursive=False):
+    """Relative paths of the .docx files under `directory` (Word lock files skipped)."""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        found.extend(
+            os.path.relpath(os.path.join(root, f), directory)
+            for f in sorted(files)
+            if f.lower().endswith(".docx") and not f.startswith("~$")
+        )
+        if not recursive:
+            break
+    return found
+
+
+class Checkpoint:
+    """
+    Append-only JSONL record of finished files. The latest line per file
+    wins; a line cut short by a crash is ignored on load.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.records = {}
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self.records[record["file"]] = record
+        if lines and not lines[-1].endswith("\n"):
+            # end the torn line so the next record starts on its own line
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+    def done(self, file, sha256, retry_failed=False):
+        record = self.records.get(file)
+        if record is None or record["sha256"] != sha256:
+            return False
+        return record["status"] == "completed" or not retry_failed
+
+    def append(self, record):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.records[record["file"]] = record
+
+
+def workspace_name(file, sha256):
+    """<path>-<hash>: copies of one file in different sub-folders get workspaces of their own."""
+    path = os.path.splitext(os.path.normpath(file))[0]
+    for sep in filter(None, (os.sep, os.altsep)):
+        path = path.replace(sep, "__")
+    return f"{path}-{sha256[:8]}"
+
+
+def analyze_file(app, source, file, sha256, out_dir, bypass_cache=False):
+    """Runs one analysis in its own workspace; returns the checkpoint record."""
+    workspace = os.path.join(out_dir, workspace_name(file, sha256))
+    document_dir = os.path.join(workspace, "document")
+    results_dir = os.path.join(workspace, "results")
+    shutil.rmtree(document_dir, ignore_errors=True)  # leftovers of an interrupted attempt
+    os.makedirs(document_dir)
+    os.makedirs(results_dir, exist_ok=True)
+    shutil.copy2(source, os.path.join(document_dir, os.path.basename(file)))
+
+    record = {"file": file, "sha256": sha256, "started_at": time.time()}
+    try:
+        payload = app.run_analysis(document_dir, results_dir, bypass_cache=bypass_cache)
+        record.update(status="completed", **{k: payload.get(k) for k in CHECKPOINT_FIELDS})
+    except Exception as e:
+        record.update(status="failed", error=str(e))
+    record["finished_at"] = time.time()
+    return record
+
+
+def summarize(records, skipped, wall):
+    completed = [r for r in records if r["status"] == "completed"]
+    spent = [r for r in completed if not r.get("cached")]  # cache hits report the original run's cost
+    return {
+        "files": len(records) + skipped,
+        "analyzed": len(completed),
+        "from_result_cache": len(completed) - len(spent),
+        "failed": len(records) - len(completed),
+        "skipped_from_checkpoint": skipped,
+        "wall_time_s": wall,
+        "files_per_minute": len(records) / wall * 60 if wall else 0.0,
+        "tokens_used": sum(r.get("tokens_used") or 0 for r in spent),
+        "cached_prompt_tokens": sum(r.get("cached_prompt_tokens") or 0 for r in spent),
+        "cost_usd": sum(r.get("cost") or 0.0 for r in spent),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="folder of test plans (.docx)")
+    parser.add_argument("--out", default="batch_results", help="workspaces and checkpoint.jsonl go here")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("ANALYSIS_WORKERS", "2")),
+                        help="analyses in flight at once")
+    parser.add_argument("--recursive", action="store_true", help="include sub-folders")
+    parser.add_argument("--retry-failed", action="store_true", help="re-run files whose last attempt failed")
+    parser.add_argument("--bypass-cache", action="store_true", help="ignore the analysis result cache")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    files = find_test_plans(args.directory, args.recursive)
+    if not files:
+        print(f"❌ No .docx files in {args.directory}")
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(args.out, "checkpoint.jsonl"))
+
+    todo = []
+    for file in files:
+        sha256 = file_sha256(os.path.join(args.directory, file))
+        if not checkpoint.done(file, sha256, args.retry_failed):
+            todo.append((file, sha256))
+    skipped = len(files) - len(todo)
+    print(f"📂 {len(files)} test plans, {skipped} already in the checkpoint, {len(todo)} to analyze")
+    if not todo:
+        return 0
+
+    import main as app  # after argument parsing: importing the app opens caches and folders
+
+    app.warm_up()
+    if app._warm_state["status"] != "ready":
+        print(f"❌ Warm-up failed: {app._warm_state['error']}")
+        return 1
+
+    records = []
+    futures = []
+    recorded = set()
+
+    def record_result(future):
+        record = future.result()
+        checkpoint.append(record)
+        records.append(record)
+        recorded.add(future)
+        if record["status"] == "completed":
+            print(f"✅ [{len(records)}/{len(todo)}] {record['file']}: {record['tokens_used']} tokens, "
+                  f"${record['cost']:.4f}{' (cached)' if record['cached'] else ''}")
+        else:
+            print(f"❌ [{len(records)}/{len(todo)}] {record['file']}: {record['error']}")
+
+    t0 = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="batch")
+    try:
+        for file, sha256 in todo:
+            futures.append(executor.submit(analyze_file, app, os.path.join(args.directory, file), file, sha256,
+                                           args.out, args.bypass_cache))
+        for future in as_completed(futures):
+            record_result(future)
+    except KeyboardInterrupt:
+        # queued files never start; running ones are already being paid for, so keep their results
+        running = [f for f in futures if f not in recorded and not f.cancel()]
+        print(f"⏹️ Interrupted; waiting for the {len(running)} analyses already running "
+              f"(Ctrl-C again to stop without them)")
+        try:
+            for future in as_completed(running):
+                record_result(future)
+            app.artifact_writer.flush()
+        except KeyboardInterrupt:
+            print("⏹️ Stopped; finished files are in the checkpoint, re-run to resume")
+            sys.stdout.flush()
+            os._exit(130)  # the pool's threads would otherwise be joined at exit
+        print("⏹️ Finished files are in the checkpoint, re-run to resume")
+        executor.shutdown()
+        return 130
+    executor.shutdown()
+    app.artifact_writer.flush()  # result .docx files are written in the background
+
+    summary = summarize(records, skipped, time.perf_counter() - t0)
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"📊 {summary['analyzed']} analyzed ({summary['from_result_cache']} from cache), "
+              f"{summary['failed']} failed, {summary['skipped_from_checkpoint']} skipped "
+              f"in {summary['wall_time_s']:.1f}s ({summary['files_per_minute']:.1f} files/min)")
+        print(f"💰 {summary['tokens_used']} tokens ({summary['cached_prompt_tokens']} cached prompt), "
+              f"${summary['cost_usd']:.4f}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Time to turn a parsed test plan into what the analysis stages need — the
+flat text, the sections, the operational-testing block and its change →
+requirement pairs — with the old multi-pass code (kept here as reference)
+vs. the single-pass DocumentModel.
+
+    python benchmarks/bench_document_model.py --sizes 5000 50000 200000 --changes 50 500
+
+Each size is a synthetic plan of that many paragraphs (a heading every 40);
+the operational block lists --changes changes. Parsing the .docx itself is
+not included (see bench_docx.py).
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from document_model import DocumentModel  # noqa: E402
+from prompt_builder import Section, heading_level  # noqa: E402
+
+WORDS = (
+    "work order asset maintenance schedule technician inventory calibration audit trail electronic "
+    "signature report dashboard notification escalation approval workflow user role permission CMMS"
+).split()
+
+
+def synthetic_paragraphs(n, n_changes, seed=0):
+    rng = random.Random(seed)
+    paragraphs = [("Title", "CMMS Operational Test Plan"), ("Normal", "Document number TP-0001, version 1.0.")]
+    paragraphs.append(("Heading 1", "1. Introduction"))
+    paragraphs.append(("Normal", "Testing will be performed to validate the following Medium and low risk "
+                                 "functional requirements:"))
+    for i in range(n_changes):
+        paragraphs.append(("Normal", "Change " + " ".join(rng.choices(WORDS, k=6)) + ":"))
+        paragraphs.append(("Normal", f"FR {i // 10 + 1}.{i % 10 + 1}"))
+    paragraphs.append(("Heading 1", "2. Purpose and Scope"))
+    heading = 2
+    while len(paragraphs) < n:
+        if len(paragraphs) % 40 == 0:
+            heading += 1
+            paragraphs.append(("Heading 1", f"{heading}. Section {heading}"))
+        else:
+            paragraphs.append(("Normal", "The CMMS " + " ".join(rng.choices(WORDS, k=25)) + "."))
+    return paragraphs
+
+
+# 🐢 What run_analysis did before DocumentModel
+def _old_operational_section(text):
+    match = re.search(
+        r'performed to validate the following Medium and low risk functional requirements:(.*?)Purpose and Scope',
+        text, re.DOTALL
+    )
+    return match.group(1).strip() if match else None
+
+
+def _old_pairs(operational_text):
+    matches = []
+    lines = operational_text.splitlines()
+    i = 0
+    while i < len(lines) - 1:
+        title_line = lines[i].strip()
+        id_line = lines[i + 1].strip()
+        if title_line.endswith(":") and re.match(r"^(?:BR|FR|UR-REG|FS-REG)\s*[\d\.]+", id_line):
+            m = re.match(r"^([A-Z0-9\-]+\s*\d+(?:\.\d+)*)", id_line)
+            matches.append((title_line.rstrip(":"), m.group(1) if m else id_line))
+            i += 2
+        else:
+            i += 1
+    return matches
+
+
+def _old_sections(paragraphs):
+    sections = [Section(None, 0)]
+    for style_name, text in paragraphs:
+        stripped = text.strip()
+        level = heading_level(style_name, stripped) if stripped else None
+        if level is not None:
+            sections.append(Section(stripped, level))
+        else:
+            sections[-1].paragraphs.append(text)
+    return [s for s in sections if s.heading or any(p.strip() for p in s.paragraphs)]
+
+
+def old_pipeline(paragraphs, debug_regex=True):
+    text = "\n".join(t for _, t in paragraphs)
+    operational_text = _old_operational_section(text)
+    sections = _old_sections(paragraphs)
+    if debug_regex:  # the debug-only findall that ran on every request
+        re.findall(r"([\s\S]*?)\s*Requirement\s*#?:?\s*([A-Za-z0-9\-]+)", operational_text.strip())
+    return text, sections, operational_text, _old_pairs(operational_text)
+
+
+def new_pipeline(paragraphs):
+    document = DocumentModel(paragraphs)
+    return document.text, document.sections, document.operational_text, document.changes
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000, 200000])
+    parser.add_argument("--changes", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per method; the fastest is reported")
+    args = parser.parse_args()
+
+    print(f"{'paragraphs':>10}{'changes':>9}{'old ms':>10}{'old, no debug ms':>18}{'model ms':>10}{'speed-up':>10}")
+    for n in args.sizes:
+        for n_changes in args.changes:
+            paragraphs = synthetic_paragraphs(n, n_changes)
+            old, old_result = best_of(lambda: old_pipeline(paragraphs), args.repeat)
+            old_quiet, _ = best_of(lambda: old_pipeline(paragraphs, debug_regex=False), args.repeat)
+            new, new_result = best_of(lambda: new_pipeline(paragraphs), args.repeat)
+            assert new_result[0] == old_result[0] and new_result[2:] == old_result[2:], "outputs differ"
+            assert [s.text for s in new_result[1]] == [s.text for s in old_result[1]], "sections differ"
+            print(f"{n:>10}{n_changes:>9}{old * 1000:>10.1f}{old_quiet * 1000:>18.1f}{new * 1000:>10.1f}"
+                  f"{old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
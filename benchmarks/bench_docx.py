@@ -0,0 +1,160 @@
+"""
+Parse time and peak memory of .docx text extraction: python-docx's object
+model (what read_docx/parse_trace_matrix used) vs. the streaming reader in
+docx_stream.py.
+
+    python benchmarks/bench_docx.py --sizes 5000 50000 200000
+
+Each size is a synthetic document of that many paragraphs, with a 3-column
+table every 50 paragraphs. Every measurement runs in a fresh process;
+peak MB is how far RSS rose above the post-import baseline while parsing.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+WORDS = (
+    "work order asset maintenance schedule technician inventory calibration audit trail electronic "
+    "signature report dashboard notification escalation approval workflow user role permission"
+).split()
+
+
+def write_document(path, n_paragraphs, seed=0):
+    """
+    python-docx's blank template with a generated body (adding paragraphs
+    through python-docx slows down as the document grows).
+    """
+    import zipfile
+    from xml.sax.saxutils import escape
+
+    import docx
+
+    rng = random.Random(seed)
+    w = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+    def para(text, style=None):
+        ppr = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+        return f"<w:p>{ppr}<w:r><w:t>{escape(text)}</w:t></w:r></w:p>"
+
+    body = []
+    for i in range(n_paragraphs):
+        if i % 200 == 0:
+            body.append(para(f"{i // 200 + 1}. Section", "Heading1"))
+        body.append(para(" ".join(rng.choices(WORDS, k=25))))
+        if i % 50 == 49:
+            rows = "".join(
+                "<w:tr>" + "".join(f"<w:tc>{para(cell)}</w:tc>" for cell in (
+                    f"FR {i}.{r}", " ".join(rng.choices(WORDS, k=12)), f"TS-{i}-{r}"
+                )) + "</w:tr>"
+                for r in range(5)
+            )
+            body.append(f"<w:tbl>{rows}</w:tbl>")
+    document = f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:document {w}><w:body>' \
+               + "".join(body) + "<w:sectPr/></w:body></w:document>"
+
+    template = path + ".template.docx"
+    docx.Document().save(template)
+    with zipfile.ZipFile(template) as src, zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            data = document.encode("utf-8") if item.filename == "word/document.xml" else src.read(item)
+            dst.writestr(item, data)
+    os.remove(template)
+
+
+def parse_python_docx(path):
+    # the old read_docx_paragraphs: resolving each paragraph's style is most of the cost
+    import docx
+
+    doc = docx.Document(path)
+    return [(p.style.name if p.style is not None else "", p.text) for p in doc.paragraphs]
+
+
+def parse_python_docx_text(path):
+    # the old parse_trace_matrix: text only
+    import docx
+
+    return [p.text for p in docx.Document(path).paragraphs]
+
+
+def parse_streaming(path):
+    from docx_stream import iter_lines
+
+    return list(iter_lines(path))
+
+
+def parse_streaming_count(path):
+    # consumed one paragraph at a time, as parse_trace_matrix does
+    from docx_stream import iter_paragraphs
+
+    return sum(1 for _ in iter_paragraphs(path))
+
+
+METHODS = {
+    "python-docx": parse_python_docx,
+    "python-docx (text)": parse_python_docx_text,
+    "stream (lines)": parse_streaming,
+    "stream (iterate)": parse_streaming_count,
+}
+
+
+def measure(method, path):
+    """Runs in the worker process: one parse, timed, with sampled RSS growth over the baseline."""
+    from bench_pipeline import rss_peak
+
+    fn = METHODS[method]
+    if method.startswith("python-docx"):
+        import docx  # noqa: F401  (import cost isn't parse cost)
+    else:
+        import docx_stream  # noqa: F401
+    with rss_peak() as mem:
+        t0 = time.perf_counter()
+        result = fn(path)
+        seconds = time.perf_counter() - t0
+    return {
+        "seconds": seconds,
+        "peak_mb": mem["peak"] / 1e6,
+        "items": result if isinstance(result, int) else len(result),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per method; the fastest is reported")
+    parser.add_argument("--methods", nargs="+", choices=list(METHODS), default=list(METHODS))
+    parser.add_argument("--worker", nargs=2, metavar=("METHOD", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(*args.worker)))
+        return
+
+    print(f"{'paragraphs':>10}{'file MB':>9}  {'method':<20}{'parse s':>9}{'peak MB':>9}{'items':>9}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "large.docx")
+            write_document(path, n)
+            size_mb = os.path.getsize(path) / 1e6
+            for method in args.methods:
+                runs = []
+                for _ in range(args.repeat):
+                    proc = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), "--worker", method, path],
+                        cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE, text=True, check=True
+                    )
+                    runs.append(json.loads(proc.stdout))
+                best = min(runs, key=lambda r: r["seconds"])
+                print(f"{n:>10}{size_mb:>9.1f}  {method:<20}{best['seconds']:>9.2f}"
+                      f"{max(r['peak_mb'] for r in runs):>9.1f}{best['items']:>9}")
+
+
+if __name__ == "__main__":
+    main()
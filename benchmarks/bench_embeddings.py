@@ -0,0 +1,204 @@
+"""
+Retrieval latency and quality of the embedding providers (embedding_providers)
+over the trace matrix, each searched with the same exact numpy index.
+
+    python benchmarks/bench_embeddings.py
+    python benchmarks/bench_embeddings.py --providers hashed:256 hashed:1536 openai --openai
+    python benchmarks/bench_embeddings.py --providers hashed local --model-path glove.6B.300d.txt
+
+The corpus is proprietary_documents/Trace Matrix v8.docx (--requirements N
+uses synthetic ones instead). Queries with a known answer:
+
+- "plan": the change → requirement pairs listed in the test plans under
+  document_to_analyze/ (few, and mostly worded nothing like the requirement)
+- "paraphrase": --paraphrases rewrites of indexed requirements with words
+  dropped, inflections changed and common synonyms swapped
+
+Without --openai, "openai" is benchmarks/fake_openai_server.py: its latency
+is simulated (--embedding-latency per request) and its vectors are a hashed
+bag of words, so only the real API's quality numbers say anything about
+ada-002. --openai calls the real API (OPENAI_API_KEY) and spends tokens.
+"""
+import argparse
+import glob
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import percentile, synthetic_requirements  # noqa: E402
+from document_model import DocumentModel  # noqa: E402
+from embedding_providers import HASHED_EMBEDDING_DIM, open_embedding_provider  # noqa: E402
+from fake_openai_server import FakeOpenAIConfig, FakeOpenAIServer  # noqa: E402
+from vector_store import NumpyVectorStore  # noqa: E402
+
+SYNONYMS = {
+    "ability": "capability", "allow": "permit", "assign": "allocate", "create": "generate",
+    "display": "show", "equipment": "assets", "modify": "change", "multiple": "several",
+    "provide": "offer", "remove": "delete", "required": "mandatory", "review": "inspect",
+    "select": "choose", "shall": "must", "user": "person", "users": "people", "view": "see",
+}
+
+
+def paraphrase(text, rng):
+    """A rewrite sharing meaning but not all of the wording."""
+    words = text.rstrip(".").split()
+    if len(words) > 3 and words[0].lower() == "the" and words[1].lower() == "system":
+        words = words[3:]  # "The system shall/will ..."
+    out = []
+    for word in words:
+        lower = word.lower()
+        if len(words) > 4 and rng.random() < 0.35:
+            continue
+        if lower in SYNONYMS and rng.random() < 0.7:
+            word = SYNONYMS[lower]
+        elif len(lower) > 5 and lower.isalpha() and rng.random() < 0.3:
+            if lower.endswith("ing"):
+                word = word[:-3]
+            elif lower.endswith("e"):
+                word = word[:-1] + "ing"
+            elif lower.endswith("s"):
+                word = word[:-1]
+            else:
+                word = word + "s"
+        out.append(word)
+    return " ".join(out) or text
+
+
+def load_corpus(args):
+    if args.requirements:
+        return synthetic_requirements(args.requirements), []
+    import main  # noqa: E402  (parsed the way the served index parses it)
+
+    requirements = []
+    for req_id, text in main.parse_trace_matrix(args.trace_matrix):
+        if text.strip() and (req_id, text) not in requirements:
+            requirements.append((req_id, text))
+    known = {req_id for req_id, _ in requirements}
+    plan_pairs = []
+    for path in sorted(glob.glob(os.path.join(args.test_plans, "*.docx"))):
+        plan_pairs.extend(
+            (change, req_id) for change, req_id in DocumentModel.from_docx(path).changes if req_id in known
+        )
+    return requirements, plan_pairs
+
+
+def query_sets(requirements, plan_pairs, n_paraphrases, seed=0):
+    """{name: [(query, {acceptable positions})]}; identical texts count as the same answer."""
+    by_text, by_id = {}, {}
+    for pos, (req_id, text) in enumerate(requirements):
+        by_text.setdefault(text, set()).add(pos)
+        by_id.setdefault(req_id, set()).add(pos)
+    rng = random.Random(seed)
+    sources = rng.sample(range(len(requirements)), min(n_paraphrases, len(requirements)))
+    sets = {"paraphrase": [(paraphrase(requirements[pos][1], rng), by_text[requirements[pos][1]])
+                           for pos in sources]}
+    if plan_pairs:
+        sets["plan"] = [(change, by_id[req_id]) for change, req_id in plan_pairs]
+    return sets
+
+
+def bench(provider, requirements, sets, k):
+    texts = [text for _, text in requirements]
+    store = NumpyVectorStore()
+    t0 = time.perf_counter()
+    for start in range(0, len(texts), 256):
+        store.upsert(
+            ids=[str(i) for i in range(start, min(start + 256, len(texts)))],
+            embeddings=provider.embed(texts[start:start + 256]),
+            metadatas=[{"position": i} for i in range(start, min(start + 256, len(texts)))]
+        )
+    ingest = time.perf_counter() - t0
+
+    report = {"ingest_per_s": len(texts) / ingest, "dimensions": store._matrix.shape[1]}
+    latencies = []
+    for name, queries in sets.items():
+        hits_1 = hits_k = 0
+        reciprocal = []
+        for query, expected in queries:
+            t0 = time.perf_counter()
+            ranked = store.query(provider.embed([query]), n_results=10)[0]
+            latencies.append(time.perf_counter() - t0)
+            positions = [m["position"] for m, _ in ranked]
+            hits_1 += positions[0] in expected
+            hits_k += any(p in expected for p in positions[:k])
+            rank = next((r for r, p in enumerate(positions, start=1) if p in expected), None)
+            reciprocal.append(1.0 / rank if rank else 0.0)
+        report[name] = {
+            "recall@1": hits_1 / len(queries), f"recall@{k}": hits_k / len(queries),
+            "mrr@10": statistics.mean(reciprocal), "queries": len(queries),
+        }
+    report["query_p50_ms"] = percentile(latencies, 50) * 1000
+    report["query_p95_ms"] = percentile(latencies, 95) * 1000
+    return report
+
+
+def open_provider(spec, args, client_factory):
+    name, _, option = spec.partition(":")
+    dimensions = int(option) if option else HASHED_EMBEDDING_DIM
+    return open_embedding_provider(name, client_factory=client_factory, model_path=args.model_path,
+                                   dimensions=dimensions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", nargs="+", default=["hashed:256", "hashed:1536", "openai"],
+                        help="openai, hashed[:dimensions] or local (needs --model-path)")
+    parser.add_argument("--model-path", help="word-vector table or sentence-transformers folder for 'local'")
+    parser.add_argument("--openai", action="store_true", help="use the real API instead of the fake server")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="fake API seconds per request")
+    parser.add_argument("--trace-matrix", default=os.path.join(REPO_ROOT, "proprietary_documents",
+                                                               "Trace Matrix v8.docx"))
+    parser.add_argument("--test-plans", default=os.path.join(REPO_ROOT, "document_to_analyze"))
+    parser.add_argument("--requirements", type=int, default=0, help="synthetic corpus of this size instead")
+    parser.add_argument("--paraphrases", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+    args.trace_matrix = os.path.abspath(args.trace_matrix)
+    args.test_plans = os.path.abspath(args.test_plans)
+
+    # importing main creates its folders and caches in the working directory
+    os.chdir(tempfile.mkdtemp(prefix="bench-embeddings-"))
+    requirements, plan_pairs = load_corpus(args)
+    sets = query_sets(requirements, plan_pairs, args.paraphrases)
+    print(f"{len(requirements)} requirements; " + ", ".join(f"{len(q)} {n} queries" for n, q in sets.items()))
+
+    server = None
+    if not args.openai and any(spec.startswith("openai") for spec in args.providers):
+        server = FakeOpenAIServer(FakeOpenAIConfig(embedding_latency=args.embedding_latency, seed=0)).start()
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    def client_factory():
+        from openai import OpenAI
+
+        return OpenAI(max_retries=0)
+
+    header = f"{'provider':<36}{'dim':>6}{'ingest/s':>10}{'p50 ms':>9}{'p95 ms':>9}"
+    for name in sets:
+        header += f"{name + ' R@1':>16}{f'R@{args.k}':>7}{'MRR':>6}"
+    print(header)
+    try:
+        for spec in args.providers:
+            provider = open_provider(spec, args, client_factory)
+            report = bench(provider, requirements, sets, args.k)
+            label = provider.id + (" (fake)" if server and provider.name == "openai" else "")
+            line = (f"{label:<36}{report['dimensions']:>6}{report['ingest_per_s']:>10.0f}"
+                    f"{report['query_p50_ms']:>9.2f}{report['query_p95_ms']:>9.2f}")
+            for name in sets:
+                r = report[name]
+                line += f"{r['recall@1']:>16.2f}{r[f'recall@{args.k}']:>7.2f}{r['mrr@10']:>6.2f}"
+            print(line)
+    finally:
+        if server:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
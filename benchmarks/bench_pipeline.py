@@ -0,0 +1,353 @@
+"""
+End-to-end benchmark of ingest, retrieval and /analyze against a local fake
+OpenAI API (benchmarks/fake_openai_server.py) — no network, no API spend.
+
+    python benchmarks/bench_pipeline.py --sizes 200:5 1000:20 5000:50 --jobs 6
+    python benchmarks/bench_pipeline.py --sizes 1000:20 --rate-limit-rate 0.05 --error-rate 0.02
+
+Each REQUIREMENTS:CHANGES size runs in a fresh process and workspace, with a
+synthetic trace matrix of REQUIREMENTS entries and a test plan listing
+CHANGES changes. Per stage it reports p50/p95 latency, throughput and
+memory (peak RSS growth during the stage, plus the process' max RSS).
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_openai_server import FakeOpenAIConfig, FakeOpenAIServer  # noqa: E402
+
+VOCABULARY = (
+    "work order asset maintenance schedule technician inventory spare part calibration "
+    "audit trail electronic signature report dashboard notification escalation priority "
+    "location meter reading preventive corrective approval workflow user role permission "
+    "login password export import vendor purchase requisition budget cost center label "
+    "barcode scan mobile offline sync history archive retention backup restore"
+).split()
+
+
+# 📄 Synthetic inputs
+def synthetic_requirements(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        (f"FR {i // 10 + 1}.{i % 10 + 1}", "The system shall " + " ".join(rng.sample(VOCABULARY, 8)) + ".")
+        for i in range(n)
+    ]
+
+
+def write_trace_matrix(path, requirements):
+    import docx
+
+    doc = docx.Document()
+    doc.add_paragraph("Trace Matrix", style="Title")
+    for req_id, text in requirements:
+        doc.add_paragraph(req_id)
+        doc.add_paragraph(text)
+    doc.save(path)
+
+
+def write_test_plan(path, requirements, n_changes, seed=0):
+    """A plan shaped like the real ones: front matter, numbered sections, the operational change list."""
+    import docx
+
+    rng = random.Random(seed)
+    doc = docx.Document()
+    doc.add_paragraph("CMMS Operational Test Plan", style="Title")
+    doc.add_paragraph("Document number TP-0001, version 1.0. System: Computerized Maintenance Management System (CMMS).")
+    doc.add_heading("1. Introduction", level=1)
+    doc.add_paragraph("Testing will be performed to validate the following Medium and low risk functional requirements:")
+    for req_id, text in rng.sample(requirements, min(n_changes, len(requirements))):
+        words = text[len("The system shall "):].rstrip(".").split()
+        doc.add_paragraph("Change " + " ".join(rng.sample(words, 5)) + ":")
+        doc.add_paragraph(req_id)
+    doc.add_heading("2. Purpose and Scope", level=1)
+    for heading in ("3. Responsibilities", "4. Test Approach", "5. Acceptance Criteria", "6. Deviations"):
+        doc.add_heading(heading, level=1)
+        for _ in range(max(3, n_changes // 4)):
+            doc.add_paragraph("The CMMS " + " ".join(rng.choices(VOCABULARY, k=30)) + ".")
+    doc.add_heading("7. Approvals", level=1)
+    doc.add_paragraph("Signature: ____________  Date: ________")
+    doc.save(path)
+
+
+# 📏 Measurement helpers
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))]
+
+
+def summarize(latencies, wall=None, peak_bytes=None):
+    wall = wall if wall is not None else sum(latencies)
+    return {
+        "n": len(latencies),
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95_ms": percentile(latencies, 95) * 1000 if latencies else 0.0,
+        "throughput_per_s": len(latencies) / wall if wall else 0.0,
+        "peak_mb": (peak_bytes or 0) / 1e6,  # RSS growth during the stage
+    }
+
+
+def current_rss():
+    """Resident set size in bytes (Linux /proc; elsewhere the max RSS so far)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+@contextlib.contextmanager
+def rss_peak(interval=0.01):
+    """
+    Yields a dict that receives how far RSS rose above its starting value
+    during the block. Sampled on a thread rather than traced, so stage
+    timings stay representative.
+    """
+    out = {}
+    baseline = current_rss()
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(interval):
+            peak[0] = max(peak[0], current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield out
+    finally:
+        done.set()
+        sampler.join()
+        out["peak"] = max(peak[0], current_rss()) - baseline
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1e6 if sys.platform == "darwin" else rss / 1e3  # bytes on macOS, KiB elsewhere
+
+
+def revise_test_plan(path, out_path, seed=0):
+    """The next revision of a plan: one body paragraph reworded, everything else as it was."""
+    import docx
+
+    doc = docx.Document(path)
+    body = [p for p in doc.paragraphs if p.text.startswith("The CMMS ")]
+    random.Random(seed).choice(body).text = "The CMMS " + " ".join(random.Random(seed + 1).choices(VOCABULARY, k=30)) + "."
+    doc.save(out_path)
+
+
+# 🏃 One size, inside a fresh process whose cwd is a scratch workspace
+def run_size(args):
+    requirements = synthetic_requirements(args.requirements)
+    os.makedirs("proprietary_documents", exist_ok=True)
+    write_trace_matrix(os.path.join("proprietary_documents", "Trace Matrix v8.docx"), requirements)
+    write_test_plan("plan.docx", requirements, args.changes)
+
+    config = FakeOpenAIConfig(
+        embedding_latency=args.embedding_latency, run_seconds=args.run_seconds,
+        token_delay=args.token_delay, response_tokens=args.response_tokens,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=0,
+    )
+    report = {"requirements": args.requirements, "changes": args.changes, "stages": {}}
+    with FakeOpenAIServer(config) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+        sys.path.insert(0, REPO_ROOT)
+
+        t0 = time.perf_counter()
+        import main  # noqa: E402  (after the environment points at the fake server)
+        report["import_s"] = time.perf_counter() - t0
+        stages = report["stages"]
+
+        # Ingest: cold (empty index and embedding cache), then unchanged re-syncs
+        with rss_peak() as mem:
+            t0 = time.perf_counter()
+            main.ingest_trace_matrix()
+            cold = time.perf_counter() - t0
+        stages["ingest_cold"] = summarize([cold], peak_bytes=mem["peak"])
+        warm = []
+        for _ in range(5):
+            t0 = time.perf_counter()
+            main.ingest_trace_matrix()
+            warm.append(time.perf_counter() - t0)
+        stages["ingest_warm"] = summarize(warm)
+
+        # Retrieval: one change description per call, then the whole list in one batch
+        rng = random.Random(1)
+        queries = [" ".join(rng.sample(VOCABULARY, 5)) for _ in range(args.queries)]
+        latencies = []
+        with rss_peak() as mem:
+            for q in queries:
+                t0 = time.perf_counter()
+                main.retrieve_relevant_trace_requirements(q)
+                latencies.append(time.perf_counter() - t0)
+        stages["retrieve_single"] = summarize(latencies, peak_bytes=mem["peak"])
+        t0 = time.perf_counter()
+        main.retrieve_relevant_trace_requirements_batch(queries)
+        stages["retrieve_batch"] = summarize([time.perf_counter() - t0])
+
+        # changes quoting a requirement ID or its wording: answered by the BM25 index, no API call
+        quoted = [
+            f"Update {req_id} handling" if n % 2 else f"Change: {text}"
+            for n, (req_id, text) in enumerate(rng.sample(requirements, min(args.queries, len(requirements))))
+        ]
+        latencies = []
+        for q in quoted:
+            t0 = time.perf_counter()
+            main.retrieve_relevant_trace_requirements(q)
+            latencies.append(time.perf_counter() - t0)
+        stages["retrieve_quoted"] = summarize(latencies)
+        report["retrieval"] = main.retrieval_stats()
+
+        # /analyze through the Flask app: upload → queue → poll, sequential then concurrent
+        http = main.app.test_client()
+
+        def submit(path="plan.docx", bypass_cache=True):
+            with open(path, "rb") as f:
+                job_id = http.post("/upload-document", data={"file": (f, path)}).get_json()["job_id"]
+            http.post("/analyze", json={"job_id": job_id, "bypass_cache": bypass_cache})
+            return job_id
+
+        def wait(job_id):
+            while True:
+                job = http.get(f"/jobs/{job_id}").get_json()
+                if job["status"] in ("completed", "failed"):
+                    return job
+                time.sleep(0.02)
+
+        per_stage, e2e, failures, full_tokens = {}, [], 0, None
+        with rss_peak() as mem:
+            for _ in range(args.jobs):
+                t0 = time.perf_counter()
+                job = wait(submit())
+                e2e.append(time.perf_counter() - t0)
+                if job["status"] != "completed":
+                    failures += 1
+                    continue
+                result = http.get(f"/jobs/{job['job_id']}/result").get_json()
+                full_tokens = result["tokens_used"]
+                for name, seconds in result["stage_timings"].items():
+                    per_stage.setdefault(name, []).append(seconds)
+        stages["analyze_e2e"] = {**summarize(e2e, peak_bytes=mem["peak"]), "failed": failures}
+        for name, samples in sorted(per_stage.items()):
+            stages[f"analyze.{name}"] = summarize(samples)
+
+        # all jobs at once: latency is per job, throughput is jobs / total wall time
+        with rss_peak() as mem:
+            t0 = time.perf_counter()
+            pending = {submit(): t0 for _ in range(args.jobs)}
+            latencies, failures = [], 0
+            while pending:
+                for job_id in list(pending):
+                    job = http.get(f"/jobs/{job_id}").get_json()
+                    if job["status"] in ("completed", "failed"):
+                        latencies.append(time.perf_counter() - pending.pop(job_id))
+                        failures += job["status"] != "completed"
+                time.sleep(0.02)
+            wall = time.perf_counter() - t0
+        stages["analyze_concurrent"] = {**summarize(latencies, wall=wall, peak_bytes=mem["peak"]), "failed": failures}
+
+        # the next revision of the plan (one paragraph reworded): only the checks and lookups it touches re-run
+        revise_test_plan("plan.docx", "plan_revised.docx")
+        t0 = time.perf_counter()
+        job = wait(submit("plan_revised.docx", bypass_cache=False))
+        stages["analyze_revision"] = {**summarize([time.perf_counter() - t0]), "failed": int(job["status"] != "completed")}
+        if job["status"] == "completed":
+            result = http.get(f"/jobs/{job['job_id']}/result").get_json()
+            report["revision"] = {"tokens_used": result["tokens_used"], "full_tokens_used": full_tokens,
+                                  **result["incremental"]}
+
+        report["fake_api"] = server.counters
+    report["max_rss_mb"] = max_rss_mb()
+    return report
+
+
+def print_report(report):
+    print(f"\n📊 {report['requirements']} requirements, {report['changes']} changes "
+          f"(import {report['import_s']:.2f}s, max RSS {report['max_rss_mb']:.0f} MB)")
+    print(f"  {'stage':<22}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'per s':>9}{'peak MB':>9}{'failed':>8}")
+    for name, s in report["stages"].items():
+        print(f"  {name:<22}{s['n']:>5}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+              f"{s['throughput_per_s']:>9.2f}{s['peak_mb']:>9.1f}{s.get('failed', ''):>8}")
+    print(f"  retrieval: {report['retrieval']}")
+    if "revision" in report:
+        print(f"  revision: {report['revision']}")
+    print(f"  fake API: {report['fake_api']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["200:5", "1000:20", "5000:50"],
+                        help="REQUIREMENTS:CHANGES pairs, run in order")
+    parser.add_argument("--jobs", type=int, default=5, help="analyses per size (sequential and concurrent)")
+    parser.add_argument("--queries", type=int, default=50, help="single retrieval calls per size")
+    parser.add_argument("--backend", default=os.getenv("VECTOR_BACKEND", "chroma"))
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--run-seconds", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    parser.add_argument("--response-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--json", metavar="PATH", help="also write the raw reports to PATH")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own output")
+    parser.add_argument("--requirements", type=int, help=argparse.SUPPRESS)  # set in worker processes
+    parser.add_argument("--changes", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.requirements is not None:
+        # worker: app output goes to stderr, the report is the only thing on stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run_size(args)
+        print(json.dumps(report))
+        return
+
+    passthrough = [
+        "--jobs", str(args.jobs), "--queries", str(args.queries),
+        "--embedding-latency", str(args.embedding_latency), "--run-seconds", str(args.run_seconds),
+        "--token-delay", str(args.token_delay), "--response-tokens", str(args.response_tokens),
+        "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+    ]
+    # client-side budgets are off unless set (e.g. ASSISTANT_TPM) in the environment
+    env = {**os.environ, "VECTOR_BACKEND": args.backend}
+    env.pop("OPENAI_BASE_URL", None)
+    reports = []
+    for size in args.sizes:
+        n_requirements, n_changes = (int(x) for x in size.split(":"))
+        workspace = tempfile.mkdtemp(prefix="bench-pipeline-")
+        try:
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--requirements", str(n_requirements),
+                 "--changes", str(n_changes), *passthrough],
+                cwd=workspace, env=env, stdout=subprocess.PIPE,
+                stderr=None if args.verbose else subprocess.DEVNULL, text=True,
+            )
+        finally:
+            shutil.rmtree(workspace, ignore_errors=True)
+        if proc.returncode != 0:
+            print(f"❌ {size} failed (exit {proc.returncode}); re-run with --verbose")
+            continue
+        report = json.loads(proc.stdout.strip().splitlines()[-1])
+        reports.append(report)
+        print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
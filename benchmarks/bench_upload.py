@@ -0,0 +1,210 @@
+"""
+upload_trace_matrix.upload_to_pinecone against a local stand-in for the
+Pinecone index (fake_pinecone_index.py) and the fake OpenAI API — no
+network, no API spend.
+
+    python benchmarks/bench_upload.py --requirements 2000 --embedding-latency 0.1 --upsert-latency 0.02
+
+Every scenario runs in its own process over one shared workspace (index
+file, upload checkpoint), in this order:
+
+- serial: the old embed-everything-then-upsert loop, into its own index
+- cold: the pipelined upload into an empty index
+- crash + resume: an upload killed after --crash-after upserts, then re-run
+- rerun: nothing changed (answered from the checkpoint)
+- lost_checkpoint: checkpoint deleted (answered by the index's fetch)
+- edit: --edit-ratio of the requirements reworded (re-embedded, old vectors pruned)
+- flaky: an empty index failing --error-rate of its upserts
+
+Each row reports wall time, peak RSS growth, embedding requests and what
+the upload did, plus whether the index ended up holding exactly one vector
+per current requirement. The run then checks that the crashed upload
+resumed from its checkpoint, that re-runs skip what the index already
+holds, and that every process derived the same vector IDs; it exits with
+status 1 if any of that doesn't hold.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import rss_peak, synthetic_requirements  # noqa: E402
+from fake_openai_server import FakeOpenAIConfig, FakeOpenAIServer  # noqa: E402
+from fake_pinecone_index import FakePineconeIndex  # noqa: E402
+
+
+# 🐢 What upload_to_pinecone did before the pipeline (positional IDs, everything held in memory)
+def _serial_upload(requirements, store, embedder, batch_size=50):
+    from embeddings import iter_batches
+
+    vectors = []
+    texts = [text for _, text in requirements]
+    for start, end in iter_batches(texts):
+        for i, embedding in enumerate(embedder.embed(texts[start:end]), start=start):
+            req_id, text = requirements[i]
+            vectors.append((f"req_{i}", embedding, {"requirement_id": req_id, "text": text}))
+    for i in range(0, len(vectors), batch_size):
+        ids, embeddings, metadatas = zip(*vectors[i:i + batch_size])
+        store.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas)
+    return {"embedded": len(vectors), "uploaded": len(vectors)}
+
+
+# 🏃 One scenario, inside a process whose cwd is the shared workspace
+def run_scenario(args):
+    with open("requirements.json", "r", encoding="utf-8") as f:
+        requirements = [tuple(r) for r in json.load(f)]
+    config = FakeOpenAIConfig(embedding_latency=args.embedding_latency, seed=0)
+    with FakeOpenAIServer(config) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+        sys.path.insert(0, REPO_ROOT)
+        import upload_trace_matrix as upload  # noqa: E402  (after the environment points at the fake server)
+        from embedding_providers import open_embedding_provider
+        from openai import OpenAI
+        from vector_store import PineconeVectorStore
+
+        # no embedding cache: every skipped requirement must be skipped by the upload itself
+        embedder = open_embedding_provider("openai", client_factory=lambda: OpenAI(max_retries=0))
+        index = FakePineconeIndex(args.index, upsert_latency=args.upsert_latency, error_rate=args.error_rate,
+                                  crash_after_upserts=args.crash_after or None, seed=0)
+        store = PineconeVectorStore(index, batch_size=50)
+        with rss_peak() as mem:
+            t0 = time.perf_counter()
+            if args.scenario == "serial":
+                summary = _serial_upload(requirements, store, embedder)
+            else:
+                checkpoint = upload.UploadCheckpoint("checkpoint.jsonl", f"fake:{args.index}:{embedder.id}")
+                summary = upload.upload_to_pinecone(requirements, store, embedder=embedder, checkpoint=checkpoint)
+            wall = time.perf_counter() - t0
+        expected = {upload.vector_id(r, t, embedder.id) for r, t in requirements}
+        return {
+            **summary, "wall_s": wall, "peak_mb": mem["peak"] / 1e6,
+            "embedding_requests": server.counters["embeddings"], "upserts": index.counters["upserts"],
+            "upsert_errors": index.counters["errors"], "vectors": len(index.vector_ids()),
+            "consistent": args.scenario == "serial" or index.vector_ids() == expected,
+            "ids_digest": hashlib.sha256("\n".join(sorted(index.vector_ids())).encode("utf-8")).hexdigest(),
+        }
+
+
+# ✔️ What the scenarios must show, as (description, holds) pairs
+def checks(reports, requirements, edited):
+    n = len(requirements)
+    changed = sum(1 for old, new in zip(requirements, edited) if old != new)
+    cold, crash, resume = reports["cold"], reports["crash"], reports["resume"]
+    rerun, lost, edit = reports["rerun"], reports["lost_checkpoint"], reports["edit"]
+    return [
+        ("crash: the upload was killed mid-way", crash.get("exit") == 137),
+        ("resume: starts from the checkpoint", resume.get("checkpointed", 0) > 0),
+        ("resume: only embeds what the crashed run didn't upload",
+         resume.get("checkpointed", 0) + resume.get("already_indexed", 0) + resume.get("embedded", 0) == n
+         and resume.get("embedded", n) < n),
+        ("resume: index holds exactly the current requirements", resume.get("consistent") is True),
+        ("rerun: everything skipped by the checkpoint, nothing embedded",
+         rerun.get("checkpointed") == n and rerun.get("embedding_requests") == 0 and rerun.get("upserts") == 0),
+        ("lost_checkpoint: everything found in the index, nothing embedded",
+         lost.get("already_indexed") == n and lost.get("embedded") == 0 and lost.get("upserts") == 0),
+        ("edit: only reworded requirements embedded, their old vectors pruned",
+         edit.get("embedded") == changed and edit.get("pruned") == changed and edit.get("consistent") is True),
+        ("IDs are deterministic: resumed and re-run indexes match the cold one",
+         cold.get("ids_digest") is not None
+         and cold.get("ids_digest") == resume.get("ids_digest") == rerun.get("ids_digest")),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requirements", type=int, default=2000)
+    parser.add_argument("--embedding-latency", type=float, default=0.1)
+    parser.add_argument("--upsert-latency", type=float, default=0.02)
+    parser.add_argument("--crash-after", type=int, default=15, help="upserts before the simulated crash")
+    parser.add_argument("--edit-ratio", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.2, help="upsert failure rate for 'flaky'")
+    parser.add_argument("--verbose", action="store_true", help="show the upload's own output")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)  # set in worker processes
+    parser.add_argument("--index", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        # worker: upload output goes to stderr, the report is the only thing on stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run_scenario(args)
+        print(json.dumps(report))
+        return
+
+    workspace = tempfile.mkdtemp(prefix="bench-upload-")
+    requirements = synthetic_requirements(args.requirements)
+    # budgets off: measure the pipeline, not the client-side rate limits
+    env = {**os.environ, "EMBEDDINGS_RPM": "0", "EMBEDDINGS_TPM": "0"}
+    env.pop("OPENAI_BASE_URL", None)
+
+    def write_requirements(reqs):
+        with open(os.path.join(workspace, "requirements.json"), "w", encoding="utf-8") as f:
+            json.dump(reqs, f)
+
+    def run(scenario, index="index.pkl", crash_after=0, error_rate=0.0):
+        cmd = [sys.executable, os.path.abspath(__file__), "--scenario", scenario, "--index", index,
+               "--embedding-latency", str(args.embedding_latency), "--upsert-latency", str(args.upsert_latency),
+               "--error-rate", str(error_rate), "--crash-after", str(crash_after)]
+        proc = subprocess.run(cmd, cwd=workspace, env=env, stdout=subprocess.PIPE,
+                              stderr=None if args.verbose else subprocess.DEVNULL, text=True)
+        if proc.returncode:
+            return {"exit": proc.returncode}
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+    print(f"{args.requirements} requirements, embeddings {args.embedding_latency * 1000:.0f} ms/request, "
+          f"upserts {args.upsert_latency * 1000:.0f} ms/batch")
+    print(f"{'scenario':<16}{'wall s':>8}{'peak MB':>9}{'emb reqs':>9}{'embedded':>9}{'uploaded':>9}"
+          f"{'skipped':>9}{'pruned':>8}{'retried':>8}{'failed':>7}{'vectors':>9}  consistent")
+    reports = {}
+    rng = random.Random(1)
+    edited = list(requirements)
+    for i in rng.sample(range(len(edited)), max(1, int(len(edited) * args.edit_ratio))):
+        edited[i] = (edited[i][0], edited[i][1].replace("The system shall", "The system must"))
+    try:
+        write_requirements(requirements)
+        steps = [
+            ("serial", {"index": "serial.pkl"}, None),
+            ("cold", {"index": "cold.pkl"}, None),
+            ("crash", {"crash_after": args.crash_after}, None),
+            ("resume", {}, None),
+            ("rerun", {}, None),
+            ("lost_checkpoint", {}, "checkpoint.jsonl"),
+            ("edit", {}, None),
+            ("flaky", {"index": "flaky.pkl", "error_rate": args.error_rate}, None),
+        ]
+        for name, options, remove in steps:
+            if remove:
+                os.remove(os.path.join(workspace, remove))
+            if name == "edit":
+                write_requirements(edited)
+            r = reports[name] = run(name, **options)
+            if "exit" in r:
+                print(f"{name:<16}{'killed (exit ' + str(r['exit']) + ')':>34}")
+                continue
+            skipped = r.get("checkpointed", 0) + r.get("already_indexed", 0)
+            print(f"{name:<16}{r['wall_s']:>8.2f}{r['peak_mb']:>9.1f}{r['embedding_requests']:>9}"
+                  f"{r['embedded']:>9}{r['uploaded']:>9}{skipped:>9}{r.get('pruned', 0):>8}{r['upsert_errors']:>8}"
+                  f"{len(r.get('failed', [])):>7}{r['vectors']:>9}  {r['consistent']}")
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    failed = 0
+    for description, holds in checks(reports, requirements, edited):
+        print(f"{'✅' if holds else '❌'} {description}")
+        failed += not holds
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
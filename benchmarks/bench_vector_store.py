@@ -0,0 +1,115 @@
+"""
+Query latency and recall@k of the vector-store backends on synthetic data.
+
+    python benchmarks/bench_vector_store.py --sizes 1000 5000 --dim 1536
+
+Ground truth is exact cosine top-k in float64. Pinecone is included only
+when PINECONE_API_KEY and --pinecone are given (it writes to PINECONE_INDEX
+under a throwaway namespace).
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import NumpyVectorStore, open_vector_store  # noqa: E402
+
+
+def synthetic(n, dim, n_queries, seed=0):
+    """Clustered unit vectors, roughly like requirement embeddings."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(8, n // 50), dim))
+    data = centres[rng.integers(0, len(centres), n)] + 0.35 * rng.normal(size=(n, dim))
+    queries = data[rng.integers(0, n, n_queries)] + 0.25 * rng.normal(size=(n_queries, dim))
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return data.astype(np.float32), queries.astype(np.float32)
+
+
+def exact_top_k(data, queries, k):
+    sims = queries.astype(np.float64) @ data.astype(np.float64).T
+    return [set(np.argsort(-row)[:k]) for row in sims]
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))]
+
+
+def bench(store, data, queries, truth, k):
+    ids = [f"r{i}" for i in range(len(data))]
+    metadatas = [{"requirement_id": f"r{i}", "text": ""} for i in range(len(data))]
+    start = time.perf_counter()
+    for s in range(0, len(ids), 256):
+        store.upsert(ids=ids[s:s + 256], embeddings=data[s:s + 256], metadatas=metadatas[s:s + 256])
+    build = time.perf_counter() - start
+
+    return {**bench_queries(store, queries, truth, k), "build_s": build}
+
+
+def bench_queries(store, queries, truth, k):
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        result = store.query([query], n_results=k)[0]
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += len({int(m["requirement_id"][1:]) for m, _ in result} & expected)
+
+    t0 = time.perf_counter()
+    store.query(list(queries), n_results=k)
+    batch_ms = (time.perf_counter() - t0) * 1000
+
+    return {
+        "build_s": 0.0,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": percentile(latencies, 95),
+        "batch_ms": batch_ms,
+        "recall": hits / (k * len(queries)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--pinecone", action="store_true", help="also benchmark Pinecone (network, costs money)")
+    args = parser.parse_args()
+
+    print(f"{'backend':<14}{'N':>7}{'build s':>10}{'p50 ms':>9}{'p95 ms':>9}{'batch ms':>10}{'recall@' + str(args.k):>11}")
+    for n in args.sizes:
+        data, queries = synthetic(n, args.dim, args.queries)
+        truth = exact_top_k(data, queries, args.k)
+        with tempfile.TemporaryDirectory() as tmp:
+            stores = [
+                ("numpy", NumpyVectorStore()),
+                ("numpy-mmap", None),
+                ("chroma", open_vector_store("chroma", path=os.path.join(tmp, "chroma"))),
+            ]
+            if args.pinecone and os.getenv("PINECONE_API_KEY"):
+                stores.append(("pinecone", open_vector_store("pinecone", namespace=f"bench-{uuid.uuid4().hex[:8]}")))
+
+            for name, store in stores:
+                if name == "numpy-mmap":
+                    # build on disk, then re-open memory-mapped the way the app does after a restart
+                    bench(NumpyVectorStore(os.path.join(tmp, "np")), data, queries, truth, args.k)
+                    store = NumpyVectorStore(os.path.join(tmp, "np"), mmap=True)
+                    r = bench_queries(store, queries, truth, args.k)
+                else:
+                    r = bench(store, data, queries, truth, args.k)
+                print(f"{name:<14}{n:>7}{r['build_s']:>10.2f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+                      f"{r['batch_ms']:>10.1f}{r['recall']:>11.3f}")
+                if name == "pinecone":
+                    store.delete(store.ids())
+
+
+if __name__ == "__main__":
+    main()
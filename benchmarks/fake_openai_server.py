@@ -0,0 +1,371 @@
+"""
+Local stand-in for the parts of the OpenAI API this app uses: embeddings and
+the Assistants threads / runs / messages endpoints (polling and streaming).
+
+    python benchmarks/fake_openai_server.py --port 8765 --run-seconds 2 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake python main.py
+
+Latency, error rate and 429 rate are configurable so retry/backoff paths can
+be exercised without network access or API spend.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+
+EMBEDDING_DIM = 1536
+
+
+class FakeOpenAIConfig:
+    def __init__(self, embedding_latency=0.05, run_seconds=1.0, token_delay=0.005,
+                 response_tokens=200, error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, seed=None,
+                 prompt_cache=True):
+        self.embedding_latency = embedding_latency  # seconds per embeddings request
+        self.run_seconds = run_seconds              # queue + "thinking" time per assistant run
+        self.token_delay = token_delay              # seconds between streamed tokens
+        self.response_tokens = response_tokens      # approximate length of each assistant reply
+        self.error_rate = error_rate                # fraction of requests answered with HTTP 500
+        self.rate_limit_rate = rate_limit_rate      # fraction of requests answered with HTTP 429
+        self.retry_after = retry_after
+        self.prompt_cache = prompt_cache            # report cached_tokens for repeated first messages
+        self.random = random.Random(seed)
+
+
+def fake_embedding(text, dim=EMBEDDING_DIM):
+    """Deterministic hashed bag-of-words vector, so similar texts land close together."""
+    vec = np.zeros(dim, dtype=np.float32)
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+        vec[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    vec[0] += 1e-3
+    return vec / np.linalg.norm(vec)
+
+
+class FakeOpenAIState:
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.threads = {}  # thread_id -> list of messages
+        self.runs = {}     # run_id -> dict
+        self.prefixes = {}  # hash of (assistant, first message) -> time its prefill finished
+        self.counters = {"embeddings": 0, "embedded_texts": 0, "runs": 0, "polls": 0, "errors": 0, "rate_limited": 0,
+                         "cached_prompt_tokens": 0}
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+
+def _now():
+    return int(time.time())
+
+
+def _reply_text(prompt, n_tokens):
+    first_line = next((line.strip() for line in prompt.splitlines() if line.strip()), "Findings")
+    words = ["Issue:", "placeholder", "finding", "for", "the", "reviewed", "section.", "Correction:", "align", "wording."]
+    body = " ".join(words[i % len(words)] for i in range(max(1, n_tokens - 8)))
+    return f"### {first_line[:60]}\n{body}"
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "FakeOpenAI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):  # keep benchmark output clean
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    # 🔧 helpers
+    def _json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _injected_failure(self):
+        cfg = self.state.config
+        roll = cfg.random.random()
+        if roll < cfg.rate_limit_rate:
+            self.state.count("rate_limited")
+            self._json(429, {"error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}},
+                       {"Retry-After": f"{cfg.retry_after:g}", "x-ratelimit-reset-requests": f"{cfg.retry_after:g}s"})
+            return True
+        if roll < cfg.rate_limit_rate + cfg.error_rate:
+            self.state.count("errors")
+            self._json(500, {"error": {"message": "Injected server error (fake)", "type": "server_error"}})
+            return True
+        return False
+
+    def _run_object(self, run):
+        elapsed = time.time() - run["created"]
+        if run["status"] in ("cancelled", "failed"):
+            status = run["status"]
+        elif elapsed >= self.state.config.run_seconds:
+            status = "completed"
+        else:
+            status = "in_progress" if elapsed > self.state.config.run_seconds / 4 else "queued"
+        if status == "completed" and not run["replied"]:
+            self._add_reply(run)
+        completed = status == "completed"
+        return {
+            "id": run["id"], "object": "thread.run", "created_at": int(run["created"]),
+            "assistant_id": run["assistant_id"], "thread_id": run["thread_id"], "status": status,
+            "model": "gpt-4o", "instructions": "", "tools": [], "metadata": {},
+            "parallel_tool_calls": True, "last_error": None,
+            "started_at": int(run["created"]), "completed_at": _now() if completed else None,
+            "usage": {
+                "prompt_tokens": run["prompt_tokens"],
+                "completion_tokens": run["completion_tokens"],
+                "total_tokens": run["prompt_tokens"] + run["completion_tokens"],
+                "prompt_tokens_details": {"cached_tokens": run["cached_tokens"]},
+            } if completed else None,
+        }
+
+    def _add_reply(self, run):
+        with self.state.lock:
+            run["replied"] = True
+            self.state.threads[run["thread_id"]].append(self._message(run["thread_id"], "assistant", run["reply"]))
+
+    @staticmethod
+    def _message(thread_id, role, text):
+        return {
+            "id": f"msg_{uuid.uuid4().hex[:24]}", "object": "thread.message", "created_at": _now(),
+            "thread_id": thread_id, "role": role, "status": "completed", "metadata": {}, "attachments": [],
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+        }
+
+    def _new_run(self, thread_id, assistant_id):
+        prompt = "\n".join(
+            part["text"]["value"]
+            for m in self.state.threads[thread_id] for part in m["content"]
+        )
+        reply = _reply_text(prompt, self.state.config.response_tokens)
+        run = {
+            "id": f"run_{uuid.uuid4().hex[:24]}", "thread_id": thread_id, "assistant_id": assistant_id,
+            "created": time.time(), "status": "queued", "replied": False, "reply": reply,
+            "prompt_tokens": len(prompt) // 4 + 1, "completion_tokens": len(reply) // 4 + 1,
+            "cached_tokens": self._cached_tokens(thread_id, assistant_id),
+        }
+        with self.state.lock:
+            self.state.runs[run["id"]] = run
+        self.state.count("runs")
+        self.state.count("cached_prompt_tokens", run["cached_tokens"])
+        return run
+
+    def _cached_tokens(self, thread_id, assistant_id):
+        """
+        Mimics provider prompt caching: a first message of 1024+ tokens is
+        served from cache (in 128-token steps) once an earlier run with the
+        same assistant and first message has finished its prefill.
+        """
+        messages = self.state.threads[thread_id]
+        if not self.state.config.prompt_cache or not messages:
+            return 0
+        first = messages[0]["content"][0]["text"]["value"]
+        tokens = len(first) // 4 + 1
+        if tokens < 1024:
+            return 0
+        key = hashlib.sha256(f"{assistant_id}\0{first}".encode("utf-8")).hexdigest()
+        now = time.time()
+        with self.state.lock:
+            ready = self.state.prefixes.get(key)
+            self.state.prefixes[key] = min(ready or float("inf"), now + self.state.config.run_seconds)
+        return tokens // 128 * 128 if ready is not None and ready <= now else 0
+
+    def _new_thread(self, messages=()):
+        thread_id = f"thread_{uuid.uuid4().hex[:24]}"
+        with self.state.lock:
+            self.state.threads[thread_id] = [
+                self._message(thread_id, m.get("role", "user"), m["content"] if isinstance(m["content"], str)
+                              else " ".join(p.get("text", "") for p in m["content"]))
+                for m in messages
+            ]
+        return thread_id
+
+    def _stream_run(self, run):
+        """Server-sent events in the Assistants streaming format."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(event, data):
+            payload = data if isinstance(data, str) else json.dumps(data)
+            self.wfile.write(f"event: {event}\ndata: {payload}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        cfg = self.state.config
+        send("thread.run.created", self._run_object(run))
+        time.sleep(cfg.run_seconds)
+        msg_id = f"msg_{uuid.uuid4().hex[:24]}"
+        for i, token in enumerate(re.findall(r"\S+\s*", run["reply"])):
+            send("thread.message.delta", {
+                "id": msg_id, "object": "thread.message.delta",
+                "delta": {"content": [{"index": 0, "type": "text", "text": {"value": token, "annotations": []}}]},
+            })
+            if cfg.token_delay:
+                time.sleep(cfg.token_delay)
+        run["created"] = time.time() - cfg.run_seconds  # now complete for any poller
+        send("thread.run.completed", self._run_object(run))
+        send("done", "[DONE]")
+
+    # 🌐 routing
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if self._injected_failure():
+            return
+        m = re.fullmatch(r"/v1/threads/([^/]+)/runs/([^/]+)", path)
+        if m:
+            run = self.state.runs.get(m.group(2))
+            if run is None:
+                return self._json(404, {"error": {"message": "No such run"}})
+            self.state.count("polls")
+            return self._json(200, self._run_object(run))
+        m = re.fullmatch(r"/v1/threads/([^/]+)/messages", path)
+        if m:
+            messages = list(reversed(self.state.threads.get(m.group(1), [])))  # newest first, like the API
+            return self._json(200, {"object": "list", "data": messages, "has_more": False,
+                                    "first_id": messages[0]["id"] if messages else None,
+                                    "last_id": messages[-1]["id"] if messages else None})
+        if path == "/stats":
+            return self._json(200, self.state.counters)
+        self._json(404, {"error": {"message": f"Unknown path {path}"}})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        if self._injected_failure():
+            return
+
+        if path == "/v1/embeddings":
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            time.sleep(self.state.config.embedding_latency)
+            self.state.count("embeddings")
+            self.state.count("embedded_texts", len(inputs))
+            b64 = body.get("encoding_format") == "base64"
+            data = []
+            for i, text in enumerate(inputs):
+                vec = fake_embedding(text)
+                data.append({"object": "embedding", "index": i,
+                             "embedding": base64.b64encode(vec.tobytes()).decode() if b64 else vec.tolist()})
+            tokens = sum(len(t) // 4 + 1 for t in inputs)
+            return self._json(200, {"object": "list", "data": data, "model": body.get("model"),
+                                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+        if path == "/v1/threads":
+            thread_id = self._new_thread(body.get("messages", []))
+            return self._json(200, {"id": thread_id, "object": "thread", "created_at": _now(), "metadata": {}})
+
+        if path == "/v1/threads/runs":  # create_and_run
+            thread_id = self._new_thread(body.get("thread", {}).get("messages", []))
+            run = self._new_run(thread_id, body["assistant_id"])
+            if body.get("stream"):
+                return self._stream_run(run)
+            return self._json(200, self._run_object(run))
+
+        m = re.fullmatch(r"/v1/threads/([^/]+)/messages", path)
+        if m:
+            msg = self._message(m.group(1), body.get("role", "user"), body["content"])
+            with self.state.lock:
+                self.state.threads.setdefault(m.group(1), []).append(msg)
+            return self._json(200, msg)
+
+        m = re.fullmatch(r"/v1/threads/([^/]+)/runs", path)
+        if m:
+            run = self._new_run(m.group(1), body["assistant_id"])
+            if body.get("stream"):
+                return self._stream_run(run)
+            return self._json(200, self._run_object(run))
+
+        m = re.fullmatch(r"/v1/threads/([^/]+)/runs/([^/]+)/cancel", path)
+        if m:
+            run = self.state.runs.get(m.group(2))
+            if run is None:
+                return self._json(404, {"error": {"message": "No such run"}})
+            run["status"] = "cancelled"
+            return self._json(200, self._run_object(run))
+
+        self._json(404, {"error": {"message": f"Unknown path {path}"}})
+
+
+class FakeOpenAIServer:
+    """Runs the fake API on a background thread; use as a context manager."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = FakeOpenAIState(config or FakeOpenAIConfig())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def counters(self):
+        return dict(self.httpd.state.counters)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--run-seconds", type=float, default=1.0)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--response-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(args.embedding_latency, args.run_seconds, args.token_delay,
+                              args.response_tokens, args.error_rate, args.rate_limit_rate, args.retry_after)
+    server = FakeOpenAIServer(config, args.host, args.port)
+    print(f"🧪 Fake OpenAI API listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Local stand-in for the parts of a Pinecone index that PineconeVectorStore
+uses (upsert / fetch / delete / query / list / describe_index_stats), kept in
+an append-only operation log so it outlives the process writing to it.
+
+    from vector_store import PineconeVectorStore
+    store = PineconeVectorStore(FakePineconeIndex("index.pkl", upsert_latency=0.02))
+
+Latency, a failure rate for upserts and a simulated crash (the process is
+killed right after the Nth upsert is stored) are configurable, so retry and
+resume paths can be exercised without a Pinecone account.
+"""
+import os
+import pickle
+import random
+import threading
+import time
+
+import numpy as np
+
+
+class FakePineconeIndex:
+    def __init__(self, path, upsert_latency=0.0, fetch_latency=0.0, error_rate=0.0, crash_after_upserts=None,
+                 seed=None):
+        self.path = path
+        self.upsert_latency = upsert_latency
+        self.fetch_latency = fetch_latency
+        self.error_rate = error_rate                    # fraction of upserts answered with an error
+        self.crash_after_upserts = crash_after_upserts  # os._exit(137) once this many upserts are stored
+        self.random = random.Random(seed)
+        self.counters = {"upserts": 0, "upserted_vectors": 0, "fetches": 0, "deletes": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._namespaces = {}  # namespace -> {id: (values, metadata)}
+        if os.path.exists(path):
+            self._replay()
+
+    def _replay(self):
+        with open(self.path, "rb") as f:
+            while True:
+                try:
+                    op, namespace, payload = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    break  # end of log, or a record cut short by a crash
+                records = self._namespaces.setdefault(namespace, {})
+                if op == "upsert":
+                    records.update(payload)
+                else:
+                    for i in payload:
+                        records.pop(i, None)
+
+    def _log(self, op, namespace, payload):
+        # an acknowledged write is durable, as with the real service
+        with open(self.path, "ab") as f:
+            pickle.dump((op, namespace, payload), f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def upsert(self, vectors, namespace=""):
+        time.sleep(self.upsert_latency)
+        with self._lock:
+            if self.random.random() < self.error_rate:
+                self.counters["errors"] += 1
+                raise RuntimeError("503 Service Unavailable (simulated)")
+            batch = {v["id"]: (np.asarray(v["values"], dtype=np.float32), v.get("metadata", {})) for v in vectors}
+            self._log("upsert", namespace, batch)
+            self._namespaces.setdefault(namespace, {}).update(batch)
+            self.counters["upserts"] += 1
+            self.counters["upserted_vectors"] += len(vectors)
+            if self.crash_after_upserts is not None and self.counters["upserts"] >= self.crash_after_upserts:
+                os._exit(137)
+        return {"upserted_count": len(vectors)}
+
+    def fetch(self, ids, namespace=""):
+        time.sleep(self.fetch_latency)
+        with self._lock:
+            self.counters["fetches"] += 1
+            records = self._namespaces.get(namespace, {})
+            return {"vectors": {
+                i: {"id": i, "values": records[i][0].tolist(), "metadata": records[i][1]}
+                for i in ids if i in records
+            }, "namespace": namespace}
+
+    def delete(self, ids, namespace=""):
+        with self._lock:
+            self.counters["deletes"] += 1
+            self._log("delete", namespace, list(ids))
+            records = self._namespaces.get(namespace, {})
+            for i in ids:
+                records.pop(i, None)
+
+    def query(self, vector, top_k, include_metadata=True, namespace=""):
+        with self._lock:
+            records = list(self._namespaces.get(namespace, {}).items())
+        if not records:
+            return {"matches": []}
+        matrix = np.stack([values for _, (values, _) in records])
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ (query / max(np.linalg.norm(query), 1e-12))
+        top = np.argsort(-scores)[:top_k]
+        return {"matches": [
+            {"id": records[i][0], "score": float(scores[i]),
+             "metadata": records[i][1][1] if include_metadata else None}
+            for i in top
+        ]}
+
+    def list(self, namespace="", limit=100):
+        with self._lock:
+            ids = sorted(self._namespaces.get(namespace, {}))
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def describe_index_stats(self):
+        with self._lock:
+            namespaces = {ns: {"vector_count": len(records)} for ns, records in self._namespaces.items()}
+        return {"namespaces": namespaces, "total_vector_count": sum(n["vector_count"] for n in namespaces.values())}
+
+    def vector_ids(self, namespace=""):
+        with self._lock:
+            return set(self._namespaces.get(namespace, {}))
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import threading
+
+
+class ParsedDocumentCache:
+    """
+    Keeps the extracted text of reference documents in memory.
+    An entry is reused while the file's mtime and size are unchanged; if they
+    moved but the content hash is the same (e.g. a re-upload of the same
+    file) the text is kept and only the stat is refreshed.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # path -> (mtime_ns, size, sha256, text)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_hash(path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get(self, path):
+        """Returns the parsed text of `path`, parsing only when the file changed."""
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            with self._lock:
+                self.hits += 1
+            return entry[3]
+
+        file_hash = self._file_hash(path)
+        if entry and entry[2] == file_hash:
+            with self._lock:
+                self._entries[path] = (st.st_mtime_ns, st.st_size, file_hash, entry[3])
+                self.hits += 1
+            return entry[3]
+
+        text = self.reader(path)
+        with self._lock:
+            self._entries[path] = (st.st_mtime_ns, st.st_size, file_hash, text)
+            self.misses += 1
+        return text
+
+    def put(self, path):
+        """Parses `path` now (e.g. right after upload) so the next request is a hit."""
+        self.evict(path)
+        return self.get(path)
+
+    def evict(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def warm(self, folder, suffix=".docx"):
+        """Pre-parses every matching file in `folder`; returns how many were loaded."""
+        count = 0
+        for file in sorted(os.listdir(folder)):
+            if file.endswith(suffix):
+                self.get(os.path.join(folder, file))
+                count += 1
+        return count
+
+    def fingerprint(self, paths):
+        """Order-independent content hash over `paths`, i.e. a corpus version."""
+        digest = hashlib.sha256()
+        for path in sorted(paths):
+            self.get(path)
+            with self._lock:
+                entry = self._entries.get(path)
+            file_hash = entry[2] if entry else self._file_hash(path)
+            digest.update(f"{os.path.basename(path)}\0{file_hash}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,111 @@
+"""
+The analyzed test plan, parsed once: its text, the section outline, the
+operational-testing block and the change → requirement pairs listed in it.
+Every analysis stage and prompt builder reads from this model instead of
+re-scanning the document text.
+"""
+import bisect
+import re
+
+from docx_stream import iter_lines
+from prompt_builder import Section, heading_level
+
+# The operational-testing block runs from this sentence to the "Purpose and Scope" heading
+OPERATIONAL_START = "performed to validate the following Medium and low risk functional requirements:"
+OPERATIONAL_END = "Purpose and Scope"
+# A change is listed as a "<description>:" line followed by its requirement ID line
+REQUIREMENT_LINE = re.compile(r"^(?:BR|FR|UR-REG|FS-REG)\s*[\d\.]+")
+REQUIREMENT_ID = re.compile(r"^([A-Z0-9\-]+\s*\d+(?:\.\d+)*)")
+
+
+def change_requirement_pairs(lines):
+    """(change_description, requirement_id) for every description line followed by an ID line."""
+    matches = []
+    i = 0
+    while i < len(lines) - 1:
+        title_line = lines[i].strip()
+        id_line = lines[i + 1].strip()
+        if title_line.endswith(":") and REQUIREMENT_LINE.match(id_line):
+            m = REQUIREMENT_ID.match(id_line)
+            matches.append((title_line.rstrip(":"), m.group(1) if m else id_line))
+            i += 2
+        else:
+            i += 1
+    return matches
+
+
+class DocumentModel:
+    """
+    Built in one pass over (style_name, text) paragraphs:
+
+    - `text`: the paragraphs joined by newlines; `offsets[n]` is where paragraph n starts
+    - `sections`: Sections in reading order with heading offsets and parent/children links
+    - `operational_text` / `operational_span`: the operational-testing block, or None
+    - `changes`: the (change_description, requirement_id) pairs listed in that block
+    """
+
+    def __init__(self, paragraphs):
+        self.paragraphs = paragraphs
+        self.offsets = []
+        sections = [Section(None, 0, 0)]
+        parts = []
+        offset = 0
+        start = end = None
+        for style_name, text in paragraphs:
+            self.offsets.append(offset)
+            stripped = text.strip()
+            level = heading_level(style_name, stripped) if stripped else None
+            if level is not None:
+                sections.append(Section(stripped, level, offset + len(text) - len(text.lstrip())))
+            else:
+                sections[-1].paragraphs.append(text)
+
+            if end is None:
+                # the block starts after the first OPERATIONAL_START and ends at the next OPERATIONAL_END
+                search_from = 0
+                if start is None:
+                    found = text.find(OPERATIONAL_START)
+                    if found >= 0:
+                        start = offset + found + len(OPERATIONAL_START)
+                        search_from = found + len(OPERATIONAL_START)
+                if start is not None:
+                    found = text.find(OPERATIONAL_END, search_from)
+                    if found >= 0:
+                        end = offset + found
+            parts.append(text)
+            offset += len(text) + 1
+        self.text = "\n".join(parts)
+
+        self.sections = [s for s in sections if s.heading or any(p.strip() for p in s.paragraphs)]
+        open_sections = []
+        for section in self.sections:
+            if not section.heading:
+                continue
+            while open_sections and open_sections[-1].level >= section.level:
+                open_sections.pop()
+            if open_sections:
+                section.parent = open_sections[-1]
+                section.parent.children.append(section)
+            open_sections.append(section)
+        self._section_offsets = [s.offset for s in self.sections]
+
+        if start is not None and end is not None:
+            self.operational_span = (start, end)
+            self.operational_text = self.text[start:end].strip()
+        else:
+            self.operational_span = None
+            self.operational_text = None
+        self.changes = change_requirement_pairs(self.operational_text.splitlines()) if self.operational_text else []
+
+    @classmethod
+    def from_docx(cls, path):
+        return cls(list(iter_lines(path)))
+
+    def section_at(self, offset):
+        """The section containing character `offset` of `text`."""
+        n = bisect.bisect_right(self._section_offsets, offset) - 1
+        return self.sections[max(n, 0)] if self.sections else None
+
+    def outline(self):
+        """Top-level sections (their children hold the rest of the tree)."""
+        return [s for s in self.sections if s.heading and s.parent is None]
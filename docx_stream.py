@@ -0,0 +1,137 @@
+"""
+Streaming .docx text extraction.
+
+Reads word/document.xml straight out of the zip with lxml's iterparse and
+drops each top-level element once it has been handled, so memory stays flat
+however long the document is — unlike python-docx, which builds the whole
+object model first. Unlike `Document.paragraphs`, paragraphs inside tables
+(and content controls) are included, in document order. Table-of-contents
+entries are skipped, as they only repeat the headings.
+"""
+import re
+import zipfile
+from typing import NamedTuple, Optional
+
+from docx.styles import BabelFish
+from lxml import etree
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DOCUMENT_PART = "word/document.xml"
+STYLES_PART = "word/styles.xml"
+ROW_SEPARATOR = " | "
+TOC_STYLE = re.compile(r"^toc \d$", re.IGNORECASE)
+
+# Run content python-docx turns into text; other <w:br> types (page/column) add nothing
+_TEXT_TAGS = (W + "t", W + "tab", W + "ptab", W + "br", W + "cr", W + "noBreakHyphen")
+
+
+class Paragraph(NamedTuple):
+    style: str  # UI style name, as python-docx reports it ("Heading 1", "Normal", ...)
+    text: str
+    cell: Optional[tuple] = None  # (table, row, column) for paragraphs inside a table
+
+
+def _paragraph_styles(archive):
+    """styleId -> UI name for paragraph styles, plus the default paragraph style's name."""
+    names, default = {}, "Normal"
+    try:
+        with archive.open(STYLES_PART) as f:
+            root = etree.parse(f, etree.XMLParser(resolve_entities=False)).getroot()
+    except KeyError:  # no styles part: every paragraph uses the default
+        return names, default
+    for style in root.iter(W + "style"):
+        if style.get(W + "type") != "paragraph":
+            continue
+        name = style.find(W + "name")
+        ui_name = BabelFish.internal2ui(name.get(W + "val")) if name is not None else style.get(W + "styleId")
+        names[style.get(W + "styleId")] = ui_name
+        if style.get(W + "default") in ("1", "true", "on"):
+            default = ui_name
+    return names, default
+
+
+def _run_text(element):
+    tag = element.tag
+    if tag == W + "t":
+        return element.text or ""
+    if tag in (W + "tab", W + "ptab"):
+        return "\t"
+    if tag == W + "cr":
+        return "\n"
+    if tag == W + "br":
+        return "\n" if element.get(W + "type", "textWrapping") == "textWrapping" else ""
+    return "-"  # noBreakHyphen
+
+
+def _events(path):
+    """Yields ("p", Paragraph) for every paragraph and ("row", (table, row)) as each table row closes."""
+    with zipfile.ZipFile(path) as archive:
+        styles, default_style = _paragraph_styles(archive)
+        with archive.open(DOCUMENT_PART) as f:
+            tables = []  # [table, row, column] per open table, innermost last
+            table_count = 0
+            depth = 0
+            context = etree.iterparse(f, events=("start", "end"), resolve_entities=False, huge_tree=True)
+            for event, element in context:
+                tag = element.tag
+                if event == "start":
+                    depth += 1
+                    if tag == W + "tbl":
+                        tables.append([table_count, -1, -1])
+                        table_count += 1
+                    elif tag == W + "tr" and tables:
+                        tables[-1][1] += 1
+                        tables[-1][2] = -1
+                    elif tag == W + "tc" and tables:
+                        tables[-1][2] += 1
+                    continue
+
+                depth -= 1
+                if tag == W + "p":
+                    style_id = element.find(f"{W}pPr/{W}pStyle")
+                    style = styles.get(style_id.get(W + "val"), default_style) if style_id is not None \
+                        else default_style
+                    text = "".join(
+                        _run_text(e) for e in element.iter(*_TEXT_TAGS) if e.getparent().tag == W + "r"
+                    )  # <w:tab> also defines tab stops in <w:pPr>
+                    if not TOC_STYLE.match(style):
+                        yield "p", Paragraph(style, text, tuple(tables[-1]) if tables else None)
+                    element.clear()  # a text box's paragraphs aren't read again by the one containing them
+                elif tag == W + "tr" and tables:
+                    yield "row", tuple(tables[-1][:2])
+                elif tag == W + "tbl" and tables:
+                    tables.pop()
+                if depth == 2:
+                    # finished a child of <w:body>: free it and everything before it
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+            del context
+
+
+def iter_paragraphs(path):
+    """Every paragraph of the document body in order, table cells included."""
+    for kind, item in _events(path):
+        if kind == "p":
+            yield item
+
+
+def iter_lines(path, row_separator=ROW_SEPARATOR):
+    """
+    (style, text) per body paragraph, with each table row collapsed into one
+    line of its cell texts joined by `row_separator` (empty cells dropped) —
+    the layout the analysis prompts see.
+    """
+    rows = {}  # (table, row) -> {column: [texts]}
+    for kind, item in _events(path):
+        if kind == "row":
+            cells = rows.pop(item, {})
+            texts = [" ".join(t for t in cells[c] if t.strip()) for c in sorted(cells)]
+            line = row_separator.join(t for t in texts if t)
+            if line:
+                yield "Table", line
+        elif item.cell is None:
+            yield item.style, item.text
+        else:
+            table, row, column = item.cell
+            rows.setdefault((table, row), {}).setdefault(column, []).append(item.text.strip())
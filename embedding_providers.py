@@ -0,0 +1,310 @@
+"""
+Where the RAG index's vectors come from. Each index is built by one
+provider and records its `id`; queries against that index must be embedded
+by the same provider, or the two sets of vectors aren't comparable.
+
+- "openai": the embeddings API (EMBEDDING_MODEL), batched and cached on disk
+- "hashed": word, word-pair and character n-grams hashed onto a fixed number
+  of dimensions on the CPU — no network, no downloaded weights
+- "local": a model file supplied with the deployment (EMBEDDING_MODEL_PATH),
+  either a word-vector table (.npz with "words"/"vectors", or word2vec text)
+  or a sentence-transformers folder when that package is installed
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from embeddings import EMBEDDING_MODEL, embed_texts
+from lexical_index import STOP_WORDS, tokenize
+from metrics import EMBEDDING_TEXTS
+
+# 🧭 Provider for this process' index: "openai" (default), "hashed" or "local"
+DEFAULT_EMBEDDING_PROVIDER = "openai"
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", DEFAULT_EMBEDDING_PROVIDER).lower()
+# Same width as ada-002, so a Pinecone index sized for it can hold hashed vectors too
+HASHED_EMBEDDING_DIM = int(os.getenv("HASHED_EMBEDDING_DIM", "1536"))
+# Bumped when the hashed features or weights change (part of the provider id)
+HASHED_EMBEDDING_VERSION = "1"
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH")
+# Indexes from before providers existed were all built with the API
+LEGACY_PROVIDER_ID = f"openai:{EMBEDDING_MODEL}"
+
+
+def index_path(base, provider_name=EMBEDDING_PROVIDER):
+    """Each provider's index lives in its own folder, so switching provider never clobbers another's."""
+    return base if provider_name == DEFAULT_EMBEDDING_PROVIDER else f"{base}-{provider_name}"
+
+
+def index_namespace(provider_name=EMBEDDING_PROVIDER):
+    """Same separation for a shared managed index (Pinecone namespaces)."""
+    return "" if provider_name == DEFAULT_EMBEDDING_PROVIDER else provider_name
+
+
+class EmbeddingProvider:
+    """
+    Turns texts into vectors. `id` names the provider and every setting that
+    changes its vectors; an index records it and is rebuilt when it differs.
+    With a cache, vectors are stored under the provider id.
+    """
+
+    name = "base"
+
+    def __init__(self, cache=None):
+        self.cache = cache
+
+    @property
+    def id(self):
+        raise NotImplementedError
+
+    def embed(self, texts):
+        """One vector per text, in input order."""
+        texts = list(texts)
+        if not texts:
+            return []
+        if self.cache is None:
+            EMBEDDING_TEXTS.inc(len(texts), model=self.id, source="local")
+            return list(self._embed(texts))
+        vectors = self.cache.get_many(self.id, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if len(missing) < len(texts):
+            EMBEDDING_TEXTS.inc(len(texts) - len(missing), model=self.id, source="cache")
+        if missing:
+            embedded = [list(map(float, v)) for v in self._embed(missing)]
+            self.cache.put_many(self.id, missing, embedded)
+            EMBEDDING_TEXTS.inc(len(missing), model=self.id, source="local")
+            fresh = dict(zip(missing, embedded))
+            vectors = [v if v is not None else fresh[t] for t, v in zip(texts, vectors)]
+        return vectors
+
+    def _embed(self, texts):
+        raise NotImplementedError
+
+
+# ☁️ OpenAI embeddings API
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    name = "openai"
+
+    def __init__(self, client_factory, model=EMBEDDING_MODEL, cache=None):
+        super().__init__(cache)
+        self.client_factory = client_factory
+        self.model = model
+        self._client = None
+
+    @property
+    def id(self):
+        return f"openai:{self.model}"
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    def embed(self, texts):
+        # the cache keeps its existing model-name keys, so API vectors cached before providers still hit
+        return embed_texts(self.client, texts, model=self.model, cache=self.cache)
+
+
+# #️⃣ Hashed n-grams (feature hashing)
+class HashedEmbeddingProvider(EmbeddingProvider):
+    """
+    Signed feature hashing over a text's words (stop words dropped), adjacent
+    word pairs and the 3–5 character n-grams of each word, with sublinear
+    term frequency. Shared words and word stems ("calibrate"/"calibration")
+    land on the same dimensions, which is most of what requirement lookups
+    need. A batch is built as one sparse scatter into a dense float32 matrix.
+    """
+
+    name = "hashed"
+    WORD_WEIGHT = 1.0
+    PAIR_WEIGHT = 0.25
+    CHAR_WEIGHT = 0.25
+    CHAR_NGRAMS = (3, 4, 5)
+    BATCH_ROWS = 512
+
+    def __init__(self, dimensions=HASHED_EMBEDDING_DIM):
+        super().__init__(cache=None)  # hashing is cheaper than a cache lookup
+        self.dimensions = dimensions
+        self._buckets = {}  # feature -> (bucket, sign); features recur across texts
+        self._lock = threading.Lock()
+
+    @property
+    def id(self):
+        return f"hashed:v{HASHED_EMBEDDING_VERSION}:{self.dimensions}"
+
+    def features(self, text):
+        """{feature: weight} for one text."""
+        words = tokenize(text)
+        counts = Counter(f"w:{w}" for w in words)
+        counts.update(f"p:{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            if word.startswith("id:"):
+                continue
+            padded = f"<{word}>"
+            counts.update(
+                f"c:{padded[i:i + n]}" for n in self.CHAR_NGRAMS for i in range(len(padded) - n + 1)
+            )
+        weights = {"w": self.WORD_WEIGHT, "p": self.PAIR_WEIGHT, "c": self.CHAR_WEIGHT}
+        return {f: weights[f[0]] * (1.0 + math.log(tf)) for f, tf in counts.items()}
+
+    def _bucket(self, feature):
+        found = self._buckets.get(feature)
+        if found is None:
+            h = zlib.crc32(feature.encode("utf-8"))
+            found = (h % self.dimensions, -1.0 if h >> 31 else 1.0)
+            with self._lock:
+                if len(self._buckets) > 1_000_000:
+                    self._buckets.clear()
+                self._buckets[feature] = found
+        return found
+
+    def _embed(self, texts):
+        out = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        for start in range(0, len(texts), self.BATCH_ROWS):
+            batch = texts[start:start + self.BATCH_ROWS]
+            cells, values = [], []
+            for row, text in enumerate(batch):
+                offset = row * self.dimensions
+                for feature, weight in self.features(text).items():
+                    bucket, sign = self._bucket(feature)
+                    cells.append(offset + bucket)
+                    values.append(sign * weight)
+            matrix = np.bincount(
+                np.asarray(cells, dtype=np.int64), weights=np.asarray(values, dtype=np.float64),
+                minlength=len(batch) * self.dimensions
+            ).reshape(len(batch), self.dimensions)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            out[start:start + len(batch)] = matrix / norms
+        return out
+
+
+# 📦 Locally supplied model file
+class WordVectorEmbeddingProvider(EmbeddingProvider):
+    """
+    Mean of the word vectors of a text's words (stop words and unknown words
+    skipped), from a table loaded once: an .npz with "words" and "vectors"
+    arrays, or a word2vec/GloVe text file.
+    """
+
+    name = "local"
+
+    def __init__(self, path, cache=None):
+        super().__init__(cache)
+        self.path = path
+        self.digest = _file_digest(path)
+        self.words, self.vectors = _load_word_vectors(path)
+        self.dimensions = self.vectors.shape[1]
+
+    @property
+    def id(self):
+        return f"local:{os.path.basename(self.path)}:{self.digest[:16]}"
+
+    def _embed(self, texts):
+        rows, cols = [], []
+        for row, text in enumerate(texts):
+            for word in re.findall(r"[a-z0-9]+", text.lower()):
+                col = self.words.get(word)
+                if col is not None and word not in STOP_WORDS:
+                    rows.append(row)
+                    cols.append(col)
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(matrix, np.asarray(rows, dtype=np.int64), self.vectors[np.asarray(cols, dtype=np.int64)])
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+class SentenceTransformerEmbeddingProvider(EmbeddingProvider):
+    """A sentence-transformers model folder, run on the CPU."""
+
+    name = "local"
+
+    def __init__(self, path, cache=None):
+        super().__init__(cache)
+        try:
+            from sentence_transformers import SentenceTransformer  # optional dependency
+        except ImportError as e:
+            raise ImportError(
+                f"EMBEDDING_MODEL_PATH={path} is a model folder; install sentence-transformers to use it"
+            ) from e
+        self.path = path
+        self.digest = _folder_digest(path)
+        self.model = SentenceTransformer(path, device="cpu")
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+
+    @property
+    def id(self):
+        return f"local:{os.path.basename(os.path.normpath(self.path))}:{self.digest[:16]}"
+
+    def _embed(self, texts):
+        return self.model.encode(texts, batch_size=64, normalize_embeddings=True, convert_to_numpy=True)
+
+
+def _file_digest(path, h=None):
+    h = h or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _folder_digest(path):
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            full = os.path.join(root, file)
+            h.update(os.path.relpath(full, path).encode("utf-8") + b"\0")
+            _file_digest(full, h)
+    return h.hexdigest()
+
+
+def _load_word_vectors(path):
+    """({word: row}, float32 matrix) from an .npz table or a word2vec/GloVe text file."""
+    if path.endswith(".npz"):
+        with np.load(path, allow_pickle=False) as data:
+            words = [str(w) for w in data["words"]]
+            vectors = np.asarray(data["vectors"], dtype=np.float32)
+    else:
+        words, rows = [], []
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                parts = line.rstrip().split(" ")
+                if len(parts) <= 2:  # word2vec header: "<count> <dimensions>"
+                    continue
+                words.append(parts[0])
+                rows.append(np.asarray(parts[1:], dtype=np.float32))
+        vectors = np.stack(rows)
+    if len(words) != len(vectors):
+        raise ValueError(f"{path}: {len(words)} words but {len(vectors)} vectors")
+    return {w.lower(): i for i, w in reversed(list(enumerate(words)))}, vectors
+
+
+def open_embedding_provider(name=EMBEDDING_PROVIDER, client_factory=None, cache=None,
+                            model_path=EMBEDDING_MODEL_PATH, dimensions=HASHED_EMBEDDING_DIM):
+    """
+    Opens a provider by name. "openai" calls `client_factory()` on first use
+    and caches API vectors in `cache`; "local" loads `model_path` and caches
+    its vectors too; "hashed" needs neither.
+    """
+    name = name.lower()
+    if name == "openai":
+        if client_factory is None:
+            raise ValueError("The openai embedding provider needs a client factory")
+        return OpenAIEmbeddingProvider(client_factory, cache=cache)
+    if name == "hashed":
+        return HashedEmbeddingProvider(dimensions)
+    if name == "local":
+        if not model_path:
+            raise ValueError("EMBEDDING_PROVIDER=local needs EMBEDDING_MODEL_PATH")
+        if os.path.isdir(model_path):
+            return SentenceTransformerEmbeddingProvider(model_path, cache=cache)
+        return WordVectorEmbeddingProvider(model_path, cache=cache)
+    raise ValueError(f"Unknown embedding provider: {name}")
@@ -0,0 +1,194 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from metrics import EMBEDDING_REQUEST_SECONDS, EMBEDDING_TEXTS, record_usage
+from rate_limit import EMBEDDINGS_GOVERNOR
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# 🗄️ On-disk embedding cache shared by the API and the upload script
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+
+# 📦 Request budget per embeddings call (API hard limits are 2048 inputs / ~300k tokens)
+MAX_BATCH_ITEMS = 256
+MAX_BATCH_TOKENS = 100_000
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token) used only for batch sizing."""
+    return len(text) // 4 + 1
+
+
+def iter_batches(texts, max_items=MAX_BATCH_ITEMS, max_tokens=MAX_BATCH_TOKENS):
+    """
+    Split texts into consecutive batches that stay within the item and
+    token budgets. Yields (start, end) slice bounds into `texts`.
+    """
+    start = 0
+    tokens = 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if i > start and (i - start >= max_items or tokens + cost > max_tokens):
+            yield start, i
+            start, tokens = i, 0
+        tokens += cost
+    if start < len(texts):
+        yield start, len(texts)
+
+
+def embed_batch(client, texts, model=EMBEDDING_MODEL) -> list[list[float]]:
+    """Embed one batch of strings in a single request, preserving input order."""
+    estimated = sum(map(estimate_tokens, texts))
+
+    def request():
+        with EMBEDDING_REQUEST_SECONDS.time(model=model):
+            return client.embeddings.create(model=model, input=list(texts))
+
+    response, reserved = EMBEDDINGS_GOVERNOR.call_reserving(request, tokens=estimated)
+    usage = getattr(response, "usage", None)
+    EMBEDDINGS_GOVERNOR.settle(reserved, usage.prompt_tokens if usage else None)
+    record_usage(model, usage.prompt_tokens if usage else estimated)
+    EMBEDDING_TEXTS.inc(len(texts), model=model, source="api")
+    return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+
+def embed_texts(client, texts, model=EMBEDDING_MODEL, cache=None,
+                max_items=MAX_BATCH_ITEMS, max_tokens=MAX_BATCH_TOKENS) -> list[list[float]]:
+    """
+    Embed any number of strings, packing as many as the budgets allow per request.
+    With a cache, only texts it hasn't seen for this model go to the API.
+    """
+    texts = list(texts)
+    vectors = cache.get_many(model, texts) if cache else [None] * len(texts)
+
+    # identical strings in one call are only sent once
+    missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+    if cache and len(missing) < len(texts):
+        EMBEDDING_TEXTS.inc(len(texts) - len(missing), model=model, source="cache")
+    if missing:
+        fresh = {}
+        for start, end in iter_batches(missing, max_items, max_tokens):
+            batch = missing[start:end]
+            embedded = embed_batch(client, batch, model=model)
+            if cache:
+                cache.put_many(model, batch, embedded)
+            fresh.update(zip(batch, embedded))
+        vectors = [v if v is not None else fresh[t] for t, v in zip(texts, vectors)]
+    return vectors
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store in SQLite, keyed by sha256(model, text).
+    WAL mode + a busy timeout make it safe to share between processes; the
+    least recently used rows are evicted once max_entries is exceeded.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL,"
+                " vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+
+    def _conn(self):
+        # one connection per thread; sqlite3 connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model, texts):
+        """Returns a list aligned with `texts`, holding None for every miss."""
+        keys = [self.key(model, t) for t in texts]
+        found = {}
+        conn = self._conn()
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), 500):  # stay under SQLite's bound-variable limit
+            chunk = unique[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for key, blob in conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", chunk
+            ):
+                found[key] = array("f", blob).tolist()
+            with conn:
+                conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})",
+                    [time.time(), *chunk]
+                )
+
+        vectors = [found.get(k) for k in keys]
+        hits = sum(v is not None for v in vectors)
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, model, texts, vectors):
+        now = time.time()
+        rows = [
+            (self.key(model, t), model, array("f", v).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_used ASC"
+                " LIMIT max(0, (SELECT COUNT(*) FROM embeddings) - ?))",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._conn().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0],
+        }
+
+
+# ⏱️ Throughput reporting for ingest paths
+class Throughput:
+    """Counts items processed and reports items/second since creation."""
+
+    def __init__(self):
+        self.start = time.time()
+        self.count = 0
+
+    def add(self, n):
+        self.count += n
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.count} requirements in {self.elapsed:.2f}s ({self.rate:.1f} req/s)"
@@ -0,0 +1,25 @@
+# 🚀 Production serving: gunicorn -c gunicorn.conf.py main:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# rate_limit splits the OpenAI budgets between the workers
+os.environ["WEB_CONCURRENCY"] = str(workers)
+# threaded workers: /analyze-stream holds a thread for the length of an analysis
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+# workers import main themselves (cheap now that clients are lazy); never share
+# Chroma/SQLite handles across a fork
+preload_app = False
+
+
+# every worker warms up in the background (the index sync is single-flight across them, so only
+# one embeds a new matrix); /healthz answers at once and /readyz reports progress until ready
+def post_worker_init(worker):
+    from main import start_warm_up
+
+    start_warm_up()
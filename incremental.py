@@ -0,0 +1,250 @@
+"""
+Incremental re-analysis of revised test plans.
+
+Every stage result is stored under a fingerprint of the input it was computed
+from, not of the whole document: the structure and system-name checks under
+the text their prompts are built from, each compliance section's findings
+under that section's text, and each RAG lookup under its change description.
+A new revision (whatever its file name) then only re-runs the checks and
+lookups whose inputs changed. When a few sections changed, the compliance
+check runs on just those sections and its findings are merged with the
+stored findings for the rest.
+"""
+import hashlib
+import os
+import re
+
+from prompt_builder import CHECK_INPUTS, compliance_sections, count_tokens
+from result_cache import analysis_cache_key
+
+INCREMENTAL_ANALYSIS = os.getenv("INCREMENTAL_ANALYSIS", "true").lower() == "true"
+# Above this share of changed compliance sections the whole check is re-run instead
+INCREMENTAL_MAX_CHANGED_RATIO = float(os.getenv("INCREMENTAL_MAX_CHANGED_RATIO", "0.5"))
+
+# Bump when the stored stage entries or the partial compliance prompt change
+INCREMENTAL_VERSION = "1"
+REVISED_SECTIONS_HEADER = (
+    "Revised sections of the test plan (the rest of the document is unchanged and was reviewed "
+    "earlier; report findings for these sections only):"
+)
+
+# A finding starts at its "Issue:" line ("1. Issue:", "- **Issue:**", ...)
+FINDING_START = re.compile(r"^\W*(?:\d+[.)]\s*)?\W*Issue\W*:", re.IGNORECASE)
+SECTION_FIELD = re.compile(r"^\W*(?:Section|Location)\W*:\s*(.+)$", re.IGNORECASE)
+HEADING_NUMBER = re.compile(r"^(\d+(?:\.\d+)*)\.?\s+(.*)$")
+
+
+def fingerprint(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def section_fingerprints(sections):
+    """The per-section fingerprint map stored with each analysis."""
+    return [{"heading": s.heading or "", "fingerprint": fingerprint(s.text)} for s in sections]
+
+
+def parse_findings(text):
+    """
+    Splits compliance output into (title, findings), one block of lines per
+    "Issue:". Output without any is kept whole as a single finding.
+    """
+    lines = text.strip().splitlines()
+    starts = [n for n, line in enumerate(lines) if FINDING_START.match(line)]
+    if not starts:
+        return "", [text.strip()] if text.strip() else []
+    title = "\n".join(lines[:starts[0]]).strip()
+    findings = [
+        "\n".join(lines[start:end]).strip()
+        for start, end in zip(starts, starts[1:] + [len(lines)])
+    ]
+    return title, findings
+
+
+def _normalize(text):
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def match_section(field, sections):
+    """Index in `sections` of the section a finding's "Section:" value names, or None."""
+    best, best_score = None, (False, 0, False)
+    field_words = _normalize(field)
+    for n, section in enumerate(sections):
+        if not section.heading:
+            continue
+        m = HEADING_NUMBER.match(section.heading)
+        number, title = (m.group(1), m.group(2)) if m else (None, section.heading)
+        title = _normalize(title)
+        by_number = bool(number and re.search(rf"(?<![\d.]){re.escape(number)}(?!\.?\d)", field))
+        by_title = bool(title) and (title in field_words or (len(field_words) >= 4 and field_words in title))
+        score = (by_number, len(number) if by_number else 0, by_title)
+        if (by_number or by_title) and score > best_score:
+            best, best_score = n, score
+    return best
+
+
+def attribute_findings(findings, sections):
+    """({index in `sections`: [findings]}, [findings naming no section in `sections`])."""
+    by_section, unattributed = {}, []
+    for finding in findings:
+        field = next((m.group(1) for m in map(SECTION_FIELD.match, finding.splitlines()) if m), None)
+        n = match_section(field, sections) if field else None
+        if n is None:
+            unattributed.append(finding)
+        else:
+            by_section.setdefault(n, []).append(finding)
+    return by_section, unattributed
+
+
+class RevisionPlan:
+    """
+    What one analysis can take from stored stage results, and the recorder
+    of its own results for later revisions. `context` holds everything
+    besides a stage's own input that its result depends on (prompt version,
+    reference corpus, assistant); with `lookup` False nothing is reused but
+    results are still stored.
+    """
+
+    def __init__(self, cache, sections, context, lookup=True, max_changed_ratio=None):
+        self.cache = cache
+        self.context = context
+        self.lookup = lookup
+        self.sections = compliance_sections(sections)
+        self.checks = {}    # check -> "reused" | "partial" | "computed"
+        self.reused = {}    # check -> stored {"result", "tokens_used", "cost"}
+        self.retrieval = {"lookups": 0, "reused": 0}
+        self.saved_tokens = 0
+        self.saved_cost = 0.0
+
+        self._check_keys = {
+            check: self._key("check", check=check, input=fingerprint("\0".join(CHECK_INPUTS[check](sections))))
+            for check in ("structure", "system_name")
+        }
+        for check, key in self._check_keys.items():
+            entry = self._get(key)
+            if entry is not None:
+                self.reused[check] = entry
+                self.checks[check] = "reused"
+            else:
+                self.checks[check] = "computed"
+
+        outline = "\n".join(s.heading or "" for s in sections)
+        self._document_key = self._key("compliance.document", outline=fingerprint(outline))
+        self._section_keys = [self._key("compliance.section", section=fingerprint(s.text)) for s in self.sections]
+        self._document = self._get(self._document_key)
+        self._findings = {}
+        for n, key in enumerate(self._section_keys):
+            entry = self._get(key)
+            if entry is not None:
+                self._findings[n] = entry["findings"]
+        self.changed = [n for n in range(len(self.sections)) if n not in self._findings]
+
+        ratio = INCREMENTAL_MAX_CHANGED_RATIO if max_changed_ratio is None else max_changed_ratio
+        if self._document is None:  # new outline: document-level findings can't be carried over
+            self.checks["compliance"] = "computed"
+        elif not self.changed:
+            self.checks["compliance"] = "reused"
+        elif len(self.changed) <= ratio * len(self.sections):
+            self.checks["compliance"] = "partial"
+        else:
+            self.checks["compliance"] = "computed"
+
+    def _key(self, stage, **inputs):
+        return analysis_cache_key(stage=stage, version=INCREMENTAL_VERSION, **self.context, **inputs)
+
+    def _get(self, key):
+        return self.cache.get(key) if self.lookup else None
+
+    def to_compute(self):
+        """The checks that need a full run, in send order."""
+        return [check for check in ("compliance", "structure", "system_name") if self.checks[check] == "computed"]
+
+    def changed_sections(self):
+        """Compliance sections a partial run has to review."""
+        return [self.sections[n] for n in self.changed]
+
+    def reused_result(self, check):
+        """(result, tokens, cost, elapsed, usage) for a check answered from stored results, as a run returns."""
+        if check == "compliance":
+            result = self._merge(self._findings, self._document)
+            self.saved_tokens += self._document.get("tokens_used") or 0
+            self.saved_cost += self._document.get("cost") or 0.0
+        else:
+            entry = self.reused[check]
+            result = entry["result"]
+            self.saved_tokens += entry.get("tokens_used") or 0
+            self.saved_cost += entry.get("cost") or 0.0
+        return result, 0, 0.0, 0.0, {}
+
+    def record(self, check, result, tokens, cost, sections_seen=None):
+        """
+        Stores a finished check's result. For compliance, `sections_seen` are
+        the sections whose whole text reached the prompt; returns the findings
+        to report, which for a partial run include the stored ones.
+        """
+        if check != "compliance":
+            self.cache.put(self._check_keys[check], {"result": result, "tokens_used": tokens, "cost": cost})
+            return result
+
+        partial = self.checks["compliance"] == "partial"
+        scope = self.changed if partial else list(range(len(self.sections)))
+        title, findings = parse_findings(result)
+        by_section, unattributed = attribute_findings(findings, [self.sections[n] for n in scope])
+        seen = {id(s) for s in sections_seen or ()}
+        for i, n in enumerate(scope):
+            found = by_section.get(i, [])
+            self._findings[n] = found
+            if id(self.sections[n]) in seen:
+                self.cache.put(self._section_keys[n], {"findings": found})
+
+        if partial:
+            earlier = self._document
+            document = {
+                "title": earlier["title"],
+                "findings": earlier["findings"] + [f for f in unattributed if f not in earlier["findings"]],
+                "tokens_used": earlier.get("tokens_used"),
+                "cost": earlier.get("cost"),
+            }
+            self.saved_tokens += max(0, (earlier.get("tokens_used") or 0) - tokens)
+            self.saved_cost += max(0.0, (earlier.get("cost") or 0.0) - cost)
+            self.cache.put(self._document_key, document)
+            return self._merge(self._findings, document)
+
+        self.cache.put(self._document_key, {
+            "title": title, "findings": unattributed, "tokens_used": tokens, "cost": cost
+        })
+        return result
+
+    def _merge(self, by_section, document):
+        """Findings in document order, then those about the document as a whole."""
+        findings = [f for n in range(len(self.sections)) for f in by_section.get(n, [])] + document["findings"]
+        return "\n\n".join(([document["title"]] if document["title"] else []) + findings)
+
+    def retrieve(self, descriptions, retrieve_batch, settings):
+        """
+        Top pairs per change description: stored ones where the description
+        and retrieval `settings` match, `retrieve_batch` for the rest.
+        """
+        keys = [self._key("retrieval", description=d, settings=settings) for d in descriptions]
+        found = [self._get(key) for key in keys]
+        missing = [n for n, pairs in enumerate(found) if pairs is None]
+        if missing:
+            fresh = retrieve_batch([descriptions[n] for n in missing])
+            for n, pairs in zip(missing, fresh):
+                found[n] = [list(pair) for pair in pairs]
+                self.cache.put(keys[n], found[n])
+        self.retrieval = {"lookups": len(descriptions), "reused": len(descriptions) - len(missing)}
+        return found
+
+    def report(self):
+        reused_sections = len(self.sections) - len(self.changed) if self.checks["compliance"] != "computed" else 0
+        return {
+            "checks": dict(self.checks),
+            "sections": len(self.sections),
+            "sections_reused": reused_sections,
+            "section_tokens_reused": sum(
+                count_tokens(self.sections[n].text) for n in range(len(self.sections)) if n not in self.changed
+            ) if reused_sections else 0,
+            "retrieval": dict(self.retrieval),
+            "saved_tokens": self.saved_tokens,
+            "saved_cost": self.saved_cost,
+        }
@@ -0,0 +1,229 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: threads are still serialised, processes are not
+    fcntl = None
+
+
+class InterProcessLock:
+    """
+    Exclusive lock held by one thread in one process at a time: a
+    threading.Lock for this process plus flock() on `path` for the others.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            try:
+                self._file = open(self.path, "a+")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def locked(self):
+        return self._thread_lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SharedExclusiveLock:
+    """
+    In-process readers/writer lock: any number of threads hold it shared, or
+    one holds it exclusively. A waiting writer holds off new shared holders,
+    except threads that already share it (shared sections may nest).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        self._held = threading.local()
+
+    @contextlib.contextmanager
+    def shared(self):
+        depth = getattr(self._held, "depth", 0)
+        with self._cond:
+            while self._writer or (self._writers_waiting and not depth):
+                self._cond.wait()
+            self._readers += 1
+        self._held.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._held.depth = depth
+            with self._cond:
+                self._readers -= 1
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class IndexSyncCoordinator:
+    """
+    Single-flight wrapper around an incremental index sync, shared by every
+    thread and worker process using the same index directory.
+
+    `sync()` performs the actual update and returns a summary dict with
+    added/updated/removed counts; `signature()` is a cheap description of
+    its inputs (e.g. file sizes and mtimes). The signature last synced and a
+    generation number — bumped whenever the index contents change — are
+    published in <index_dir>/index_generation.json. `on_sync(result)` is
+    called after every sync() in this process, including shared ones.
+    """
+
+    def __init__(self, index_dir, sync, signature, on_sync=None):
+        self.index_dir = index_dir
+        self._sync = sync
+        self._signature = signature
+        self._on_sync = on_sync
+        self.state_path = os.path.join(index_dir, "index_generation.json")
+        self._lock = InterProcessLock(os.path.join(index_dir, ".ingest.lock"))
+        self._background = None
+        self._background_lock = threading.Lock()
+        self.syncs = 0
+        self.waits = 0
+        self.background_syncs = 0
+
+    # 📰 Published state
+    def state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"generation": 0, "signature": None, "updated_at": None, "summary": None}
+
+    def _publish(self, state):
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def generation(self):
+        return self.state()["generation"]
+
+    def next_generation(self, summary, state=None):
+        """The generation a sync with `summary` publishes: the current one unless the index changed."""
+        state = state or self.state()
+        changed = any(summary.get(k) for k in ("added", "updated", "removed"))
+        return state["generation"] + 1 if changed or state["generation"] == 0 else state["generation"]
+
+    def is_current(self, state=None):
+        state = state or self.state()
+        return state["generation"] > 0 and state["signature"] == self._signature()
+
+    # 🔄 Syncing
+    def sync(self):
+        """
+        Brings the index up to date, or waits for the sync already in flight
+        in another thread/process and reuses its result. Returns the summary
+        plus the index generation.
+        """
+        if self._lock.locked():
+            self.waits += 1
+        with self._lock:
+            state = self.state()
+            if self.is_current(state):
+                # someone else finished the build we were waiting for
+                result = {**(state["summary"] or {}), "generation": state["generation"], "shared": True}
+                if self._on_sync:
+                    self._on_sync(result)
+                return result
+            signature = self._signature()
+            summary = self._sync()
+            generation = self.next_generation(summary, state)
+            self._publish({
+                "generation": generation,
+                "signature": signature,
+                "updated_at": time.time(),
+                "summary": summary,
+            })
+            self.syncs += 1
+            result = {**summary, "generation": generation}
+            if self._on_sync:
+                self._on_sync(result)
+            return result
+
+    def sync_in_background(self):
+        """Starts a sync thread unless one is already running in this process."""
+        with self._background_lock:
+            if self._background is not None and self._background.is_alive():
+                return False
+            self._background = threading.Thread(target=self._background_sync, name="index-sync", daemon=True)
+            self._background.start()
+            self.background_syncs += 1
+            return True
+
+    def _background_sync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"❌ Background index sync failed: {e}")
+
+    def ensure_current(self):
+        """
+        Cheap pre-request check. A cold index (never built) is synced while the
+        caller waits; a warm but stale one keeps serving its current generation
+        while a background sync catches up, so callers never block on it.
+        Returns the generation the caller should use.
+        """
+        state = self.state()
+        if self.is_current(state):
+            return state["generation"]
+        if state["generation"] == 0:
+            return self.sync()["generation"]
+        self.sync_in_background()
+        return state["generation"]
+
+    def stats(self):
+        state = self.state()
+        return {
+            "generation": state["generation"],
+            "updated_at": state["updated_at"],
+            "current": self.is_current(state),
+            "sync_in_progress": self._lock.locked(),
+            "syncs": self.syncs,
+            "waited_on_inflight": self.waits,
+            "background_syncs": self.background_syncs,
+        }
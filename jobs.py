@@ -0,0 +1,283 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: runs are only claimed within this process
+    fcntl = None
+
+
+class QueueFullError(Exception):
+    """Raised when the analysis queue is at capacity."""
+
+
+class JobInputError(Exception):
+    """A job's input can't be analyzed; the job fails with HTTP 400 semantics."""
+
+
+class JobBusyError(Exception):
+    """Raised when a job is already queued or running (in this or another worker process)."""
+
+
+class Job:
+    """One uploaded document and its own workspace (document/ and results/)."""
+
+    def __init__(self, job_id, workspace, filename=None):
+        self.job_id = job_id
+        self.workspace = workspace
+        self.filename = filename
+        self.status = "uploaded"
+        self.created_at = time.time()
+        self.queued_at = None
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.error_status = None
+        self.result = None
+
+    @property
+    def document_dir(self):
+        return os.path.join(self.workspace, "document")
+
+    @property
+    def results_dir(self):
+        return os.path.join(self.workspace, "results")
+
+    @property
+    def wait_time(self):
+        if self.queued_at is None:
+            return None
+        return (self.started_at or time.time()) - self.queued_at
+
+    @property
+    def run_time(self):
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "status": self.status,
+            "created_at": self.created_at,
+            "queued_at": self.queued_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "wait_time": self.wait_time,
+            "run_time": self.run_time,
+            "error": self.error,
+            "error_status": self.error_status,
+        }
+
+    @classmethod
+    def from_dict(cls, data, workspace):
+        job = cls(data["job_id"], workspace, data.get("filename"))
+        for key in ("status", "created_at", "queued_at", "started_at", "finished_at", "error", "error_status"):
+            setattr(job, key, data.get(key))
+        return job
+
+
+class JobManager:
+    """
+    Creates per-job workspaces and runs analyses on a bounded worker pool.
+    Job state is mirrored to <workspace>/job.json (and the payload to
+    result.json) so any worker process sharing the jobs folder can serve
+    status and results. job.json is the source of truth for every job this
+    process isn't running itself; a run is claimed across processes with
+    flock() on a lock file in the workspace (released by the kernel if the
+    owner dies), and jobs/latest names the most recent upload.
+    """
+
+    def __init__(self, root, runner, max_workers=2, max_queue=20, retention_seconds=7 * 24 * 3600):
+        self.root = root
+        self.runner = runner
+        self.max_queue = max_queue
+        self.retention_seconds = retention_seconds
+        self._jobs = {}
+        self._run_locks = {}  # job_id -> open run.lock this process holds flock() on
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        self._max_workers = max_workers
+        self._completed = 0
+        self._failed = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    # 📁 Workspaces
+    def create(self, filename):
+        self.purge_expired()
+        job_id = uuid.uuid4().hex
+        job = Job(job_id, os.path.join(self.root, job_id), filename)
+        os.makedirs(job.document_dir)
+        os.makedirs(job.results_dir)
+        with self._lock:
+            self._jobs[job_id] = job
+        self._save(job)
+        self._write_atomic(os.path.join(self.root, "latest"), job_id)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status in ("queued", "running"):
+                return job  # this process is running it, so its copy is the newest
+        # anything else may have been (re-)run by another worker process since
+        stored = self._load(job_id)
+        return stored if stored is not None else job
+
+    def latest(self):
+        """The most recent upload in any worker process."""
+        try:
+            with open(os.path.join(self.root, "latest"), "r", encoding="utf-8") as f:
+                job_id = f.read().strip()
+        except OSError:
+            return None
+        return self.get(job_id) if job_id else None
+
+    def _load(self, job_id):
+        path = os.path.join(self.root, os.path.basename(job_id), "job.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return Job.from_dict(json.load(f), os.path.dirname(path))
+        except (OSError, ValueError):
+            return None
+
+    def result(self, job):
+        if job.result is not None:
+            return job.result
+        try:
+            with open(os.path.join(job.workspace, "result.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, job):
+        self._write_atomic(os.path.join(job.workspace, "job.json"), json.dumps(job.to_dict()))
+
+    @staticmethod
+    def _write_atomic(path, text):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    # 🔒 Cross-process run claim: flock() on <workspace>/run.lock for as long as the run lasts.
+    # The file itself stays; removing it would let a second process lock a fresh one
+    def _claim(self, job):
+        if fcntl is None:
+            return True
+        f = open(os.path.join(job.workspace, "run.lock"), "a+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        except BaseException:
+            f.close()
+            raise
+        self._run_locks[job.job_id] = f
+        return True
+
+    def _release(self, job):
+        with self._lock:
+            f = self._run_locks.pop(job.job_id, None)
+        if f is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def purge_expired(self):
+        cutoff = time.time() - self.retention_seconds
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                with self._lock:
+                    self._jobs.pop(name, None)
+
+    # ⚙️ Queue
+    def enqueue(self, job, on_finish=None, **kwargs):
+        """
+        Queues `job` for analysis; extra kwargs are passed to the runner and
+        `on_finish()` is called once the job has completed or failed. Raises
+        JobBusyError if the job is already queued or running in any worker
+        process, so callbacks are never silently dropped.
+        """
+        with self._lock:
+            current = self._jobs.get(job.job_id)
+            if current is not None and current.status in ("queued", "running"):
+                raise JobBusyError(f"Job {job.job_id} is already being analyzed")
+            if self._queue_depth() >= self.max_queue:
+                raise QueueFullError(f"Analysis queue is full ({self.max_queue} jobs waiting)")
+            if not self._claim(job):
+                raise JobBusyError(f"Job {job.job_id} is already being analyzed")
+            self._jobs[job.job_id] = job
+            job.status = "queued"
+            job.queued_at = time.time()
+            job.started_at = job.finished_at = None
+            job.error = job.error_status = None
+            job.result = None
+        self._save(job)
+        self._executor.submit(self._run, job, on_finish, kwargs)
+        return job
+
+    def _run(self, job, on_finish, kwargs):
+        with self._lock:
+            job.status = "running"
+            job.started_at = time.time()
+        self._save(job)
+        try:
+            payload = self.runner(job, **kwargs)
+            with open(os.path.join(job.workspace, "result.json"), "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            with self._lock:
+                job.result = payload
+                job.status = "completed"
+                self._completed += 1
+        except JobInputError as e:
+            self._fail(job, str(e), 400)
+        except Exception as e:
+            print(f"❌ Job {job.job_id} failed: {e}")
+            self._fail(job, str(e), 500)
+        finally:
+            with self._lock:
+                job.finished_at = time.time()
+                self._total_wait += job.wait_time or 0.0
+                self._total_run += job.run_time or 0.0
+            self._save(job)
+            self._release(job)
+            if on_finish:
+                on_finish()
+
+    def _fail(self, job, message, status):
+        with self._lock:
+            job.status = "failed"
+            job.error = message
+            job.error_status = status
+            self._failed += 1
+
+    def _queue_depth(self):
+        return sum(1 for j in self._jobs.values() if j.status == "queued")
+
+    def stats(self):
+        with self._lock:
+            finished = self._completed + self._failed
+            running = [j for j in self._jobs.values() if j.status == "running"]
+            queued = [j for j in self._jobs.values() if j.status == "queued"]
+            return {
+                "queue_depth": len(queued),
+                "running": len(running),
+                "workers": self._max_workers,
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_wait_time": self._total_wait / finished if finished else 0.0,
+                "avg_run_time": self._total_run / finished if finished else 0.0,
+                "oldest_queued_wait": max((j.wait_time for j in queued), default=0.0),
+            }
@@ -0,0 +1,205 @@
+import json
+import math
+import os
+import re
+import threading
+
+# Bumped when tokenisation or the on-disk format changes (part of the index signature)
+LEXICAL_INDEX_VERSION = "1"
+
+# Same requirement ID shapes parse_trace_matrix recognises
+REQUIREMENT_ID_PATTERN = re.compile(
+    r"\b(BR\s*\d+(?:\.\d+)*|FR\s*\d+(?:\.\d+)*|UR-REG-\d+|FS-REG-\d+)(?![\d.]*\d)", re.IGNORECASE
+)
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or shall should "
+    "that the their this to was were will with".split()
+)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def canonical_requirement_id(req_id):
+    """'fr 3.2' and 'FR3.2' are the same requirement."""
+    return re.sub(r"\s+", "", req_id).upper()
+
+
+def requirement_ids(text):
+    return [canonical_requirement_id(m.group(1)) for m in REQUIREMENT_ID_PATTERN.finditer(text)]
+
+
+def tokenize(text):
+    """Lower-cased word terms without stop words, plus one "id:" term per requirement ID."""
+    words = [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOP_WORDS]
+    return words + [f"id:{req_id}" for req_id in requirement_ids(text)]
+
+
+def fuse_rankings(rankings, weights=None, k=60):
+    """
+    Reciprocal rank fusion: each ranking adds weight / (k + rank) to the
+    keys it lists. Scores on different scales (cosine distance, BM25) are
+    combined without calibrating them. Returns keys, best first.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+    return sorted(scores, key=lambda key: -scores[key])
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over requirement text and IDs, built alongside the
+    vector index so exact-ID and quoted-wording lookups need no embedding.
+    With `path`, documents and their term frequencies are kept in one JSON
+    file; the postings are rebuilt from them on load.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._docs = {}  # doc_id -> {"requirement_id", "text", "source", "terms": {term: tf}}
+        self._postings = {}  # term -> {doc_id: tf}
+        self._by_requirement_id = {}  # canonical ID -> [doc_id]
+        self._lengths = {}  # doc_id -> number of terms
+        self._total_length = 0
+        if path:
+            self._load()
+
+    # 💾 Persistence
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        docs = data.get("docs", {}) if data.get("version") == LEXICAL_INDEX_VERSION else {}
+        with self._lock:
+            self._docs = {}
+            self._postings = {}
+            self._by_requirement_id = {}
+            self._lengths = {}
+            self._total_length = 0
+            for doc_id, doc in docs.items():
+                self._add(doc_id, doc)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {"version": LEXICAL_INDEX_VERSION, "docs": self._docs}
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def reload(self):
+        """Re-reads the file after another process synced the index."""
+        if self.path:
+            self._load()
+
+    # ✏️ Writes (call save() to persist)
+    def _add(self, doc_id, doc):
+        self._docs[doc_id] = doc
+        for term, tf in doc["terms"].items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._by_requirement_id.setdefault(canonical_requirement_id(doc["requirement_id"]), []).append(doc_id)
+        self._lengths[doc_id] = sum(doc["terms"].values())
+        self._total_length += self._lengths[doc_id]
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in doc["terms"]:
+            postings = self._postings.get(term, {})
+            postings.pop(doc_id, None)
+            if not postings:
+                self._postings.pop(term, None)
+        key = canonical_requirement_id(doc["requirement_id"])
+        remaining = [d for d in self._by_requirement_id.get(key, []) if d != doc_id]
+        if remaining:
+            self._by_requirement_id[key] = remaining
+        else:
+            self._by_requirement_id.pop(key, None)
+        self._total_length -= self._lengths.pop(doc_id)
+
+    def upsert(self, doc_id, requirement_id, text, source):
+        terms = {}
+        for term in tokenize(text) + [f"id:{canonical_requirement_id(requirement_id)}"]:
+            terms[term] = terms.get(term, 0) + 1
+        with self._lock:
+            self._remove(doc_id)
+            self._add(doc_id, {"requirement_id": requirement_id, "text": text, "source": source, "terms": terms})
+
+    def delete(self, doc_ids):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self.delete(list(self._docs))
+
+    # 🔍 Lookups
+    def count(self):
+        return len(self._docs)
+
+    def doc_ids(self):
+        with self._lock:
+            return list(self._docs)
+
+    def requirement(self, doc_id):
+        """(requirement_id, text) — the pair retrieval returns."""
+        with self._lock:
+            doc = self._docs[doc_id]
+            return doc["requirement_id"], doc["text"]
+
+    def id_matches(self, query):
+        """Documents whose requirement ID is quoted in `query`, in the order quoted."""
+        with self._lock:
+            found = []
+            for req_id in requirement_ids(query):
+                found.extend(d for d in self._by_requirement_id.get(req_id, []) if d not in found)
+            return found
+
+    def search(self, query, k=10):
+        """BM25 top-k as [(doc_id, score), ...], best first."""
+        terms = tokenize(query)
+        with self._lock:
+            n = len(self._docs)
+            if not n or not terms:
+                return []
+            avg_length = self._total_length / n
+            scores = {}
+            for term in set(terms):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+    def quoted_matches(self, query, min_coverage=0.8, min_terms=4):
+        """
+        Documents whose wording `query` (nearly) quotes: at least `min_coverage`
+        of the distinct terms of their text appear in the query. Documents with
+        fewer than `min_terms` such terms are too short to tell. Best coverage first.
+        """
+        query_terms = {term for term in tokenize(query) if not term.startswith("id:")}
+        with self._lock:
+            hits = {}
+            for term in query_terms:
+                for doc_id in self._postings.get(term, ()):
+                    hits[doc_id] = hits.get(doc_id, 0) + 1
+            matches = []
+            for doc_id, matched in hits.items():
+                distinct = len(self._docs[doc_id]["terms"]) - 1  # minus the id: term
+                if distinct >= min_terms and matched / distinct >= min_coverage:
+                    matches.append((doc_id, matched / distinct))
+        return [doc_id for doc_id, _ in sorted(matches, key=lambda item: -item[1])]
@@ -1,70 +1,178 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
 import os
+import hashlib
+import json
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import docx
-from docx import Document as DocxReader
 from docx.shared import Pt
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 import re
-from openai import OpenAI, OpenAIError
-import chromadb
-from chromadb.config import Settings
 import logging
-
-# Initialize ChromaDB client
-CHROMA_PERSIST_DIR = ".chromadb"
-
-chroma_client = chromadb.PersistentClient(
-    path=CHROMA_PERSIST_DIR
+from document_cache import ParsedDocumentCache
+from docx_stream import iter_lines, iter_paragraphs
+from document_model import DocumentModel
+from jobs import JobBusyError, JobInputError, JobManager, QueueFullError
+from prompt_builder import (
+    PROMPT_BUILDER_VERSION, PROMPT_LAYOUT, PROMPT_TOKEN_BUDGETS, SHARED_DOCUMENT_TOKEN_BUDGET,
+    build_check_messages, build_prompt, compliance_sections_seen, count_tokens
 )
-
-# get_or_create so re‑starts don’t duplicate documents
-try:
-    chroma_client.delete_collection("sdlc-rag-index")
-except Exception:
-    pass
-
-# Create with cosine distance and a higher construction ef for better index quality
-collection = chroma_client.create_collection(
-    name="sdlc-rag-index",
-    metadata={
-        "hnsw:space": "cosine",            # use cosine distance instead of L2 :contentReference[oaicite:0]{index=0}
-        "hnsw:construction_ef": 200,       # build a richer graph :contentReference[oaicite:1]{index=1}
-        "hnsw:sync_threshold": 1000        # sync threshold (optional tweak)
-    }
+from artifacts import ARTIFACTS, ArtifactWriter, read_manifest
+from result_cache import ANALYSIS_STAGE_CACHE_PATH, AnalysisResultCache, analysis_cache_key
+from incremental import INCREMENTAL_ANALYSIS, REVISED_SECTIONS_HEADER, RevisionPlan, section_fingerprints
+from embeddings import EmbeddingCache, Throughput, iter_batches
+from embedding_providers import (
+    EMBEDDING_PROVIDER, LEGACY_PROVIDER_ID, index_namespace, index_path, open_embedding_provider
 )
+from vector_store import open_vector_store
+from lexical_index import LEXICAL_INDEX_VERSION, LexicalIndex, fuse_rankings
+from index_sync import IndexSyncCoordinator, SharedExclusiveLock
+from rate_limit import ASSISTANT_GOVERNOR, BACKGROUND, GOVERNORS, RateLimitedError, request_priority
+from metrics import (
+    ANALYSES, ASSISTANT_QUEUE_SECONDS, ASSISTANT_RUN_SECONDS, ASSISTANT_RUNS, REGISTRY, RETRIEVAL_QUERIES,
+    DEFAULT_PRICING_MODEL, STAGE_SECONDS, VECTOR_QUERY_SECONDS, model_price, record_usage, span, span_logger
+)
+
+# 🧭 Vector index backend: "chroma" (default), "numpy" (in-process exact search) or "pinecone"
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
 
-# Initialize OpenAI client (using environment variable or directly here if preferred)
-client = OpenAI()
+# Chroma persists under .chromadb; the other backends keep their files/manifest in their own folder.
+# Indexes built by another EMBEDDING_PROVIDER get their own folder (e.g. .numpy_index-hashed)
+CHROMA_PERSIST_DIR = ".chromadb"
+INDEX_DIR = index_path(CHROMA_PERSIST_DIR if VECTOR_BACKEND == "chroma" else f".{VECTOR_BACKEND}_index")
+os.makedirs(INDEX_DIR, exist_ok=True)
+
+# 🗂️ Which proprietary documents feed the RAG index (case-insensitive filename substrings)
+INDEXED_DOCUMENTS = [
+    p.strip().lower()
+    for p in os.getenv("INDEXED_DOCUMENTS", "trace matrix v8").split(",")
+    if p.strip()
+]
+# Source-file and per-requirement hashes of what's currently in the index
+INDEX_MANIFEST_PATH = os.path.join(INDEX_DIR, "index_manifest.json")
+# BM25 index over the same requirements, rebuilt by every index sync
+LEXICAL_INDEX_PATH = os.path.join(INDEX_DIR, "lexical_index.json")
+
+# 🔌 The OpenAI client and the vector index are created on first use (or by warm_up()),
+# so importing this module — gunicorn workers, the reloader, scripts — stays cheap
+_client = None
+_vector_store = None
+_lexical_index = None
+_embedding_provider = None
+_init_lock = threading.Lock()
+
+def get_openai_client():
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                from openai import OpenAI  # ~1s to import; deferred until the first API call
+                # Initialize OpenAI client (using environment variable or directly here if preferred);
+                # retries happen in rate_limit so they respect the shared budgets
+                _client = OpenAI(max_retries=0)
+    return _client
+
+def get_vector_store():
+    global _vector_store
+    if _vector_store is None:
+        with _init_lock:
+            if _vector_store is None:
+                _vector_store = open_vector_store(VECTOR_BACKEND, path=INDEX_DIR, namespace=index_namespace())
+    return _vector_store
+
+def get_embedding_provider():
+    global _embedding_provider
+    if _embedding_provider is None:
+        with _init_lock:
+            if _embedding_provider is None:
+                _embedding_provider = open_embedding_provider(
+                    EMBEDDING_PROVIDER, client_factory=get_openai_client, cache=embedding_cache
+                )
+    return _embedding_provider
+
+def get_lexical_index():
+    global _lexical_index
+    if _lexical_index is None:
+        with _init_lock:
+            if _lexical_index is None:
+                _lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+    return _lexical_index
+
+# Embeddings are cached on disk so re-ingests and repeat analyses skip the API
+embedding_cache = EmbeddingCache()
+
+# Finished analyses, so re-submitting the same test plan is answered instantly
+analysis_cache = AnalysisResultCache()
+# Per-check, per-section and per-lookup results, so a revised test plan only re-runs what changed
+analysis_stage_cache = AnalysisResultCache(ANALYSIS_STAGE_CACHE_PATH)
+
+# results/ .docx artifacts, written in the background and deduplicated by content (RESULT_ARTIFACTS)
+artifact_writer = ArtifactWriter()
 
 # 📁 Folder setup
 DOCUMENT_TO_ANALYZE_PATH = "document_to_analyze"
 PROPRIETARY_FOLDER = "proprietary_documents"
 RESULTS_FOLDER = "results"
+JOBS_FOLDER = "jobs"  # one workspace per uploaded document
 
 # Ensure required folders exist
 os.makedirs(DOCUMENT_TO_ANALYZE_PATH, exist_ok=True)
 os.makedirs(PROPRIETARY_FOLDER, exist_ok=True)
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
+os.makedirs(JOBS_FOLDER, exist_ok=True)
+
+# ⚙️ Analysis job queue settings
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_MAX = int(os.getenv("ANALYSIS_QUEUE_MAX", "20"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# Requests must name their job_id (returned by /upload-document); a single-user deployment
+# can let requests without one use the most recent upload, whoever made it
+SINGLE_USER = os.getenv("SINGLE_USER", "false").lower() == "true"
 
 
 # 📄 Read .docx into text
 def read_docx(file_path):
-    doc = docx.Document(file_path)
-    return "\n".join([para.text for para in doc.paragraphs])
+    return "\n".join(text for _, text in read_docx_paragraphs(file_path))
+
+def read_docx_paragraphs(file_path):
+    """
+    (style_name, text) for every paragraph, so headings can be recognised.
+    Streamed from the .docx; each table row becomes one "cell | cell" line.
+    """
+    return list(iter_lines(file_path))
+
+# 🗃️ Parsed reference documents, reused across requests until the file changes
+proprietary_cache = ParsedDocumentCache(read_docx)
+
+def proprietary_corpus_paths():
+    return [
+        os.path.join(PROPRIETARY_FOLDER, file)
+        for file in sorted(os.listdir(PROPRIETARY_FOLDER))
+        if file.endswith(".docx")
+    ]
+
+def load_proprietary_corpus():
+    """Concatenated text of every proprietary .docx, served from the parse cache."""
+    proprietary_full_text = ""
+    for path in proprietary_corpus_paths():
+        proprietary_full_text += f"\n--- {os.path.basename(path)} ---\n{proprietary_cache.get(path)}\n"
+    return proprietary_full_text
 
 def parse_trace_matrix(file_path: str):
     """
     Read the .docx and yield (req_id, req_text) pairs by paragraph.
     Starts a new entry whenever a paragraph begins with a valid ID,
     then accumulates all following paragraphs until the next ID.
+    Table cells are paragraphs too, so an ID cell followed by its
+    description cells reads the same as an ID line and its text.
     """
-    doc = DocxReader(file_path)
     current_id = None
     current_text = []
 
-    for para in doc.paragraphs:
+    for para in iter_paragraphs(file_path):
         txt = para.text.strip()
         # ID line?
         m = re.match(r'^(BR\s*\d+(?:\.\d+)*|FR\s*\d+(?:\.\d+)*|UR-REG-\d+|FS-REG-\d+)\b', txt)
@@ -85,79 +193,322 @@ def parse_trace_matrix(file_path: str):
     if current_id:
         yield current_id, " ".join(current_text).strip()
 
-def get_embedding(text: str) -> list[float]:
+# 🎯 Retrieval parameters (also part of the analysis cache key)
+RETRIEVAL_TOP_K = 5
+RETRIEVAL_CANDIDATES = 10
+RETRIEVAL_MAX_DISTANCE = 0.4
+# A change covering this share of a requirement's distinct terms quotes it
+LEXICAL_QUOTE_COVERAGE = float(os.getenv("LEXICAL_QUOTE_COVERAGE", "0.8"))
+# BM25 hits scoring below this fraction of the best hit are dropped
+LEXICAL_MIN_SCORE_RATIO = 0.5
+# Reciprocal-rank-fusion constant and the (vector, lexical) weights
+RETRIEVAL_FUSION_K = 60
+RETRIEVAL_FUSION_WEIGHTS = (1.0, 1.0)
+
+def retrieve_relevant_trace_requirements(change_description, top_k=RETRIEVAL_TOP_K):
+    return retrieve_relevant_trace_requirements_batch([change_description], top_k=top_k)[0]
+
+def _lexical_hits(lexical, change_description):
+    """BM25 candidates close enough to the best one to be worth returning."""
+    hits = lexical.search(change_description, k=RETRIEVAL_CANDIDATES)
+    return [doc_id for doc_id, score in hits if score >= hits[0][1] * LEXICAL_MIN_SCORE_RATIO]
+
+def _local_matches(lexical, change_description, top_k):
     """
-    Call OpenAI to embed a single string, 
-    returning the embedding vector.
+    Answers a change from the lexical index alone when it quotes a requirement
+    ID or a requirement's wording. Returns (matches, path), or (None, None)
+    when it needs the vector index.
     """
-    response = client.embeddings.create(
-        model="text-embedding-ada-002",
-        input=[text]
-    )
-    # grab the first (and only) embedding
-    return response.data[0].embedding
-
-def retrieve_relevant_trace_requirements(change_description, top_k=5):
-    emb = get_embedding(change_description)
-
-    # 1) grab more candidates
-    results = collection.query(
-      query_embeddings=[emb],
-      n_results=10,                # ← bump this up
-      include=["metadatas","distances"]
-    )
-
-    # 2) pair them up
-    candidates = list(zip(
-      results["metadatas"][0],
-      results["distances"][0]
-    ))
-
-    # 3) filter out anything too far (distance > .4, say)
-    candidates = [
-      (m["requirement_id"], m["text"], dist)
-      for m, dist in candidates
-      if dist < 0.4
-    ]
-
-    # 4) sort by ascending distance (i.e. best match first)
-    candidates.sort(key=lambda x: x[2])
-
-    # 5) take your top_k
-    top = candidates[:top_k]
+    exact = lexical.id_matches(change_description)
+    path = "exact_id"
+    if not exact:
+        exact = lexical.quoted_matches(change_description, min_coverage=LEXICAL_QUOTE_COVERAGE)
+        path = "lexical"
+    if not exact:
+        return None, None
+    ranked = list(dict.fromkeys(exact + _lexical_hits(lexical, change_description)))
+    return [lexical.requirement(doc_id) for doc_id in ranked[:top_k]], path
+
+def retrieve_relevant_trace_requirements_batch(change_descriptions, top_k=RETRIEVAL_TOP_K):
+    """
+    Batch form. Changes quoting a requirement ID or wording are answered
+    from the BM25 index without any API call; the rest share one embeddings
+    request and one index query, and their vector and BM25 rankings are fused.
+    Returns a list of [(req_id, text), ...] aligned with `change_descriptions`.
+    """
+    if not change_descriptions:
+        return []
+    with _index_access.shared():
+        return _retrieve_batch(change_descriptions, top_k)
+
+def _retrieve_batch(change_descriptions, top_k):
+    lexical = get_lexical_index()
+    matches = [None] * len(change_descriptions)
+    pending = []
+    for i, change_description in enumerate(change_descriptions):
+        matches[i], path = _local_matches(lexical, change_description, top_k)
+        if matches[i] is None:
+            pending.append(i)
+        else:
+            RETRIEVAL_QUERIES.inc(path=path)
+    if not pending:
+        return matches
+
+    provider = get_embedding_provider()
+    if _index_provider_id is not None and _index_provider_id != provider.id:
+        raise RuntimeError(
+            f"The index in {INDEX_DIR} was built with {_index_provider_id}, not {provider.id}; re-sync it first"
+        )
+    embs = provider.embed([change_descriptions[i] for i in pending])
+
+    # 1) grab more candidates for every query at once, 2) already paired as (metadata, distance)
+    vector_store = get_vector_store()
+    with VECTOR_QUERY_SECONDS.time(backend=vector_store.name):
+        results = vector_store.query(embs, n_results=RETRIEVAL_CANDIDATES)  # ← bump this up
+
+    for i, candidates in zip(pending, results):
+        # 3) filter out anything too far (distance > .4, say), 4) best match first
+        vector_ranked = [
+          (m["requirement_id"], m["text"])
+          for m, dist in sorted(candidates, key=lambda c: c[1])
+          if dist < RETRIEVAL_MAX_DISTANCE
+        ]
+        lexical_ranked = [lexical.requirement(doc_id) for doc_id in _lexical_hits(lexical, change_descriptions[i])]
+
+        # 5) fuse both rankings, 6) take your top_k
+        fused = fuse_rankings([vector_ranked, lexical_ranked], RETRIEVAL_FUSION_WEIGHTS, k=RETRIEVAL_FUSION_K)
+        matches[i] = fused[:top_k]
+        RETRIEVAL_QUERIES.inc(path="hybrid")
+    return matches
+
+def is_indexed_document(filename):
+    name = filename.lower()
+    return name.endswith(".docx") and any(p in name for p in INDEXED_DOCUMENTS)
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def load_index_manifest():
+    try:
+        with open(INDEX_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_index_manifest(manifest):
+    tmp_path = INDEX_MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, INDEX_MANIFEST_PATH)
+
+def indexed_documents_signature():
+    """Cheap stand-in for the indexed inputs: file sizes/mtimes plus the index settings."""
+    files = {}
+    for file in sorted(os.listdir(PROPRIETARY_FOLDER)):
+        if is_indexed_document(file):
+            st = os.stat(os.path.join(PROPRIETARY_FOLDER, file))
+            files[file] = [st.st_size, st.st_mtime_ns]
+    return {"files": files, "indexed_documents": INDEXED_DOCUMENTS,
+            "embedding_provider": get_embedding_provider().id, "lexical_index": LEXICAL_INDEX_VERSION}
+
+# 🔄 Bring the persisted index in line with the indexed documents on disk
+_sync_progress = {}  # what this process' running sync is doing (reported by /readyz)
+
+def _sync_trace_matrix_index():
+    """
+    Incrementally re-indexes the documents selected by INDEXED_DOCUMENTS.
+    Unchanged files are skipped by hash; inside a changed file only added or
+    edited requirements are embedded/upserted and removed ones are deleted.
+    The BM25 index is kept in step with every requirement of a changed file.
+    An index built by another embedding provider is rebuilt from scratch.
+    Everything is parsed and embedded first; the stores are then changed in
+    one step that this process' retrievals wait for, and which also switches
+    its view to the new generation.
+    Returns a summary of what changed. Only called by index_sync, which holds
+    the cross-process ingest lock.
+    """
+    global _store_generation, _index_provider_id
+    vector_store = get_vector_store()
+    lexical = get_lexical_index()
+    provider = get_embedding_provider()
+    manifest = load_index_manifest()
+    rebuild = manifest is None or manifest.get("embedding_provider", LEGACY_PROVIDER_ID) != provider.id
+    if rebuild:
+        # unknown contents (first run or pre-manifest index), or vectors that queries
+        # from this provider can't be compared with: start from empty
+        if manifest is not None:
+            app.logger.info("Rebuilding index: built with %s, now %s",
+                            manifest.get("embedding_provider", LEGACY_PROVIDER_ID), provider.id)
+        manifest = {"files": {}, "requirements": {}}
+    manifest["embedding_provider"] = provider.id
+    _sync_progress.update(phase="parsing", started_at=time.time())
+
+    files = manifest["files"]
+    entries = manifest["requirements"]
+    # an index built before the BM25 index existed: re-parse every file (unchanged
+    # requirements are still not re-embedded)
+    reparse = bool(set(entries) - set(lexical.doc_ids()))
+    summary = {"added": 0, "updated": 0, "removed": 0, "unchanged_files": 0}
+    lexical_docs = []
+    to_upsert = {}
+    to_delete = []
+
+    current_files = {f for f in os.listdir(PROPRIETARY_FOLDER) if is_indexed_document(f)}
+    for file in sorted(current_files):
+        with open(os.path.join(PROPRIETARY_FOLDER, file), "rb") as f:
+            file_hash = _sha256(f.read())
+        if files.get(file) == file_hash and not reparse:
+            summary["unchanged_files"] += 1
+            continue
 
-    # 6) format as before
-    return [
-      (req_id, text)
-      for req_id, text, _ in top
-    ]
+        previous = {doc_id for doc_id, e in entries.items() if e["file"] == file}
+        seen = set()
+        for req_id, req_text in parse_trace_matrix(os.path.join(PROPRIETARY_FOLDER, file)):
+            doc_id = f"{file}::{req_id}"
+            # first occurrence wins, as with the old one-at-a-time add
+            if not req_text.strip() or doc_id in seen:
+                continue
+            seen.add(doc_id)
+            lexical_docs.append((doc_id, req_id, req_text, file))
+            text_hash = _sha256(req_text.encode("utf-8"))
+            if doc_id not in entries:
+                summary["added"] += 1
+            elif entries[doc_id]["text_hash"] != text_hash:
+                summary["updated"] += 1
+            else:
+                continue
+            to_upsert[doc_id] = (file, req_id, req_text, text_hash)
+        to_delete.extend(previous - seen)
+        files[file] = file_hash
+
+    # files that were deleted or dropped from INDEXED_DOCUMENTS
+    for file in set(files) - current_files:
+        to_delete.extend(doc_id for doc_id, e in entries.items() if e["file"] == file)
+        del files[file]
+
+    summary["removed"] = len(to_delete)
+
+    ids = list(to_upsert)
+    texts = [to_upsert[doc_id][2] for doc_id in ids]
+    batches = list(iter_batches(texts))
+    embeddings = []
+    _sync_progress.update(phase="embedding", embedded=0, to_embed=len(ids))
+    if ids:
+        throughput = Throughput()
+        for start, end in batches:
+            embeddings.extend(provider.embed(texts[start:end]))
+            throughput.add(end - start)
+            _sync_progress["embedded"] = end
+        app.logger.info("Trace Matrix embedded %s with %s, embedding cache %s",
+                        throughput, provider.id, embedding_cache.stats())
+
+    # 🔒 Apply: retrievals in this process never see a half-updated index (or one whose
+    # contents don't match the generation their results are cached under); a file-backed
+    # vector store is written once, when the bulk block ends
+    _sync_progress["phase"] = "applying"
+    with _generation_lock, _index_access.exclusive():
+        with vector_store.bulk():
+            if rebuild:
+                vector_store.reset()
+                lexical.clear()
+            for doc in lexical_docs:
+                lexical.upsert(*doc)
+            if to_delete:
+                vector_store.delete(to_delete)
+                lexical.delete(to_delete)
+                for doc_id in to_delete:
+                    entries.pop(doc_id, None)
+            for start, end in batches:
+                vector_store.upsert(
+                    ids=ids[start:end],
+                    metadatas=[
+                        {"requirement_id": to_upsert[doc_id][1], "text": to_upsert[doc_id][2],
+                         "source": to_upsert[doc_id][0]}
+                        for doc_id in ids[start:end]
+                    ],
+                    embeddings=embeddings[start:end]
+                )
+        for doc_id in ids:
+            file, req_id, _, text_hash = to_upsert[doc_id]
+            entries[doc_id] = {"file": file, "requirement_id": req_id, "text_hash": text_hash}
+        lexical.save()
+        save_index_manifest(manifest)
+        summary["total"] = vector_store.count()
+        _index_provider_id = provider.id
+        _store_generation = index_sync.next_generation(summary)
+    app.logger.debug("Trace Matrix index sync: %s", summary)
+    return summary
+
+# 🚦 One index build at a time across threads and worker processes
+_store_generation = None  # index generation this process' vector store reflects
+_index_provider_id = None  # embedding provider that built that generation
+_generation_lock = threading.Lock()
+# retrievals share it; changing or re-reading the index view takes it exclusively
+_index_access = SharedExclusiveLock()
+
+def _is_newer(generation):
+    return _store_generation is None or generation > _store_generation
+
+def _use_generation(generation, reload=True):
+    """
+    Re-reads the in-process index view once another worker has published a
+    newer generation. Never goes back: this process' own sync switches its
+    view before the new generation is published.
+    """
+    global _store_generation, _index_provider_id
+    if not _is_newer(generation):
+        return
+    with _generation_lock:
+        if not _is_newer(generation):
+            return  # another request thread already switched
+        with _index_access.exclusive():
+            if _store_generation is not None and reload:
+                get_vector_store().reload()
+                get_lexical_index().reload()
+            manifest = load_index_manifest()
+            _index_provider_id = manifest.get("embedding_provider", LEGACY_PROVIDER_ID) if manifest else None
+            _store_generation = generation
+
+def _on_index_sync(result):
+    # our own sync already updated our view; a shared result was written by another worker
+    _use_generation(result["generation"], reload=result.get("shared", False))
+
+def _sync_at_background_priority():
+    # index builds leave OpenAI budget headroom for interactive analyses
+    try:
+        with request_priority(BACKGROUND):
+            return _sync_trace_matrix_index()
+    finally:
+        _sync_progress.clear()
+
+index_sync = IndexSyncCoordinator(
+    INDEX_DIR,
+    sync=_sync_at_background_priority,
+    signature=indexed_documents_signature,
+    on_sync=_on_index_sync
+)
 
-# after you’ve done your imports, client & collection setup, and before app.run():
 def ingest_trace_matrix():
-    before = collection.count()
-    app.logger.debug("Trace Matrix before ingest: %d", before)
-
-    all_ids = []
-    if before == 0:
-        for file in os.listdir(PROPRIETARY_FOLDER):
-            if file.lower().endswith(".docx") and "trace matrix v8" in file.lower():
-                full_path = os.path.join(PROPRIETARY_FOLDER, file)
-                for req_id, req_text in parse_trace_matrix(full_path):
-                    if not req_text.strip():
-                        continue
-                    emb = get_embedding(req_text)
-                    collection.add(
-                        ids=[req_id],
-                        metadatas=[{"requirement_id": req_id, "text": req_text}],
-                        embeddings=[emb]
-                    )
-
-    after = collection.count()
-    app.logger.debug("Trace Matrix after  ingest: %d", after)
-    app.logger.debug("IDs ingested: %s", all_ids)
+    """
+    Syncs the index now, or waits for the sync already running in another
+    thread or worker. Returns the summary, including the index generation.
+    """
+    return index_sync.sync()
+
+def ensure_index_current():
+    """
+    Per-request check: only a cold index blocks; a stale warm one keeps serving
+    while it's refreshed in the background. Returns the generation in use.
+    """
+    _use_generation(index_sync.ensure_current())
+    return _store_generation
 
 app = Flask(__name__)
 app.logger.setLevel(logging.DEBUG)
+# one JSON line per timed stage on stderr (see metrics.span)
+if os.getenv("LOG_SPANS", "false").lower() == "true":
+    logging.basicConfig(format="%(message)s")
+    span_logger.setLevel(logging.DEBUG)
 CORS(app, origins=[
   "https://sdlc-reviewer.azurewebsites.net",
   "https://salmon-grass-0f9532c0f.6.azurestaticapps.net"
@@ -171,7 +522,7 @@ def save_to_docx(text, output_path):
 
 # 📄 Format AI output into styled .docx
 def format_ai_output(ai_text, output_path):
-    doc = Document()
+    doc = docx.Document()
     lines = ai_text.strip().split("\n")
 
     for line in lines:
@@ -197,83 +548,298 @@ def format_ai_output(ai_text, output_path):
 
     doc.save(output_path)
 
-# 🔍 Extract operational testing section using regex
-def extract_operational_testing_section(text):
-    match = re.search(
-        r'performed to validate the following Medium and low risk functional requirements:(.*?)Purpose and Scope',
-        text, re.DOTALL
+def save_artifact(results_dir, name, text, render=save_to_docx):
+    """Queues `text` as result artifact `name`; returns its path, or None if it's disabled."""
+    return artifact_writer.submit(results_dir, name, _sha256(text.encode("utf-8")), lambda: text, render)
+
+# ⏳ Assistant run settings
+ASSISTANT_STREAMING = os.getenv("ASSISTANT_STREAMING", "true").lower() == "true"
+ASSISTANT_RUN_TIMEOUT = float(os.getenv("ASSISTANT_RUN_TIMEOUT", "300"))  # hard cap per run, seconds
+POLL_INITIAL_INTERVAL = 0.2
+POLL_MAX_INTERVAL = 2.0
+# Completion tokens reserved from the TPM budget per run until its real usage is known
+ASSISTANT_COMPLETION_ESTIMATE = int(os.getenv("ASSISTANT_COMPLETION_ESTIMATE", "1000"))
+# Worst case one analysis reserves for its three concurrent prompts
+ANALYSIS_TOKEN_RESERVATION = 3 * (
+    max(SHARED_DOCUMENT_TOKEN_BUDGET, *PROMPT_TOKEN_BUDGETS.values()) + ASSISTANT_COMPLETION_ESTIMATE
+)
+if 0 < ASSISTANT_GOVERNOR.capacity["tokens"] < ANALYSIS_TOKEN_RESERVATION:
+    app.logger.warning(
+        "This worker's assistant budget (%s tokens/min) is below one analysis' %s; its prompts will "
+        "run one after another. Raise ASSISTANT_TPM or lower WEB_CONCURRENCY (see rate_limit.py).",
+        ASSISTANT_GOVERNOR.capacity["tokens"], ANALYSIS_TOKEN_RESERVATION
     )
-    if match:
-        return match.group(1).strip()
-    return None
-
-# 🤖 Run prompt using Assistant API
-def run_prompt_with_assistant(assistant_id, user_input):
-    """Runs a prompt using the Assistant API, returns response and metrics."""
-    try:
-        start_time = time.time()
 
-        thread = client.beta.threads.create()
-        client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=user_input
-        )
+def _cached_prompt_tokens(usage):
+    """Prompt tokens served from the provider's prompt cache, or None if the API didn't say."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None and getattr(usage, "model_extra", None):
+        details = usage.model_extra.get("prompt_tokens_details")
+    if isinstance(details, dict):
+        return details.get("cached_tokens")
+    return getattr(details, "cached_tokens", None)
+
+def _run_usage_cost(run_status):
+    # 🔢 Token count and cost (priced per model from metrics.MODEL_PRICING, and counted in /metrics)
+    usage = run_status.usage  # Only available if `retrieval_tool` or `code_interpreter` not enabled
+    if usage:
+        tokens_used = usage.total_tokens
+        cached_tokens = _cached_prompt_tokens(usage)
+        cost = record_usage(run_status.model, usage.prompt_tokens, usage.completion_tokens, cached_tokens or 0)
+        usage_detail = {
+            "model": run_status.model,
+            "prompt_tokens": usage.prompt_tokens,
+            "cached_prompt_tokens": cached_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens,
+        }
+    else:
+        tokens_used = 0
+        cost = 0.0
+        usage_detail = {}
+    return tokens_used, cost, usage_detail
+
+def _observe_run_times(run_status, stage):
+    # server-side timestamps split a run's latency into waiting in the queue vs. generating
+    created, started, completed = run_status.created_at, run_status.started_at, run_status.completed_at
+    if created and started:
+        ASSISTANT_QUEUE_SECONDS.observe(max(0, started - created), stage=stage)
+    if started and completed:
+        ASSISTANT_RUN_SECONDS.observe(max(0, completed - started), stage=stage)
+
+def _cancel_run(thread_id, run_id):
+    from openai import OpenAIError
 
-        run = client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=assistant_id,
+    try:
+        ASSISTANT_GOVERNOR.call(
+            lambda: get_openai_client().beta.threads.runs.cancel(run_id=run_id, thread_id=thread_id)
         )
+    except (OpenAIError, RateLimitedError):
+        pass
+
+# Statuses that end a run without a result; requires_action too, since no tool outputs are ever submitted
+FAILED_RUN_STATUSES = ("failed", "incomplete", "cancelled", "expired", "requires_action")
+FAILED_RUN_EVENTS = {f"thread.run.{status}" for status in FAILED_RUN_STATUSES}
+
+class AssistantRunFailed(Exception):
+    """A run ended without completing; `tokens` is the usage it reported (None if it didn't)."""
+
+    def __init__(self, run):
+        self.run = run
+        self.tokens = run.usage.total_tokens if getattr(run, "usage", None) else None
+        reason = getattr(run, "last_error", None) or getattr(run, "incomplete_details", None) or run.status
+        super().__init__(f"Assistant run {run.status}: {reason}")
+
+def _failed_run(run):
+    if run.status == "requires_action":
+        _cancel_run(run.thread_id, run.id)  # it would otherwise wait for tool outputs until it expires
+    error = AssistantRunFailed(run)
+    print(f"❌ {error}")
+    return error
+
+def _poll_run(thread_id, run_id, deadline):
+    """Polls a run with adaptive backoff until it finishes or the deadline passes."""
+    interval = POLL_INITIAL_INTERVAL
+    while True:
+        run_status = ASSISTANT_GOVERNOR.call(lambda: get_openai_client().beta.threads.runs.retrieve(
+            thread_id=thread_id,
+            run_id=run_id
+        ))
+        if run_status.status == "completed":
+            return run_status
+        elif run_status.status in FAILED_RUN_STATUSES:
+            raise _failed_run(run_status)
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            _cancel_run(thread_id, run_id)
+            raise TimeoutError(f"Assistant run {run_id} hit the per-run timeout")
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 1.5, POLL_MAX_INTERVAL)
+
+def stream_prompt_with_assistant(assistant_id, user_input, timeout=None, stage="assistant"):
+    """
+    Runs a prompt as a streaming Assistant run (`stage` labels its metrics).
+    `user_input` is one message or a list of messages sent in order.
+    Yields ("delta", text) as tokens arrive, then a final
+    ("done", (result_text, tokens_used, cost, elapsed_time, usage)).
+    Falls back to adaptive polling when streaming is disabled or the stream drops.
+    """
+    from openai import APIConnectionError
+
+    client = get_openai_client()
+    start_time = time.time()
+    deadline = start_time + (timeout or ASSISTANT_RUN_TIMEOUT)
+    messages = [user_input] if isinstance(user_input, str) else list(user_input)
+    thread = {"messages": [{"role": "user", "content": m} for m in messages]}
+    thread_id = run_id = run_status = None
+    chunks = []
+    # reserved from the TPM budget now, corrected once the run reports its usage
+    estimated_tokens = sum(count_tokens(m) for m in messages) + ASSISTANT_COMPLETION_ESTIMATE
+    reserved_tokens = 0  # what the governor actually deducted, which is what settle corrects
+    actual_tokens = 0
 
-        while True:
-            run_status = client.beta.threads.runs.retrieve(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-            if run_status.status == "completed":
-                break
-            elif run_status.status == "failed":
-                print(f"❌ Assistant failed with error: {run_status.last_error}")
-                raise Exception(f"Assistant run failed: {run_status.last_error}")
-            elif run_status.status in ["cancelled", "expired"]:
-                raise Exception(f"Assistant run failed: {run_status.status}")
-            time.sleep(1)
+    try:
+        if ASSISTANT_STREAMING:
+            try:
+                stream, reserved_tokens = ASSISTANT_GOVERNOR.call_reserving(
+                    lambda: client.beta.threads.create_and_run(
+                        assistant_id=assistant_id,
+                        thread=thread,
+                        stream=True,
+                        timeout=deadline - time.time()
+                    ), tokens=estimated_tokens, idempotent=False
+                )
+                for event in stream:
+                    data = event.data
+                    if event.event == "thread.run.created":
+                        thread_id, run_id = data.thread_id, data.id
+                    elif event.event == "thread.message.delta":
+                        for part in data.delta.content or []:
+                            text = part.text.value if part.type == "text" and part.text else None
+                            if text:
+                                chunks.append(text)
+                                yield "delta", text
+                    elif event.event == "thread.run.completed":
+                        run_status = data
+                    elif event.event in FAILED_RUN_EVENTS:
+                        stream.close()
+                        raise _failed_run(data)
+
+                    if run_status is None and time.time() > deadline:
+                        stream.close()
+                        _cancel_run(thread_id, run_id)
+                        raise TimeoutError(f"Assistant run {run_id} hit the per-run timeout")
+            except APIConnectionError as e:
+                # the run keeps going server-side; pick it up by polling if we know its id
+                if run_id is None:
+                    raise
+                print(f"⚠️ Stream for run {run_id} dropped ({e}); falling back to polling")
+
+        if run_status is None:
+            if run_id is None:
+                run, reserved = ASSISTANT_GOVERNOR.call_reserving(lambda: client.beta.threads.create_and_run(
+                    assistant_id=assistant_id,
+                    thread=thread
+                ), tokens=estimated_tokens, idempotent=False)
+                reserved_tokens += reserved
+                thread_id, run_id = run.thread_id, run.id
+            run_status = _poll_run(thread_id, run_id, deadline)
+
+            # 📊 Messages (requires separate API call)
+            messages = ASSISTANT_GOVERNOR.call(lambda: client.beta.threads.messages.list(thread_id=thread_id))
+            result_text = messages.data[0].content[0].text.value
+            streamed = "".join(chunks)
+            if result_text.startswith(streamed) and len(result_text) > len(streamed):
+                yield "delta", result_text[len(streamed):]
+        else:
+            result_text = "".join(chunks)
 
         # ⏱️ Elapsed time
         elapsed_time = time.time() - start_time
+        tokens_used, cost, usage = _run_usage_cost(run_status)
+        actual_tokens = usage.get("total_tokens")
+    except AssistantRunFailed as e:
+        actual_tokens = e.tokens or 0
+        raise
+    finally:
+        # a run that fails or raises gives its reservation back instead of leaving it spent
+        ASSISTANT_GOVERNOR.settle(reserved_tokens, actual_tokens)
+    _observe_run_times(run_status, stage)
+    yield "done", (result_text, tokens_used, cost, elapsed_time, usage)
 
-        # 📊 Messages + Token usage (requires separate API call)
-        messages = client.beta.threads.messages.list(thread_id=thread.id)
-        result_text = messages.data[0].content[0].text.value
+# 🤖 Run prompt using Assistant API
+def run_prompt_with_assistant(assistant_id, user_input, on_delta=None, stage="assistant"):
+    """Runs a prompt using the Assistant API, returns response and metrics."""
+    try:
+        for kind, payload in stream_prompt_with_assistant(assistant_id, user_input, stage=stage):
+            if kind == "delta":
+                if on_delta:
+                    on_delta(payload)
+            else:
+                ASSISTANT_RUNS.inc(stage=stage, outcome="completed")
+                return payload
+    except TimeoutError as e:
+        ASSISTANT_RUNS.inc(stage=stage, outcome="timeout")
+        raise Exception(f"Assistant API Error: {str(e)}")
+    except RateLimitedError as e:
+        ASSISTANT_RUNS.inc(stage=stage, outcome="rate_limited")
+        raise Exception(f"Assistant API Error: {str(e)}")
+    except Exception as e:
+        ASSISTANT_RUNS.inc(stage=stage, outcome="failed")
+        raise Exception(f"Assistant API Error: {str(e)}")
 
-        # 🔢 Token count and cost (Estimate based on model pricing — adjust as needed)
-        usage = run_status.usage  # Only available if `retrieval_tool` or `code_interpreter` not enabled
-        if usage:
-            tokens_used = usage.total_tokens
-            cost = tokens_used / 1000 * 0.005  # Example: $0.005 / 1k for gpt-4o
-        else:
-            tokens_used = 0
-            cost = 0.0
+# 🧩 For each pair, retrieve top‑5 IDs and format the impacted-requirements section
+def build_impacted_requirements_section(matches, top_k=RETRIEVAL_TOP_K, all_top_pairs=None):
+    result4_sections = []
+    if all_top_pairs is None:
+        all_top_pairs = retrieve_relevant_trace_requirements_batch(
+            [change_description for change_description, _ in matches], top_k=top_k
+        )
+    for (change_description, chosen_req), top_pairs in zip(matches, all_top_pairs):
 
-        return result_text, tokens_used, cost, elapsed_time
+        section_lines = [
+            f"Change Description: {change_description}",
+            f"Chosen Requirement: {chosen_req}",
+            "AI Chosen Impacted Requirements:"
+        ]
+        for req_id, req_text in top_pairs:
+            section_lines.append(f"    {req_id}")
+            section_lines.append(f"        {req_text}")
 
-    except Exception as e:
-        raise Exception(f"Assistant API Error: {str(e)}")
+        result4_sections.append("\n".join(section_lines))
+
+    app.logger.debug("Prompt 4 sections built: %d", len(result4_sections))
+    # Join all sections with dividers
+    return "\n\n---\n\n".join(result4_sections)
+
+# ⚙️ Run independent analysis stages in parallel
+ANALYZE_MAX_WORKERS = int(os.getenv("ANALYZE_MAX_WORKERS", "4"))
 
-# 📤 Upload document endpoint
+def run_stages_concurrently(stages, max_workers=None, on_complete=None):
+    """
+    Runs (name, fn) stages on a bounded thread pool.
+    Returns (results, timings, wall_time) with results/timings keyed by stage name.
+    `on_complete(name, result)` is called as each stage finishes.
+    The first stage error cancels anything not yet started and is re-raised.
+    """
+    max_workers = max(1, max_workers or ANALYZE_MAX_WORKERS)
+    results, timings = {}, {}
+
+    def timed(name, fn):
+        stage_start = time.time()
+        try:
+            return fn()
+        finally:
+            timings[name] = time.time() - stage_start
+            STAGE_SECONDS.observe(timings[name], stage=name)
+
+    wall_start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(timed, name, fn): name for name, fn in stages}
+        try:
+            for future in as_completed(futures):
+                name = futures[future]
+                results[name] = future.result()
+                if on_complete:
+                    on_complete(name, results[name])
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+    return results, timings, time.time() - wall_start
+
+# 📤 Upload document endpoint — every upload gets its own job workspace
 @app.route("/upload-document", methods=["POST"])
 def upload_document():
-    # 0) remove any prior upload
-    for existing in os.listdir(DOCUMENT_TO_ANALYZE_PATH):
-        os.remove(os.path.join(DOCUMENT_TO_ANALYZE_PATH, existing))
-
-    # 1) now save the new file
     if 'file' not in request.files or request.files['file'].filename == '':
         return jsonify({"error": "No file uploaded"}), 400
 
     file = request.files['file']
-    file.save(os.path.join(DOCUMENT_TO_ANALYZE_PATH, file.filename))
-    return jsonify({"message": "File uploaded successfully", "filename": file.filename}), 200
+    filename = os.path.basename(file.filename)
+    job = job_manager.create(filename)
+    file.save(os.path.join(job.document_dir, filename))
+    return jsonify({"message": "File uploaded successfully", "filename": filename, "job_id": job.job_id}), 200
 
 
 # 📄 List proprietary documents
@@ -292,8 +858,14 @@ def upload_proprietary_document():
         return jsonify({"error": "No file uploaded"}), 400
 
     file = request.files['file']
-    file.save(os.path.join(PROPRIETARY_FOLDER, file.filename))
-    return jsonify({"message": "File uploaded successfully", "filename": file.filename}), 200
+    path = os.path.join(PROPRIETARY_FOLDER, file.filename)
+    file.save(path)
+    if file.filename.endswith(".docx"):
+        proprietary_cache.put(path)
+    response = {"message": "File uploaded successfully", "filename": file.filename}
+    if is_indexed_document(file.filename):
+        response["index"] = ingest_trace_matrix()
+    return jsonify(response), 200
 
 # 🗑️ Delete proprietary document
 @app.route("/delete-proprietary-document", methods=["DELETE"])
@@ -305,45 +877,16 @@ def delete_proprietary_document():
     path = os.path.join(PROPRIETARY_FOLDER, filename)
     if os.path.exists(path):
         os.remove(path)
-        return jsonify({"message": "File deleted successfully"}), 200
+        proprietary_cache.evict(path)
+        response = {"message": "File deleted successfully"}
+        if is_indexed_document(filename):
+            response["index"] = ingest_trace_matrix()
+        return jsonify(response), 200
     return jsonify({"error": "File not found"}), 404
 
-# 📊 Analyze endpoint — sends 4 prompts to the assistant
-@app.route("/analyze", methods=["POST"])
-def analyze_document():
-    # ensure the trace matrix is loaded (only actually ingests once)
-    app.logger.debug("TraceMatrix before ingest: %d", collection.count())
-    ingest_trace_matrix()
-    app.logger.debug("TraceMatrix after  ingest: %d", collection.count())
-    try:
-
-        # 1. Load uploaded document
-        files = [f for f in os.listdir(DOCUMENT_TO_ANALYZE_PATH) if f.endswith(".docx")]
-        if not files:
-            return jsonify({"error": "No uploaded document found"}), 400
-
-        doc_path = os.path.join(DOCUMENT_TO_ANALYZE_PATH, files[0])
-        document_text = read_docx(doc_path)
-
-        # 2. Extract operational testing section
-        operational_text = extract_operational_testing_section(document_text)
-        if not operational_text:
-            return jsonify({"error": "Operational Testing section not found"}), 400
-
-        # 3. Save inputs for verification
-        save_to_docx(document_text, os.path.join(RESULTS_FOLDER, "analyzed_document.docx"))
-        save_to_docx(operational_text, os.path.join(RESULTS_FOLDER, "operational_testing_section.docx"))
-
-        # 4. Load proprietary docs and save full input
-        proprietary_full_text = ""
-        for file in os.listdir(PROPRIETARY_FOLDER):
-            if file.endswith(".docx"):
-                proprietary_full_text += f"\n--- {file} ---\n{read_docx(os.path.join(PROPRIETARY_FOLDER, file))}\n"
-
-        save_to_docx(proprietary_full_text, os.path.join(RESULTS_FOLDER, "proprietary_documents_input.docx"))
-
-        # 5. Prepare four prompt sections
-        prompt_part1 = f"""
+# 📝 Prompt templates — filled with the document text via .format(document_text=...)
+# (the indentation is part of the text the assistant sees — keep it byte-identical when moving these)
+PROMPT_COMPLIANCE = """
             You are an expert Compliance and Validation Analyst specializing in regulatory compliance, risk assessment, and test plan validation.
             Your task is to analyze a regulatory document ("document_to_analyze") against several reference documents located in the "proprietary_documents" folder.
             Treat this as a new, independent request. 
@@ -375,13 +918,7 @@ def analyze_document():
             {document_text}
         """
 
-        result1, tokens1, cost1, time1 = run_prompt_with_assistant(
-            assistant_id="asst_ByTe0UXgoT8EYqWwU4XBNCvH",
-            user_input=prompt_part1
-        )
-        print(f"✅ Prompt 1 done. Tokens: {tokens1}, Cost: ${cost1:.4f}, Time: {time1:.2f}s")
-
-        prompt_part2 = f"""
+PROMPT_STRUCTURE = """
             2. Structural & Consistency Findings (Test Plan Alignment)
 
             Compare the structure of the document_to_analyze to the Test Plan Template and report any of the following:
@@ -397,14 +934,7 @@ def analyze_document():
             {document_text}
         """
 
-        result2, tokens2, cost2, time2 = run_prompt_with_assistant(
-            assistant_id="asst_ByTe0UXgoT8EYqWwU4XBNCvH",
-            user_input=prompt_part2
-        )
-        print(f"✅ Prompt 2 done. Tokens: {tokens2}, Cost: ${cost2:.4f}, Time: {time2:.2f}s")
-
-
-        prompt_part3 = f"""
+PROMPT_SYSTEM_NAME = """
             3. System Name Consistency Check
 
             Identify the official system name from the first page of the document.
@@ -418,94 +948,533 @@ def analyze_document():
             {document_text}
         """
 
-        result3, tokens3, cost3, time3 = run_prompt_with_assistant(
-            assistant_id="asst_ByTe0UXgoT8EYqWwU4XBNCvH",
-            user_input=prompt_part3
+# (stage name, check, template) in report order
+ANALYSIS_CHECKS = [
+    ("prompt1", "compliance", PROMPT_COMPLIANCE),
+    ("prompt2", "structure", PROMPT_STRUCTURE),
+    ("prompt3", "system_name", PROMPT_SYSTEM_NAME),
+]
+
+ASSISTANT_ID = "asst_ByTe0UXgoT8EYqWwU4XBNCvH"
+# Model behind ASSISTANT_ID; its cached-input discount decides which checks share the prefix
+ASSISTANT_MODEL = os.getenv("ASSISTANT_MODEL", DEFAULT_PRICING_MODEL)
+
+# Changes whenever any prompt text or section selection changes, so cached analyses are invalidated
+PROMPT_VERSION = hashlib.sha256("\0".join([
+    PROMPT_COMPLIANCE, PROMPT_STRUCTURE, PROMPT_SYSTEM_NAME,
+    PROMPT_BUILDER_VERSION, json.dumps(PROMPT_TOKEN_BUDGETS, sort_keys=True),
+    PROMPT_LAYOUT, str(SHARED_DOCUMENT_TOKEN_BUDGET), ASSISTANT_MODEL
+]).encode("utf-8")).hexdigest()[:16]
+
+# Longest the checks sharing a prefix wait for the first one to warm the provider's prompt cache
+# (0, the default, starts all at once). Only prefixes the provider caches (PROMPT_CACHE_MIN_TOKENS
+# and up) that this process hasn't sent in the last PROMPT_CACHE_TTL seconds are waited for
+PROMPT_CACHE_PRIME_WAIT = float(os.getenv("PROMPT_CACHE_PRIME_WAIT", "0"))
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_TTL = 300
+_warm_prefixes = {}  # sha256 of a shared prefix -> time.monotonic() a run last started streaming it
+
+def _prefix_is_cold(prefix_hash):
+    now = time.monotonic()
+    for key, seen in list(_warm_prefixes.items()):
+        if now - seen > PROMPT_CACHE_TTL:
+            _warm_prefixes.pop(key, None)
+    return prefix_hash not in _warm_prefixes
+
+class AnalysisInputError(JobInputError):
+    """The uploaded document is missing or can't be analyzed (reported as HTTP 400)."""
+
+# 📊 Full analysis pipeline — 3 assistant prompts + RAG retrieval
+def retrieval_settings(index_generation):
+    """Everything besides the change description that decides which requirements are retrieved."""
+    return {
+        "embedding_provider": get_embedding_provider().id,
+        "backend": VECTOR_BACKEND,
+        "indexed_documents": INDEXED_DOCUMENTS,
+        "index_generation": index_generation,
+        "top_k": RETRIEVAL_TOP_K,
+        "candidates": RETRIEVAL_CANDIDATES,
+        "max_distance": RETRIEVAL_MAX_DISTANCE,
+        "lexical": [LEXICAL_INDEX_VERSION, LEXICAL_QUOTE_COVERAGE, LEXICAL_MIN_SCORE_RATIO],
+        "fusion": [RETRIEVAL_FUSION_K, *RETRIEVAL_FUSION_WEIGHTS],
+    }
+
+def analysis_fingerprint(doc_path, index_generation):
+    """Cache key over everything that determines an analysis result."""
+    with open(doc_path, "rb") as f:
+        document_hash = hashlib.sha256(f.read()).hexdigest()
+    return analysis_cache_key(
+        document=document_hash,
+        corpus=proprietary_cache.fingerprint(proprietary_corpus_paths()),
+        prompts=PROMPT_VERSION,
+        assistant=ASSISTANT_ID,
+        retrieval=retrieval_settings(index_generation),
+    )
+
+def run_analysis(document_dir=DOCUMENT_TO_ANALYZE_PATH, results_dir=RESULTS_FOLDER,
+                 on_delta=None, on_stage=None, bypass_cache=False):
+    """
+    Runs the whole analysis on the .docx in `document_dir`, writes artifacts
+    to `results_dir`, and returns the /analyze JSON payload.
+    `on_delta(stage, text)` receives assistant tokens as they stream in and
+    `on_stage(stage, result)` fires as each stage completes.
+    Identical inputs are answered from the result cache unless `bypass_cache`;
+    otherwise only the checks and lookups whose input sections changed since
+    an earlier analysis (e.g. of the previous revision) are run.
+    """
+    # 1. Load uploaded document
+    files = [f for f in os.listdir(document_dir) if f.endswith(".docx")]
+    if not files:
+        raise AnalysisInputError("No uploaded document found")
+
+    doc_path = os.path.join(document_dir, files[0])
+
+    # ensure the trace matrix index is current: a stat() check when nothing changed, and
+    # once warm a stale index keeps serving while another worker/thread refreshes it
+    with span("index_check") as attrs:
+        attrs["generation"] = index_generation = ensure_index_current()
+
+    # 1a. Same document, corpus, prompts, index and retrieval settings → reuse the stored result
+    cache_key = analysis_fingerprint(doc_path, index_generation)
+    cached = None if bypass_cache else analysis_cache.get(cache_key)
+    if cached is not None:
+        app.logger.debug("Analysis cache hit %s", cache_key[:12])
+        saved_path = save_artifact(results_dir, "formatted_analysis", cached["result"], render=format_ai_output)
+        ANALYSES.inc(outcome="cached")
+        return {**cached, "saved_path": saved_path, "cached": True}
+
+    app.logger.debug("TraceMatrix generation %d: %d vectors", index_generation, get_vector_store().count())
+
+    with span("docx_read", file=files[0]) as attrs:
+        paragraphs = read_docx_paragraphs(doc_path)
+        attrs["paragraphs"] = len(paragraphs)
+
+    # 2. One pass over the paragraphs: sections, the operational testing block and its changes
+    with span("document_model") as attrs:
+        document = DocumentModel(paragraphs)
+        attrs.update(sections=len(document.sections), changes=len(document.changes))
+    if not document.operational_text:
+        raise AnalysisInputError("Operational Testing section not found")
+    document_text, operational_text, sections = document.text, document.operational_text, document.sections
+
+    # 3. Save inputs for verification (in the background); the corpus copy is only
+    # concatenated and rendered when the corpus changed since it was last written
+    corpus = proprietary_cache.fingerprint(proprietary_corpus_paths())
+    save_artifact(results_dir, "analyzed_document", document_text)
+    save_artifact(results_dir, "operational_testing_section", operational_text)
+    artifact_writer.submit(results_dir, "proprietary_documents_input", corpus, load_proprietary_corpus, save_to_docx)
+
+    # 5. Reuse what earlier analyses found for unchanged sections, then prepare the messages of the
+    # checks still to run (by default a shared, cacheable document prefix + instructions)
+    with span("incremental_plan") as attrs:
+        plan = RevisionPlan(
+            analysis_stage_cache, sections,
+            {"prompts": PROMPT_VERSION, "corpus": corpus, "assistant": ASSISTANT_ID},
+            lookup=INCREMENTAL_ANALYSIS and not bypass_cache
         )
-        print(f"✅ Prompt 3 done. Tokens: {tokens3}, Cost: ${cost3:.4f}, Time: {time3:.2f}s")
+        attrs.update(plan.checks)
+    with span("prompt_build", layout=PROMPT_LAYOUT):
+        to_compute = plan.to_compute()
+        check_messages = build_check_messages(
+            [(check, template) for _, check, template in ANALYSIS_CHECKS if check in to_compute], sections,
+            layout=None if len(to_compute) > 1 else "targeted",  # a prefix only pays off once shared
+            cached_input_ratio=model_price(ASSISTANT_MODEL)[2] / model_price(ASSISTANT_MODEL)[0]
+        )
+        if plan.checks["compliance"] == "partial":
+            prompt, report = build_prompt("compliance", PROMPT_COMPLIANCE, plan.changed_sections(),
+                                          header=REVISED_SECTIONS_HEADER)
+            check_messages["compliance"] = ([prompt], {**report, "layout": "targeted", "sections": "revised"})
+
+    # 6a) The (change_description, chosen_req) pairs listed in the operational section
+    matches = document.changes
+    app.logger.debug("Built %d change/ID pairs for RAG", len(matches))
+
+    # 6b) Fan the assistant prompts still to run and the RAG retrieval out in parallel
+    assistant_id = ASSISTANT_ID
+    prompts = [(name, check_messages[check][0]) for name, check, _ in ANALYSIS_CHECKS if check in check_messages]
+    prompt_reports = {
+        name: check_messages[check][1] if check in check_messages else {"check": check, "layout": "reused"}
+        for name, check, _ in ANALYSIS_CHECKS
+    }
+    # the provider caches a prefix only once a run has processed it: with PROMPT_CACHE_PRIME_WAIT,
+    # checks sharing a cold prefix wait until the first of them starts streaming (its prefill
+    # is done), for at most PROMPT_CACHE_PRIME_WAIT
+    sharing = [name for name, _ in prompts if prompt_reports[name]["layout"] == "shared_prefix"]
+    prefix_hash = hashlib.sha256(dict(prompts)[sharing[0]][0].encode("utf-8")).hexdigest() if sharing else None
+    primer = sharing[0] if (
+        PROMPT_CACHE_PRIME_WAIT and len(sharing) > 1
+        and prompt_reports[sharing[0]]["shared_prefix_tokens"] >= PROMPT_CACHE_MIN_TOKENS
+        and _prefix_is_cold(prefix_hash)
+    ) else None
+    primed = threading.Event()
+
+    def prompt_stage(name, messages):
+        if primer and name in sharing and name != primer:
+            primed.wait(PROMPT_CACHE_PRIME_WAIT)
+
+        def delta(text):
+            if PROMPT_CACHE_PRIME_WAIT and name in sharing:
+                _warm_prefixes[prefix_hash] = time.monotonic()
+            if name == primer:
+                primed.set()
+            if on_delta:
+                on_delta(name, text)
+
+        try:
+            return run_prompt_with_assistant(
+                assistant_id=assistant_id,
+                user_input=messages,
+                on_delta=delta,
+                stage=name
+            )
+        finally:
+            if name == primer:
+                primed.set()
+
+    stages = [
+        (name, lambda name=name, messages=messages: prompt_stage(name, messages))
+        for name, messages in prompts
+    ]
+    retrieved = {}
+
+    def retrieval_stage():
+        # a sync may have landed since the index check: the lookups (and this analysis'
+        # cached result) are keyed by the generation they actually read
+        with _index_access.shared():
+            retrieved["generation"] = _store_generation
+            all_top_pairs = plan.retrieve(
+                [change_description for change_description, _ in matches],
+                retrieve_relevant_trace_requirements_batch, retrieval_settings(_store_generation)
+            )
+        return build_impacted_requirements_section(matches, all_top_pairs=all_top_pairs)
 
+    stages.append(("retrieval", retrieval_stage))
 
-        print("===== OPERATIONAL_TEXT =====")
-        print(operational_text)
-        matches = re.findall(
-            r"([\s\S]*?)\s*Requirement\s*#?:?\s*([A-Za-z0-9\-]+)",
-            operational_text.strip()
+    results, stage_timings, wall_time = run_stages_concurrently(stages, on_complete=on_stage)
+    if retrieved["generation"] != index_generation:
+        index_generation = retrieved["generation"]
+        cache_key = analysis_fingerprint(doc_path, index_generation)
+
+    prompt_results = []
+    for n, (name, check, _) in enumerate(ANALYSIS_CHECKS, start=1):
+        if name not in results:
+            result, tokens, cost, elapsed, usage = plan.reused_result(check)
+            print(f"♻️ Prompt {n} reused from an earlier analysis")
+            prompt_results.append((result, tokens, cost, elapsed))
+            continue
+        result, tokens, cost, elapsed, usage = results[name]
+        seen = None
+        if check == "compliance":
+            reviewed = plan.changed_sections() if plan.checks["compliance"] == "partial" else sections
+            seen = compliance_sections_seen(reviewed, prompt_reports[name])
+        result = plan.record(check, result, tokens, cost, sections_seen=seen)
+        print(f"✅ Prompt {n} done. Tokens: {tokens}, Cost: ${cost:.4f}, Time: {elapsed:.2f}s")
+        prompt_results.append((result, tokens, cost, elapsed))
+        # estimated (local tokenizer) vs. actual prompt tokens billed for the run
+        prompt_reports[name]["actual_prompt_tokens"] = usage.get("prompt_tokens")
+        prompt_reports[name]["cached_prompt_tokens"] = usage.get("cached_prompt_tokens")
+        prompt_reports[name]["completion_tokens"] = usage.get("completion_tokens")
+
+    # 6c) Keep the original ordering: compliance, structure, system name, impacted requirements
+    result4 = results["retrieval"]
+    final_result = "\n\n".join([r[0] for r in prompt_results] + [result4])
+
+    total_tokens = sum(r[1] for r in prompt_results)  # note: no tokens4 now
+    total_cost   = sum(r[2] for r in prompt_results)
+    total_time   = sum(stage_timings.values())
+
+    # 7. Save the styled result (in the background)
+    saved_path = save_artifact(results_dir, "formatted_analysis", final_result, render=format_ai_output)
+
+    payload = {
+        "result": final_result,
+        "tokens_used": total_tokens,
+        "cost": total_cost,
+        "elapsed_time": total_time,
+        "wall_clock_time": wall_time,
+        "stage_timings": stage_timings,
+        "prompt_tokens": prompt_reports,
+        "cached_prompt_tokens": sum(r.get("cached_prompt_tokens") or 0 for r in prompt_reports.values()),
+        "index_generation": index_generation,
+        "sections": section_fingerprints(sections),
+        "incremental": plan.report()
+    }
+    analysis_cache.put(cache_key, payload)
+    reused = any(state != "computed" for state in plan.checks.values()) or plan.retrieval["reused"]
+    ANALYSES.inc(outcome="incremental" if reused else "computed")
+    return {**payload, "saved_path": saved_path, "cached": False}
+
+def run_job(job, **kwargs):
+    """JobManager runner: one queued analysis, timed end to end."""
+    try:
+        with span("analysis", job_id=job.job_id):
+            return run_analysis(job.document_dir, job.results_dir, **kwargs)
+    except Exception:
+        ANALYSES.inc(outcome="failed")
+        raise
+
+job_manager = JobManager(
+    JOBS_FOLDER,
+    runner=run_job,
+    max_workers=ANALYSIS_WORKERS,
+    max_queue=ANALYSIS_QUEUE_MAX,
+    retention_seconds=JOB_RETENTION_SECONDS
+)
+
+def _requested_job():
+    """
+    (job, None) for the job named by ?job_id= or a JSON body, else (None, error response).
+    Only SINGLE_USER deployments fall back to the most recent upload (in any worker).
+    """
+    body = request.get_json(silent=True) or {}
+    job_id = request.args.get("job_id") or body.get("job_id")
+    if not job_id:
+        if not SINGLE_USER:
+            return None, (jsonify({"error": "job_id is required (returned by /upload-document)"}), 400)
+        job = job_manager.latest()
+        return (job, None) if job else (None, (jsonify({"error": "No uploaded document found"}), 400))
+    job = job_manager.get(job_id)
+    return (job, None) if job else (None, (jsonify({"error": "Job not found"}), 404))
+
+def _bypass_cache_requested():
+    body = request.get_json(silent=True) or {}
+    flag = request.args.get("bypass_cache", body.get("bypass_cache", False))
+    return str(flag).lower() in ("1", "true", "yes")
+
+def _job_links(job):
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.job_id}",
+        "result_url": f"/jobs/{job.job_id}/result",
+    }
+
+# 📊 Analyze endpoint — queues the 3 assistant prompts plus RAG retrieval for a job
+@app.route("/analyze", methods=["POST"])
+def analyze_document():
+    job, error = _requested_job()
+    if error:
+        return error
+    try:
+        job_manager.enqueue(job, bypass_cache=_bypass_cache_requested())
+    except JobBusyError:
+        return jsonify({"error": "Job is already being analyzed", **_job_links(job)}), 409
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify(_job_links(job)), 202
+
+# 🧾 Job status and results
+@app.route("/jobs/stats", methods=["GET"])
+def job_stats():
+    return jsonify(job_manager.stats())
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({**job.to_dict(), **_job_links(job)})
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status == "failed":
+        return jsonify({"error": job.error}), job.error_status or 500
+    if job.status != "completed":
+        return jsonify(_job_links(job)), 202
+    return jsonify(job_manager.result(job))
+
+# 📡 Streaming analyze endpoint — Server-Sent Events as findings arrive
+SSE_KEEPALIVE_SECONDS = 15
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/analyze-stream", methods=["POST"])
+def analyze_document_stream():
+    """
+    Same analysis as /analyze, run through the job queue but streamed as SSE:
+    `queued`, `delta` (assistant tokens), `stage` (a finished stage), then `done` or `error`.
+    """
+    job, error = _requested_job()
+    if error:
+        return error
+
+    events = queue.Queue()
+
+    def on_stage(stage, result):
+        if stage == "retrieval":
+            events.put(("stage", {"stage": stage, "result": result}))
+        else:
+            text, tokens, cost, elapsed, _ = result
+            events.put(("stage", {
+                "stage": stage,
+                "result": text,
+                "tokens_used": tokens,
+                "cost": cost,
+                "elapsed_time": elapsed
+            }))
+
+    try:
+        job_manager.enqueue(
+            job,
+            on_delta=lambda stage, text: events.put(("delta", {"stage": stage, "text": text})),
+            on_stage=on_stage,
+            on_finish=lambda: events.put(None),
+            bypass_cache=_bypass_cache_requested()
         )
-        print("Regex found matches:", matches)
-
-        app.logger.debug("Operational text:\n%s", operational_text)
-        app.logger.debug("Regex matches: %s", matches)
-
-        # 4a) Build a list of (change_description, chosen_req) tuples
-        matches = []
-        lines = operational_text.splitlines()
-        i = 0
-        while i < len(lines) - 1:
-            title_line = lines[i].strip()
-            id_line    = lines[i+1].strip()
-
-            if title_line.endswith(":") and re.match(r"^(?:BR|FR|UR-REG|FS-REG)\s*[\d\.]+", id_line):
-                change_description = title_line.rstrip(":")
-                m = re.match(r"^([A-Z0-9\-]+\s*\d+(?:\.\d+)*)", id_line)
-                chosen_req = m.group(1) if m else id_line
-                matches.append((change_description, chosen_req))
-                i += 2
-            else:
-                i += 1
-
-        app.logger.debug("Built %d change/ID pairs for RAG", len(matches))
-
-        # 4b) For each pair, retrieve top‑5 IDs and format the section
-        result4_sections = []
-        for change_description, chosen_req in matches:
-            top_pairs = retrieve_relevant_trace_requirements(change_description, top_k=5)
-
-            section_lines = [
-                f"Change Description: {change_description}",
-                f"Chosen Requirement: {chosen_req}",
-                "AI Chosen Impacted Requirements:"
-            ]
-            # ← insert your req_id/req_text loop here:
-            for req_id, req_text in top_pairs:
-                section_lines.append(f"    {req_id}")
-                section_lines.append(f"        {req_text}")
-
-            result4_sections.append("\n".join(section_lines))
-
-        # 4c) Join all sections with dividers
-        result4 = "\n\n---\n\n".join(result4_sections)
-        app.logger.debug("Prompt 4 sections built: %d", len(result4_sections))
-        final_result = "\n\n".join([result1, result2, result3, result4])
-
-        total_tokens = tokens1 + tokens2 + tokens3  # note: no tokens4 now
-        total_cost   = cost1   + cost2   + cost3
-        total_time   = time1   + time2   + time3
-
-        # 7. Save result
-        save_to_docx(final_result,
-                     os.path.join(RESULTS_FOLDER, "formatted_analysis.docx"))
-
-        return jsonify({
-            "result": final_result,
-            "saved_path": os.path.join(RESULTS_FOLDER, "formatted_analysis.docx"),
-            "tokens_used": total_tokens,
-            "cost": total_cost,
-            "elapsed_time": total_time
-        })
+    except JobBusyError:
+        return jsonify({"error": "Job is already being analyzed", **_job_links(job)}), 409
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
 
-    except Exception as e:
-        print(f"❌ Unexpected error: {e}")
-        return jsonify({"error": str(e)}), 500
+    def generate():
+        yield _sse("queued", _job_links(job))
+        while True:
+            try:
+                item = events.get(timeout=SSE_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if item is None:
+                break
+            yield _sse(*item)
+        if job.status == "completed":
+            yield _sse("done", {**job_manager.result(job), "job_id": job.job_id})
+        else:
+            yield _sse("error", {"error": job.error, "status": job.error_status, "job_id": job.job_id})
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+def retrieval_stats():
+    """Retrieval queries in this process, and how many needed no API call."""
+    by_path = {path: RETRIEVAL_QUERIES.value(path=path) for path in ("exact_id", "lexical", "hybrid")}
+    return {
+        "embedding_provider": _index_provider_id,
+        "queries": sum(by_path.values()),
+        "served_without_network": by_path["exact_id"] + by_path["lexical"],
+        "by_path": by_path,
+    }
 
-# 📥 Download final formatted results
+# 📈 Cache hit/miss counters
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "proprietary_documents": proprietary_cache.stats(),
+        "embeddings": embedding_cache.stats(),
+        "analysis_results": analysis_cache.stats(),
+        "analysis_stages": analysis_stage_cache.stats(),
+        "artifacts": artifact_writer.stats(),
+        "retrieval": retrieval_stats(),
+        "openai_budgets": {api: governor.stats() for api, governor in GOVERNORS.items()}
+    })
+
+# 📈 Prometheus scrape endpoint (per-process: each worker serves its own counters)
+REGISTRY.callback("sdlc_jobs_queued", "Analyses waiting for a worker",
+                  lambda: job_manager.stats()["queue_depth"])
+REGISTRY.callback("sdlc_jobs_running", "Analyses currently running",
+                  lambda: job_manager.stats()["running"])
+REGISTRY.callback(
+    "sdlc_cache_requests_total", "Cache lookups by cache and result",
+    lambda: {
+        (name, result): stats[key]
+        for name, stats in (("embeddings", embedding_cache.stats()), ("analysis_results", analysis_cache.stats()),
+                            ("analysis_stages", analysis_stage_cache.stats()),
+                            ("proprietary_documents", proprietary_cache.stats()))
+        for result, key in (("hit", "hits"), ("miss", "misses"))
+    },
+    labelnames=["cache", "result"], kind="counter"
+)
+REGISTRY.callback("sdlc_index_generation", "Published generation of the requirement index",
+                  index_sync.generation)
+REGISTRY.callback("sdlc_index_vectors", "Vectors in the requirement index",
+                  lambda: _vector_store.count() if _vector_store is not None else 0)
+REGISTRY.callback("sdlc_lexical_index_documents", "Requirements in the BM25 index",
+                  lambda: _lexical_index.count() if _lexical_index is not None else 0)
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+# 🔥 Start-up warm-up, reported by the readiness probe
+_warm_state = {"status": "cold", "step": None, "started_at": None, "finished_at": None, "index": None, "error": None}
+_warm_lock = threading.Lock()
+
+def warm_up():
+    """
+    Opens the OpenAI client, embedding provider and vector index, syncs the
+    index with the trace matrix (picking up edits made while the server was
+    down) and pre-parses the reference corpus so the first /analyze doesn't
+    pay for any of it.
+    """
+    with _warm_lock:
+        if _warm_state["status"] in ("warming", "ready"):
+            return
+        _warm_state.update(status="warming", step="clients", started_at=time.time(), error=None)
+    try:
+        with span("warm_up"):
+            get_openai_client()
+            get_embedding_provider()
+            # single-flight across workers: one builds the index, the others wait for its result
+            _warm_state["step"] = "index_sync"
+            summary = ingest_trace_matrix()
+            print(f"🗂️ Index sync: {summary}")
+            _warm_state["step"] = "corpus"
+            print(f"🗃️ Pre-warmed {proprietary_cache.warm(PROPRIETARY_FOLDER)} proprietary documents")
+        _warm_state.update(status="ready", step=None, finished_at=time.time(), index=summary)
+    except Exception as e:
+        print(f"❌ Warm-up failed: {e}")
+        _warm_state.update(status="failed", finished_at=time.time(), error=str(e))
+
+def start_warm_up():
+    """Runs warm_up() in the background so the server accepts connections immediately."""
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+# ❤️ Liveness: the process is up and serving requests
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
+
+# ✅ Readiness: 200 once the index is synced and the corpus parsed, 503 until then; while warming,
+# `step` and index_sync.progress say how far it got (progress is empty in a worker waiting on another's sync)
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    state = {**_warm_state, "index_sync": {**index_sync.stats(), "progress": dict(_sync_progress)}}
+    if state["status"] == "failed":
+        start_warm_up()  # retry, e.g. after the API or index comes back
+    return jsonify(state), 200 if state["status"] == "ready" else 503
+
+# 📥 Download final formatted results for a job
 @app.route("/download-results", methods=["GET"])
 def download_results():
-    path = os.path.join(RESULTS_FOLDER, "formatted_analysis.docx")
-    if not os.path.exists(path):
-        return jsonify({"error": "Formatted analysis file not found"}), 404
-    return send_file(path, as_attachment=True)
+    """?artifact= picks the file (default formatted_analysis); 202 while it's still being written."""
+    job, error = _requested_job()
+    if error:
+        return error
+    name = request.args.get("artifact", "formatted_analysis")
+    if name not in ARTIFACTS:
+        return jsonify({"error": f"Unknown artifact {name!r}", "artifacts": sorted(ARTIFACTS)}), 400
+    path = os.path.join(job.results_dir, ARTIFACTS[name])
+    state = read_manifest(job.results_dir).get(name, {})
+    # a file left by the previous run isn't this run's result
+    if state.get("status") == "pending" or job.status in ("queued", "running"):
+        return jsonify({**_job_links(job), "artifact": name, "artifact_status": "pending"}), 202
+    if os.path.exists(path):
+        return send_file(os.path.abspath(path), as_attachment=True)
+    if state.get("status") == "failed":
+        return jsonify({"error": f"Writing {ARTIFACTS[name]} failed: {state.get('error')}"}), 500
+    return jsonify({"error": f"{ARTIFACTS[name]} not found (not written for this job)"}), 404
 
-# 🚀 Run server
+# 🚀 Run server (development; production runs under gunicorn — see gunicorn.conf.py)
 if __name__ == "__main__":
+    debug = os.getenv("FLASK_DEBUG", "false").lower() == "true"
+    # with the reloader on, only the child process that serves requests warms up
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warm_up()
     # bind to 0.0.0.0 so Docker port‑forwarding actually works
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=debug, threaded=True)
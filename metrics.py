@@ -0,0 +1,271 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+# 💵 USD per 1M tokens as (input, output[, cached input]); longest matching prefix wins,
+# so dated snapshots like "gpt-4o-2024-08-06" use their family's price.
+# Without a cached price, cached prompt tokens are billed as normal input.
+MODEL_PRICING = {
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4.1": (2.00, 8.00, 0.50),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4.1-nano": (0.10, 0.40, 0.025),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o3-mini": (1.10, 4.40, 0.55),
+    "text-embedding-ada-002": (0.10, 0.0),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+# Optional JSON file {"model": [input, output, cached_input], ...} to add or override prices
+MODEL_PRICING_FILE = os.getenv("MODEL_PRICING_FILE")
+if MODEL_PRICING_FILE:
+    with open(MODEL_PRICING_FILE, "r", encoding="utf-8") as f:
+        MODEL_PRICING.update({model: tuple(price) for model, price in json.load(f).items()})
+# Used for models missing from the table (the assistant's model is gpt-4o)
+DEFAULT_PRICING_MODEL = os.getenv("DEFAULT_PRICING_MODEL", "gpt-4o")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+span_logger = logging.getLogger("sdlc.spans")
+
+
+def model_price(model):
+    """(input, output, cached input) USD per 1M tokens for `model`."""
+    name = (model or "").lower()
+    matches = [m for m in MODEL_PRICING if name.startswith(m)]
+    price = MODEL_PRICING[max(matches, key=len)] if matches else MODEL_PRICING[DEFAULT_PRICING_MODEL]
+    return price if len(price) == 3 else (price[0], price[1], price[0])
+
+
+def token_cost(model, prompt_tokens, completion_tokens=0, cached_tokens=0):
+    """`cached_tokens` is the part of `prompt_tokens` served from the provider's prompt cache."""
+    input_price, output_price, cached_price = model_price(model)
+    cached_tokens = min(cached_tokens or 0, prompt_tokens)
+    return (
+        (prompt_tokens - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + completion_tokens * output_price
+    ) / 1_000_000
+
+
+# 📈 Minimal Prometheus-style instruments (text exposition format)
+def _label_key(labelnames, labels):
+    missing = set(labelnames) - set(labels)
+    if missing or len(labels) != len(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, list(zip(self.labelnames, key)), v) for key, v in sorted(self._values.items())]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}  # label key -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                labels = list(zip(self.labelnames, key))
+                for bound, n in zip(self.buckets, counts):
+                    out.append((f"{self.name}_bucket", labels + [("le", _format_value(bound))], n))
+                out.append((f"{self.name}_sum", labels, total))
+                out.append((f"{self.name}_count", labels, count))
+        return out
+
+
+class CallbackMetric:
+    """Value(s) read at scrape time from `fn`: a number, or a {label_value_tuple: number} dict."""
+
+    def __init__(self, name, documentation, fn, labelnames=(), kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def samples(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            return [(self.name, [], value)]
+        return [(self.name, list(zip(self.labelnames, key)), v) for key, v in sorted(value.items())]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing  # re-imports (e.g. the Flask reloader) reuse the instrument
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, fn, labelnames=(), kind="gauge"):
+        with self._lock:
+            self._metrics.pop(name, None)  # callbacks close over live objects; the newest wins
+        return self._register(CallbackMetric(name, documentation, fn, labelnames, kind))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:  # a broken callback shouldn't take down the scrape
+                span_logger.warning("Metric %s failed: %s", metric.name, e)
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ⏱️ Instruments shared by the app, the embedding helpers and the upload script
+STAGE_SECONDS = REGISTRY.histogram(
+    "sdlc_stage_duration_seconds", "Wall time of each analysis stage", ["stage"])
+ASSISTANT_QUEUE_SECONDS = REGISTRY.histogram(
+    "sdlc_assistant_queue_seconds", "Time an assistant run waited before starting", ["stage"])
+ASSISTANT_RUN_SECONDS = REGISTRY.histogram(
+    "sdlc_assistant_run_seconds", "Time an assistant run spent in progress", ["stage"])
+ASSISTANT_RUNS = REGISTRY.counter(
+    "sdlc_assistant_runs_total", "Assistant runs by outcome", ["stage", "outcome"])
+EMBEDDING_REQUEST_SECONDS = REGISTRY.histogram(
+    "sdlc_embedding_request_seconds", "Latency of each embeddings API request", ["model"])
+EMBEDDING_TEXTS = REGISTRY.counter(
+    "sdlc_embedding_texts_total", "Texts embedded, by where the vector came from (api/cache/local)",
+    ["model", "source"])
+VECTOR_QUERY_SECONDS = REGISTRY.histogram(
+    "sdlc_vector_query_seconds", "Latency of each vector index query", ["backend"])
+RETRIEVAL_QUERIES = REGISTRY.counter(
+    "sdlc_retrieval_queries_total",
+    "Requirement lookups by path (exact_id/lexical need no API call, hybrid embeds the query)", ["path"])
+OPENAI_THROTTLED_SECONDS = REGISTRY.histogram(
+    "sdlc_openai_throttled_seconds", "Time calls waited for the client-side rate-limit budget", ["api", "priority"])
+OPENAI_RETRIES = REGISTRY.counter(
+    "sdlc_openai_retries_total", "OpenAI calls retried, by reason (rate_limited/server_error/connection)",
+    ["api", "reason"])
+TOKENS = REGISTRY.counter(
+    "sdlc_tokens_total", "Tokens billed, by model and kind (prompt/completion/cached_prompt)", ["model", "kind"])
+COST_USD = REGISTRY.counter(
+    "sdlc_cost_usd_total", "Estimated spend from MODEL_PRICING", ["model"])
+ANALYSES = REGISTRY.counter(
+    "sdlc_analyses_total", "Analyses by outcome (computed/incremental/cached/failed)", ["outcome"])
+ARTIFACT_WRITES = REGISTRY.counter(
+    "sdlc_artifact_writes_total", "Result artifacts by outcome (rendered/linked/failed)", ["artifact", "outcome"])
+
+
+def record_usage(model, prompt_tokens, completion_tokens=0, cached_tokens=0):
+    """Counts billed tokens and their cost; returns the cost in USD."""
+    model = model or DEFAULT_PRICING_MODEL
+    cost = token_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+    TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        TOKENS.inc(completion_tokens, model=model, kind="completion")
+    if cached_tokens:
+        TOKENS.inc(cached_tokens, model=model, kind="cached_prompt")
+    COST_USD.inc(cost, model=model)
+    return cost
+
+
+@contextlib.contextmanager
+def span(stage, **attributes):
+    """
+    Times a block into sdlc_stage_duration_seconds{stage} and logs one
+    structured line per span. The yielded dict can collect extra attributes.
+    """
+    attributes = dict(attributes)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attributes
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, stage=stage)
+        span_logger.debug(json.dumps(
+            {"span": stage, "duration_s": round(duration, 4), "status": status, **attributes},
+            default=str
+        ))
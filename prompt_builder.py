@@ -0,0 +1,273 @@
+import os
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-based estimate
+    tiktoken = None
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")  # gpt-4o family
+
+# 🎯 Per-check document token budgets (the instruction text comes on top)
+PROMPT_TOKEN_BUDGETS = {
+    "compliance": int(os.getenv("COMPLIANCE_TOKEN_BUDGET", "12000")),
+    "structure": int(os.getenv("STRUCTURE_TOKEN_BUDGET", "3000")),
+    "system_name": int(os.getenv("SYSTEM_NAME_TOKEN_BUDGET", "6000")),
+}
+
+# 🧱 "shared_prefix": every check starts with the same document message, so the provider's
+# prompt cache serves it after the first run; "targeted": each check gets only its own sections
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "shared_prefix").lower()
+SHARED_DOCUMENT_TOKEN_BUDGET = int(os.getenv("SHARED_DOCUMENT_TOKEN_BUDGET", "12000"))
+SHARED_DOCUMENT_HEADER = "Test plan under review (the checks that follow all refer to this document):"
+SHARED_DOCUMENT_REFERENCE = "Apply this check to the test plan provided in the previous message."
+
+# Bump when section selection changes so cached analyses are invalidated
+PROMPT_BUILDER_VERSION = "2"
+
+# Sections the compliance prompt tells the model to skip anyway
+SKIPPED_COMPLIANCE_HEADINGS = re.compile(
+    r"approval|signature|revision history|\bIQ\b|\bOQ\b|installation qualification|"
+    r"operational qualification|test script",
+    re.IGNORECASE
+)
+NUMBERED_HEADING = re.compile(r"^\d+(?:\.\d+)*\.?\s+[A-Z][^.:]{0,80}$")
+# Words that could be (part of) a system name: acronyms or "<Name> System"-style phrases
+NAME_CANDIDATE = re.compile(r"\b[A-Z]{2,}[A-Z0-9]*\b|\b[A-Z][A-Za-z]+\s+(?:System|Application|Platform|Tool)\b")
+
+_encoder = None
+_encoder_lock = threading.Lock()
+_encoder_failed = False
+
+
+def _get_encoder():
+    global _encoder, _encoder_failed
+    if tiktoken is None or _encoder_failed:
+        return None
+    with _encoder_lock:
+        if _encoder is None and not _encoder_failed:
+            try:
+                _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception as e:  # BPE file not cached and no network
+                print(f"⚠️ Tokenizer unavailable ({e}); estimating tokens")
+                _encoder_failed = True
+    return _encoder
+
+
+def tokenizer_name():
+    return f"tiktoken:{TOKENIZER_ENCODING}" if _get_encoder() else "estimate"
+
+
+def count_tokens(text: str) -> int:
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+class Section:
+    """
+    A heading and the paragraphs under it (level 0 = front matter before the
+    first heading). `offset` is where the heading starts in the document text;
+    `parent` / `children` link the outline when built by DocumentModel.
+    """
+
+    def __init__(self, heading, level, offset=None):
+        self.heading = heading
+        self.level = level
+        self.offset = offset
+        self.paragraphs = []
+        self.parent = None
+        self.children = []
+
+    @property
+    def text(self):
+        body = "\n".join(self.paragraphs)
+        return f"{self.heading}\n{body}" if self.heading else body
+
+
+def heading_level(style_name, text):
+    """Outline level of a paragraph, or None if it isn't a heading."""
+    style = (style_name or "").strip()
+    m = re.match(r"^Heading\s*(\d+)$", style, re.IGNORECASE)
+    if m:
+        return int(m.group(1))
+    if style.lower() == "title":
+        return 1
+    if NUMBERED_HEADING.match(text):
+        return text.split()[0].rstrip(".").count(".") + 1
+    return None
+
+
+def front_matter(sections):
+    """Everything before the first top-level heading — the document's first page."""
+    front = []
+    for section in sections:
+        if section.level == 1:
+            break
+        front.append(section)
+    return front
+
+
+def fit_to_budget(chunks, budget):
+    """
+    Joins text chunks in priority order until `budget` tokens are used;
+    the chunk that overflows is cut on a line boundary.
+    Returns (text, chunks_included, truncated).
+    """
+    out, used = [], 0
+    for n, chunk in enumerate(chunks):
+        cost = count_tokens(chunk) + 1
+        if used + cost <= budget:
+            out.append(chunk)
+            used += cost
+            continue
+        kept = []
+        for line in chunk.splitlines():
+            line_cost = count_tokens(line) + 1
+            if used + line_cost > budget:
+                break
+            kept.append(line)
+            used += line_cost
+        if kept:
+            out.append("\n".join(kept))
+        return "\n\n".join(out), n + (1 if kept else 0), True
+    return "\n\n".join(out), len(chunks), False
+
+
+# 🧩 What each check actually needs from the document
+def compliance_sections(sections):
+    return [s for s in sections if not (s.heading and SKIPPED_COMPLIANCE_HEADINGS.search(s.heading))]
+
+
+def compliance_input(sections):
+    return [s.text for s in compliance_sections(sections)]
+
+
+def structure_input(sections):
+    outline = [
+        f"{'  ' * (s.level - 1)}{s.heading}"
+        for s in sections if s.heading
+    ]
+    return ["Document headings (in order, indented by level):\n" + "\n".join(outline)]
+
+
+def system_name_input(sections):
+    front = front_matter(sections)
+    rest = sections[len(front):]
+    lines = [
+        line.strip()
+        for s in rest
+        for line in s.text.splitlines()
+        if line.strip() and NAME_CANDIDATE.search(line)
+    ]
+    chunks = ["First page:\n" + "\n".join(s.text for s in front)]
+    if lines:
+        chunks.append("Other sentences mentioning names or acronyms:\n" + "\n".join(lines))
+    return chunks
+
+
+CHECK_INPUTS = {
+    "compliance": compliance_input,
+    "structure": structure_input,
+    "system_name": system_name_input,
+}
+
+
+# Check-specific material appended after the instructions in the shared-prefix layout
+CHECK_EXTRAS = {
+    "structure": structure_input,
+}
+
+
+def build_prompt(check, template, sections, budget=None, header=None):
+    """
+    Fills `template` ({document_text}) with only the sections `check` needs,
+    kept within its token budget and preceded by `header` if given.
+    Returns (prompt, report).
+    """
+    budget = budget or PROMPT_TOKEN_BUDGETS[check]
+    document_text, included, truncated = fit_to_budget(CHECK_INPUTS[check](sections), budget)
+    prompt = template.format(document_text=f"{header}\n\n{document_text}" if header else document_text)
+    full_tokens = count_tokens("\n".join(s.text for s in sections))
+    return prompt, {
+        "check": check,
+        "tokenizer": tokenizer_name(),
+        "budget": budget,
+        "document_tokens_full": full_tokens,
+        "document_tokens_used": count_tokens(document_text),
+        "estimated_prompt_tokens": count_tokens(prompt),
+        "chunks_included": included,
+        "truncated": truncated,
+    }
+
+
+def compliance_sections_seen(sections, report):
+    """
+    The compliance sections whose whole text made it into the prompt described
+    by `report` (from build_prompt or build_check_messages) — a section cut
+    off by the token budget doesn't count.
+    """
+    complete = report["chunks_included"] - (1 if report["truncated"] else 0)
+    pool = sections if report.get("layout") == "shared_prefix" else compliance_sections(sections)
+    seen = {id(s) for s in pool[:complete]}
+    return [s for s in compliance_sections(sections) if id(s) in seen]
+
+
+def build_shared_prefix(sections, budget=None):
+    """
+    The document block shared by every check: all sections in reading order,
+    within `budget` tokens. Identical input gives byte-identical output, so
+    the provider can cache it as a prompt prefix. Returns (text, report).
+    """
+    budget = budget or SHARED_DOCUMENT_TOKEN_BUDGET
+    document_text, included, truncated = fit_to_budget([s.text for s in sections], budget)
+    prefix = f"{SHARED_DOCUMENT_HEADER}\n\n{document_text}"
+    return prefix, {
+        "budget": budget,
+        "document_tokens_full": count_tokens("\n".join(s.text for s in sections)),
+        "document_tokens_used": count_tokens(document_text),
+        "shared_prefix_tokens": count_tokens(prefix),
+        "chunks_included": included,
+        "truncated": truncated,
+    }
+
+
+def build_check_messages(checks, sections, layout=None, cached_input_ratio=0.5):
+    """
+    User messages for each (check, template) in `checks`, in send order.
+    Returns {check: (messages, report)}.
+
+    With the shared-prefix layout a check's first message is the common
+    document block and its second holds the instructions. A check whose
+    targeted prompt is cheaper than the cached prefix (billed at
+    `cached_input_ratio` of the normal input price) keeps its single
+    targeted message instead. report["layout"] says which one was used.
+    """
+    layout = layout or PROMPT_LAYOUT
+    targeted = {check: build_prompt(check, template, sections) for check, template in checks}
+    if layout == "targeted":
+        return {check: ([prompt], {**report, "layout": "targeted"}) for check, (prompt, report) in targeted.items()}
+
+    prefix, prefix_report = build_shared_prefix(sections)
+    out = {}
+    for check, template in checks:
+        extras = CHECK_EXTRAS.get(check)
+        reference = "\n\n".join([SHARED_DOCUMENT_REFERENCE] + (extras(sections) if extras else []))
+        instructions = template.format(document_text=reference)
+        instruction_tokens = count_tokens(instructions)
+        shared_cost = prefix_report["shared_prefix_tokens"] * cached_input_ratio + instruction_tokens
+        prompt, report = targeted[check]
+        if report["estimated_prompt_tokens"] <= shared_cost:
+            out[check] = ([prompt], {**report, "layout": "targeted"})
+            continue
+        out[check] = ([prefix, instructions], {
+            "check": check,
+            "layout": "shared_prefix",
+            "tokenizer": tokenizer_name(),
+            **prefix_report,
+            "instruction_tokens": instruction_tokens,
+            "estimated_prompt_tokens": prefix_report["shared_prefix_tokens"] + instruction_tokens,
+        })
+    return out
@@ -0,0 +1,234 @@
+import contextlib
+import contextvars
+import email.utils
+import os
+import random
+import threading
+import time
+
+from metrics import OPENAI_RETRIES, OPENAI_THROTTLED_SECONDS, REGISTRY
+
+# 🚦 Client-side OpenAI budgets per API, as (requests, tokens) per minute for the whole
+# deployment; 0 (the default) disables that budget. They're opt-in: without them calls go
+# straight out and OpenAI's own 429s are still retried below. Set them to your organisation's
+# limits (e.g. tier 1: EMBEDDINGS_RPM=3000 EMBEDDINGS_TPM=1000000 ASSISTANT_RPM=500
+# ASSISTANT_TPM=30000) to pace calls client-side and keep background work out of the way.
+RATE_LIMITS = {
+    "embeddings": (int(os.getenv("EMBEDDINGS_RPM", "0")), int(os.getenv("EMBEDDINGS_TPM", "0"))),
+    "assistant": (int(os.getenv("ASSISTANT_RPM", "0")), int(os.getenv("ASSISTANT_TPM", "0"))),
+}
+# Every gunicorn worker gets an equal share (gunicorn.conf.py exports WEB_CONCURRENCY). A share
+# smaller than one analysis' three prompts (see main.ANALYSIS_TOKEN_RESERVATION; ~39k tokens with
+# the default prompt budgets) makes them run one after another (main logs a warning), so with
+# 2 workers ASSISTANT_TPM needs ~80k or more for the checks to run in parallel
+RATE_LIMIT_PROCESSES = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# 🔁 Retries for 429s, 5xx and dropped connections (the SDK's own retries are turned off)
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "6"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# 🥇 Interactive work (/analyze) goes first; background work (index ingest, uploads)
+# only spends budget while interactive callers aren't waiting and leaves this share free
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+BACKGROUND_HEADROOM = 0.2
+
+_priority = contextvars.ContextVar("openai_priority", default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """OpenAI calls made by this thread inside the block use `priority`."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimitedError(Exception):
+    """OpenAI kept refusing a call (429/5xx) through every retry."""
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms), or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _retry_reason(error, idempotent):
+    """"rate_limited", "server_error" or "connection" when `error` is worth retrying, else None."""
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(error, APIStatusError) and error.status_code in RETRYABLE_STATUS:
+        return "rate_limited" if error.status_code == 429 else "server_error"
+    # a request that may have reached the server (e.g. creating a run) isn't resent blindly
+    if isinstance(error, APIConnectionError) and idempotent:
+        return "connection"
+    return None
+
+
+class RateLimitGovernor:
+    """
+    Token buckets for one API's requests-per-minute and tokens-per-minute
+    budgets, shared by every thread in the process. Callers reserve an
+    estimated token count up front and settle it once usage is known.
+    A 429 pauses every caller of the API for its Retry-After.
+    """
+
+    def __init__(self, api, rpm, tpm):
+        self.api = api
+        self.capacity = {"requests": rpm, "tokens": tpm}
+        self.level = {"requests": float(rpm), "tokens": float(tpm)}
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._interactive_waiting = 0
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        for budget, capacity in self.capacity.items():
+            if capacity:
+                self.level[budget] = min(capacity, self.level[budget] + elapsed * capacity / 60)
+
+    def _shortfall(self, need, reserve):
+        """Seconds until both budgets cover `need` plus `reserve` (a share of capacity), 0 if they do."""
+        wait = 0.0
+        for budget, capacity in self.capacity.items():
+            if capacity:
+                amount = min(need[budget], capacity * (1 - reserve)) + capacity * reserve
+                if self.level[budget] < amount:
+                    wait = max(wait, (amount - self.level[budget]) * 60 / capacity)
+        return wait
+
+    def acquire(self, tokens=0, priority=None):
+        """
+        Blocks until one request and `tokens` tokens fit the budgets. Returns
+        the tokens actually deducted (capped at the budget's capacity), which
+        is what `settle` must be given.
+        """
+        priority = priority or _priority.get()
+        need = {"requests": 1, "tokens": tokens}
+        reserve = BACKGROUND_HEADROOM if priority == BACKGROUND else 0.0
+        start = time.monotonic()
+        with self._cond:
+            if priority == INTERACTIVE:
+                self._interactive_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = max(self._paused_until - now, self._shortfall(need, reserve))
+                    if priority == BACKGROUND and self._interactive_waiting:
+                        wait = max(wait, 0.05)
+                    if wait <= 0:
+                        deducted = {budget: min(need[budget], capacity) if capacity else 0
+                                    for budget, capacity in self.capacity.items()}
+                        for budget, amount in deducted.items():
+                            self.level[budget] -= amount
+                        break
+                    self._cond.wait(min(wait, 1.0))
+            finally:
+                if priority == INTERACTIVE:
+                    self._interactive_waiting -= 1
+                    self._cond.notify_all()
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            OPENAI_THROTTLED_SECONDS.observe(waited, api=self.api, priority=priority)
+        return deducted["tokens"]
+
+    def settle(self, reserved_tokens, actual_tokens):
+        """
+        Corrects the tokens budget once a call's real usage is known;
+        `reserved_tokens` is what `acquire` deducted, not what was asked for.
+        """
+        if self.capacity["tokens"] and actual_tokens is not None:
+            with self._cond:
+                self.level["tokens"] += reserved_tokens - actual_tokens
+                self._cond.notify_all()
+
+    def pause(self, seconds):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def call(self, fn, tokens=0, idempotent=True, priority=None):
+        """
+        Runs `fn()` inside the budgets, retrying 429s and 5xx (and connection
+        errors when `idempotent`) with jittered exponential backoff that
+        honours Retry-After. Raises RateLimitedError once attempts run out.
+        """
+        return self.call_reserving(fn, tokens, idempotent, priority)[0]
+
+    def call_reserving(self, fn, tokens=0, idempotent=True, priority=None):
+        """
+        `call`, returning (result, tokens reserved) for a later `settle`. If
+        it raises instead, the reservation has already been given back.
+        """
+        reserved = 0
+        for attempt in range(1, OPENAI_MAX_ATTEMPTS + 1):
+            reserved += self.acquire(tokens if attempt == 1 else 0, priority)
+            try:
+                return fn(), reserved
+            except Exception as e:
+                reason = _retry_reason(e, idempotent)
+                if reason is None or attempt == OPENAI_MAX_ATTEMPTS:
+                    self.settle(reserved, 0)  # the caller never gets to settle a call that raised
+                if reason is None:
+                    raise
+                OPENAI_RETRIES.inc(api=self.api, reason=reason)
+                if attempt == OPENAI_MAX_ATTEMPTS:
+                    raise RateLimitedError(
+                        f"OpenAI {self.api} call still failing after {attempt} attempts: {e}"
+                    ) from e
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    delay = retry_after + random.uniform(0, min(1.0, retry_after / 4 + 0.1))
+                else:
+                    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                if reason == "rate_limited":
+                    self.pause(delay)  # everyone backs off, not just this caller
+                print(f"⚠️ OpenAI {self.api} {reason} (attempt {attempt}/{OPENAI_MAX_ATTEMPTS}); "
+                      f"retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def stats(self):
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                budget: {"capacity": capacity, "available": round(self.level[budget], 1) if capacity else None}
+                for budget, capacity in self.capacity.items()
+            }
+
+
+GOVERNORS = {
+    api: RateLimitGovernor(api, rpm // RATE_LIMIT_PROCESSES, tpm // RATE_LIMIT_PROCESSES)
+    for api, (rpm, tpm) in RATE_LIMITS.items()
+}
+EMBEDDINGS_GOVERNOR = GOVERNORS["embeddings"]
+ASSISTANT_GOVERNOR = GOVERNORS["assistant"]
+
+REGISTRY.callback(
+    "sdlc_openai_budget_available", "Requests/tokens currently left in each client-side budget",
+    lambda: {
+        (api, budget): stats["available"]
+        for api, governor in GOVERNORS.items()
+        for budget, stats in governor.stats().items()
+        if stats["available"] is not None
+    },
+    labelnames=["api", "budget"]
+)
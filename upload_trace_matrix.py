@@ -1,26 +1,43 @@
+import hashlib
+import json
 import os
+import queue
 import re
-import docx
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
-from pinecone import Pinecone, ServerlessSpec
+from docx_stream import iter_paragraphs
+from embeddings import EmbeddingCache, Throughput, iter_batches
+from embedding_providers import EMBEDDING_PROVIDER, index_namespace, index_path, open_embedding_provider
+from vector_store import PINECONE_INDEX, open_vector_store
+from rate_limit import BACKGROUND, RateLimitedError, request_priority
 
 # === Environment Setup ===
 PINECONE_API_KEY = os.getenv("pcsk_4ZtuSM_TTtxev4rxpTPGcVcfu2FNrwerLxJHUyG3WCgzgSSHtG7kXyADsr6xZ3fNX6pRKG")
 PINECONE_ENV = "us-east-1"
-INDEX_NAME = "sdlc-rag-index"
+INDEX_NAME = PINECONE_INDEX
 TRACE_MATRIX_PATH = "proprietary_documents/Trace Matrix v8.docx"
+# Target index: "pinecone" (default), "numpy" or "chroma" — same backends main.py can serve from
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+# Embedding provider ("openai", "hashed" or "local", see embedding_providers); each one gets
+# its own index folder / Pinecone namespace and is recorded on every vector
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", index_path(
+    ".chromadb" if VECTOR_BACKEND == "chroma" else f".{VECTOR_BACKEND}_index"))
 
-# === Initialize OpenAI + Pinecone Clients ===
-client = OpenAI()
-pc = Pinecone(api_key=PINECONE_API_KEY)
+# === Shared on-disk embedding cache (same store main.py uses) ===
+embedding_cache = EmbeddingCache()
 
-# === Access Pinecone Index ===
-index = pc.Index(INDEX_NAME)
+# === Embedding provider (the OpenAI client is only created if it's the API; retries go
+# through rate_limit's shared budgets) ===
+provider = open_embedding_provider(
+    EMBEDDING_PROVIDER, client_factory=lambda: OpenAI(max_retries=0), cache=embedding_cache
+)
 
 # === Step 1: Parse Requirements from Trace Matrix ===
 def extract_requirements(file_path):
-    doc = docx.Document(file_path)
-    paragraphs = [p.text.strip() for p in doc.paragraphs if p.text.strip()]
+    # streamed, table cells included (trace matrices are usually tables)
+    paragraphs = [p.text.strip() for p in iter_paragraphs(file_path) if p.text.strip()]
     
     requirements = []
     seen_ids = set()
@@ -63,44 +80,204 @@ def extract_requirements(file_path):
 
     return requirements
 
-# === Step 2: Embed Text Using OpenAI ===
-def get_embedding(text):
-    try:
-        response = client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=[text]
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"❌ Embedding failed: {e}")
-        return None
-
-# === Step 3: Upload Embeddings to Pinecone ===
-def upload_to_pinecone(requirements, batch_size=50):
-    vectors = []
-    for i, (req_id, text) in enumerate(requirements):
-        embedding = get_embedding(text)
-        if embedding:
-            vectors.append({
-                "id": f"req_{i}",
-                "values": embedding,
-                "metadata": {
-                    "requirement_id": req_id,
-                    "text": text
-                }
-            })
-            print(f"✅ Embedded {req_id}")
-        else:
-            print(f"⚠️ Skipped {req_id} due to embedding error")
+# === Step 2: Embed and upload to the vector index (Pinecone by default) ===
+# Embedding requests in flight at once, and requirements per request
+UPLOAD_EMBED_WORKERS = int(os.getenv("UPLOAD_EMBED_WORKERS", "4"))
+UPLOAD_EMBED_BATCH = int(os.getenv("UPLOAD_EMBED_BATCH", "100"))
+# Embedded batches allowed to wait for the uploader; bounds memory on large matrices
+UPLOAD_MAX_PENDING_BATCHES = int(os.getenv("UPLOAD_MAX_PENDING_BATCHES", "8"))
+UPSERT_ATTEMPTS = 3
+# IDs confirmed in each target index, so a crashed or rate-limited upload resumes where it stopped
+UPLOAD_CHECKPOINT_PATH = os.getenv("UPLOAD_CHECKPOINT_PATH", ".upload_checkpoint.jsonl")
+
+
+def vector_id(req_id, text, provider_id):
+    """Deterministic ID from a requirement's content: unchanged requirements keep theirs across runs."""
+    digest = hashlib.sha256(f"{provider_id}\0{req_id}\0{text}".encode("utf-8")).hexdigest()
+    return f"req_{digest[:32]}"
+
+
+class UploadCheckpoint:
+    """
+    Append-only JSON-lines log of the vector IDs confirmed in each target
+    index ("backend:index:namespace:provider"). Every line is flushed and
+    fsync'ed once its upsert has succeeded, so a killed run loses nothing
+    it already uploaded.
+    """
 
-    # 🔁 Upload in small batches
-    for i in range(0, len(vectors), batch_size):
-        batch = vectors[i:i + batch_size]
+    def __init__(self, path, target):
+        self.path = path
+        self.target = target
+        self.done = set()
+        self._lock = threading.Lock()
         try:
-            index.upsert(vectors=batch)
-            print(f"📦 Uploaded batch {i // batch_size + 1} ({len(batch)} vectors)")
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    if entry.get("target") == target:
+                        self.done.update(entry.get("add", []))
+                        self.done.difference_update(entry.get("remove", []))
+        except OSError:
+            pass
+
+    def _append(self, entry):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"target": self.target, **entry}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, ids):
+        ids = [i for i in ids if i not in self.done]
+        if ids:
+            with self._lock:
+                self._append({"add": ids})
+                self.done.update(ids)
+
+    def remove(self, ids):
+        if ids:
+            with self._lock:
+                self._append({"remove": list(ids)})
+                self.done.difference_update(ids)
+
+    def compact(self):
+        """Rewrites the log with one line per target."""
+        with self._lock:
+            targets = {}
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    done = targets.setdefault(entry.get("target"), set())
+                    done.update(entry.get("add", []))
+                    done.difference_update(entry.get("remove", []))
+            targets[self.target] = self.done
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for target, done in targets.items():
+                    f.write(json.dumps({"target": target, "add": sorted(done)}) + "\n")
+            os.replace(tmp_path, self.path)
+
+
+def upload_to_pinecone(requirements, store, batch_size=50, embedder=None, checkpoint=None,
+                       workers=UPLOAD_EMBED_WORKERS, max_pending=UPLOAD_MAX_PENDING_BATCHES, prune=True):
+    """
+    Pipelined upload: worker threads check which vectors the index already
+    has and embed the rest while one uploader thread upserts finished
+    batches, with at most `max_pending` embedded batches held in memory.
+    Vector IDs derive from each requirement's content, so unchanged ones are
+    skipped (by the checkpoint, else by the index), and once everything is
+    uploaded, vectors of requirements that changed or disappeared are
+    deleted. Returns a summary; requirements that couldn't be embedded or
+    upserted are listed under "failed" (a re-run retries only those).
+    """
+    embedder = embedder or provider
+    checkpoint = checkpoint or UploadCheckpoint(UPLOAD_CHECKPOINT_PATH, f"{store.name}:{embedder.id}")
+    records = {}
+    for req_id, text in requirements:
+        records.setdefault(vector_id(req_id, text, embedder.id), (req_id, text))
+    first_run = not checkpoint.done
+    todo = [i for i in records if i not in checkpoint.done]
+    summary = {"requirements": len(records), "checkpointed": len(records) - len(todo), "already_indexed": 0,
+               "embedded": 0, "uploaded": 0, "failed": [], "pruned": 0}
+    throughput = Throughput()
+    results = queue.Queue()
+    slots = threading.BoundedSemaphore(max(1, max_pending))
+    stop = threading.Event()
+    errors = []
+
+    def embed(ids):
+        # runs on a pool thread, which doesn't inherit the caller's priority
+        try:
+            with request_priority(BACKGROUND):
+                present = store.existing(ids)
+                fresh = [i for i in ids if i not in present]
+                vectors = embedder.embed([records[i][1] for i in fresh]) if fresh else []
+            results.put((ids, present, fresh, vectors, None))
         except Exception as e:
-            print(f"❌ Error uploading batch {i // batch_size + 1}: {e}")
+            results.put((ids, set(), [], [], e))
+
+    def upsert(ids, vectors):
+        metadatas = [
+            {"requirement_id": records[i][0], "text": records[i][1], "embedding_provider": embedder.id}
+            for i in ids
+        ]
+        for attempt in range(UPSERT_ATTEMPTS):
+            try:
+                store.upsert(ids=ids, embeddings=vectors, metadatas=metadatas)
+                return None
+            except Exception as e:
+                if attempt == UPSERT_ATTEMPTS - 1:
+                    return e
+                time.sleep(2 ** attempt)
+
+    def upload():
+        while True:
+            item = results.get()
+            if item is None:
+                return
+            ids, present, fresh, vectors, error = item
+            try:
+                if error is not None:
+                    print(f"❌ Embedding failed: {error}")
+                    summary["failed"].extend(records[i][0] for i in ids)
+                    if isinstance(error, RateLimitedError):
+                        errors.append(error)
+                        stop.set()
+                    continue
+                checkpoint.add([i for i in ids if i in present])
+                summary["already_indexed"] += len(present)
+                summary["embedded"] += len(fresh)
+                throughput.add(len(fresh))
+                for start in range(0, len(fresh), batch_size):
+                    chunk = fresh[start:start + batch_size]
+                    error = upsert(chunk, vectors[start:start + batch_size])
+                    if error is None:
+                        checkpoint.add(chunk)
+                        summary["uploaded"] += len(chunk)
+                    else:
+                        print(f"❌ Error uploading {len(chunk)} vectors: {error}")
+                        summary["failed"].extend(records[i][0] for i in chunk)
+                print(f"📦 {summary['uploaded']} uploaded, {summary['already_indexed']} already indexed "
+                      f"({summary['checkpointed']} skipped by checkpoint)")
+            except Exception as e:  # keep draining so no embedder blocks on a slot
+                errors.append(e)
+                stop.set()
+            finally:
+                slots.release()
+
+    uploader = threading.Thread(target=upload, name="upload", daemon=True)
+    uploader.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="embed") as pool:
+            for start, end in iter_batches([records[i][1] for i in todo], max_items=UPLOAD_EMBED_BATCH):
+                slots.acquire()
+                if stop.is_set():
+                    slots.release()
+                    break
+                pool.submit(embed, todo[start:end])
+    finally:
+        results.put(None)
+        uploader.join()
+    print(f"⏱️ Embedded {throughput}")
+    if errors:
+        raise errors[0]
+
+    if prune and not summary["failed"]:
+        stale = checkpoint.done - set(records)
+        if first_run:
+            # positional IDs (req_0, req_1, ...) left by uploads from before content-derived ones
+            stale |= store.existing(f"req_{i}" for i in range(len(requirements)))
+        if stale:
+            store.delete(sorted(stale))
+            checkpoint.remove(stale)
+            summary["pruned"] = len(stale)
+        checkpoint.compact()
+    return summary
 
 
 # === Main ===
@@ -114,6 +291,21 @@ if __name__ == "__main__":
     print(f"📄 Found {len(requirements)} requirements")
 
     if requirements:
-        upload_to_pinecone(requirements)
+        store = open_vector_store(VECTOR_BACKEND, path=VECTOR_INDEX_PATH, pinecone_api_key=PINECONE_API_KEY,
+                                  namespace=index_namespace())
+        print(f"🧭 Uploading to {store.name} index, embedded with {provider.id}")
+        checkpoint = UploadCheckpoint(UPLOAD_CHECKPOINT_PATH, ":".join(
+            [store.name, INDEX_NAME if store.name == "pinecone" else VECTOR_INDEX_PATH, index_namespace(), provider.id]
+        ))
+        try:
+            with request_priority(BACKGROUND):
+                summary = upload_to_pinecone(requirements, store, checkpoint=checkpoint)
+        except RateLimitedError as e:
+            print(f"❌ {e}; re-run once the limit resets (uploaded batches are checkpointed)")
+            exit(1)
+        print(f"✅ Upload finished: {summary}")
+        if summary["failed"]:
+            print(f"❌ {len(summary['failed'])} requirements not uploaded; re-run to retry only those")
+            exit(1)
     else:
         print("❌ No requirements parsed. Check your document format.")
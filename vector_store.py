@@ -0,0 +1,449 @@
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import zipfile
+
+import numpy as np
+
+
+class VectorStore:
+    """
+    Minimal interface the RAG index needs. Distances are cosine distances
+    (0 = identical), so the same cutoff works on every backend.
+    """
+
+    name = "base"
+
+    def upsert(self, ids, embeddings, metadatas):
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def query(self, query_embeddings, n_results):
+        """Returns one [(metadata, distance), ...] list per query, best match first."""
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def ids(self):
+        raise NotImplementedError
+
+    def existing(self, ids):
+        """The subset of `ids` already in the index."""
+        present = set(self.ids())
+        return {i for i in ids if i in present}
+
+    def reset(self):
+        """Removes every vector, e.g. before rebuilding with vectors of another provider."""
+        stale = self.ids()
+        if stale:
+            self.delete(stale)
+
+    def reload(self):
+        """Re-reads the index after another process changed it (no-op for server-side indexes)."""
+
+    @contextlib.contextmanager
+    def bulk(self):
+        """Groups writes; a backend that persists to one file writes it once, when the block ends."""
+        yield
+
+
+# 🟣 Chroma (persistent HNSW collection)
+class ChromaVectorStore(VectorStore):
+    name = "chroma"
+
+    def __init__(self, collection, path=None, client=None):
+        self.collection = collection
+        self.path = path
+        self.client = client
+        # calls run concurrently; reset/reload wait for them before swapping the client they use
+        self._swap = threading.Condition()
+        self._readers = 0
+        self._swapping = False
+
+    @contextlib.contextmanager
+    def _using(self):
+        with self._swap:
+            while self._swapping:
+                self._swap.wait()
+            self._readers += 1
+            collection = self.collection
+        try:
+            yield collection
+        finally:
+            with self._swap:
+                self._readers -= 1
+                self._swap.notify_all()
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        with self._swap:
+            while self._swapping:
+                self._swap.wait()
+            self._swapping = True
+            while self._readers:
+                self._swap.wait()
+        try:
+            yield
+        finally:
+            with self._swap:
+                self._swapping = False
+                self._swap.notify_all()
+
+    def upsert(self, ids, embeddings, metadatas):
+        with self._using() as collection:
+            collection.upsert(ids=list(ids), embeddings=list(embeddings), metadatas=list(metadatas))
+
+    def delete(self, ids):
+        if ids:
+            with self._using() as collection:
+                collection.delete(ids=list(ids))
+
+    def query(self, query_embeddings, n_results):
+        if not len(query_embeddings):
+            return []
+        with self._using() as collection:
+            results = collection.query(
+                query_embeddings=list(query_embeddings),
+                n_results=n_results,
+                include=["metadatas", "distances"]
+            )
+        return [list(zip(m, d)) for m, d in zip(results["metadatas"], results["distances"])]
+
+    def count(self):
+        with self._using() as collection:
+            return collection.count()
+
+    def ids(self):
+        with self._using() as collection:
+            return collection.get(include=[])["ids"]
+
+    def existing(self, ids):
+        ids = list(ids)
+        if not ids:
+            return set()
+        with self._using() as collection:
+            return set(collection.get(ids=ids, include=[])["ids"])
+
+    def reset(self):
+        # the collection keeps the dimensionality of its first vectors, so drop it entirely
+        if self.client is None:
+            return super().reset()
+        with self._exclusive():
+            self.client.delete_collection(CHROMA_COLLECTION)
+            self.collection = _chroma_collection(self.client)
+
+    def reload(self):
+        # a persistent client keeps its HNSW segment in memory; stop it and
+        # open a new one so the segment is re-read with other processes' writes
+        if self.client is None:
+            return
+        with self._exclusive():
+            _close_chroma_client(self.client)
+            self.client = _open_chroma_client(self.path)
+            self.collection = _chroma_collection(self.client)
+
+
+# 🌲 Pinecone (managed index created with metric="cosine")
+class PineconeVectorStore(VectorStore):
+    name = "pinecone"
+
+    def __init__(self, index, namespace="", batch_size=100):
+        self.index = index
+        self.namespace = namespace
+        self.batch_size = batch_size
+
+    def upsert(self, ids, embeddings, metadatas):
+        vectors = [
+            {"id": i, "values": list(map(float, e)), "metadata": m}
+            for i, e, m in zip(ids, embeddings, metadatas)
+        ]
+        for start in range(0, len(vectors), self.batch_size):
+            self.index.upsert(vectors=vectors[start:start + self.batch_size], namespace=self.namespace)
+
+    def delete(self, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), 1000):
+            self.index.delete(ids=ids[start:start + 1000], namespace=self.namespace)
+
+    def query(self, query_embeddings, n_results):
+        # Pinecone takes one vector per query; scores are cosine similarities
+        out = []
+        for emb in query_embeddings:
+            res = self.index.query(
+                vector=list(map(float, emb)),
+                top_k=n_results,
+                include_metadata=True,
+                namespace=self.namespace
+            )
+            out.append([(m["metadata"], 1.0 - m["score"]) for m in res["matches"]])
+        return out
+
+    def count(self):
+        stats = self.index.describe_index_stats()
+        if self.namespace:
+            ns = stats["namespaces"].get(self.namespace)
+            return ns["vector_count"] if ns else 0
+        return stats["total_vector_count"]
+
+    def ids(self):
+        found = []
+        for page in self.index.list(namespace=self.namespace):
+            found.extend(page)
+        return found
+
+    def existing(self, ids):
+        ids = list(ids)
+        found = set()
+        for start in range(0, len(ids), self.batch_size):
+            res = self.index.fetch(ids=ids[start:start + self.batch_size], namespace=self.namespace)
+            found.update(res["vectors"])
+        return found
+
+
+# 🧮 In-process exact search over a contiguous float32 matrix
+class NumpyVectorStore(VectorStore):
+    """
+    Keeps unit-normalised vectors in one float32 matrix and answers queries
+    with a single matmul + argpartition (exact cosine top-k).
+    With `path`, the matrix, ids and metadata are saved together in one
+    uncompressed index.npz, replaced atomically, and the matrix is re-opened
+    memory-mapped, so start-up doesn't copy it into RAM. Writes inside
+    `bulk()` are saved once, when the block ends.
+    """
+
+    name = "numpy"
+    FILE = "index.npz"
+    LEGACY_FILES = ("vectors.npy", "records.json")  # the matrix and records, before index.npz
+
+    def __init__(self, path=None, mmap=True):
+        self.path = path
+        self.mmap = mmap
+        self._lock = threading.RLock()
+        self._ids = []
+        self._metadatas = []
+        self._positions = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._bulk_depth = 0
+        self._dirty = False
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._load(mmap)
+
+    # 💾 Persistence
+    def _load(self, mmap):
+        index_path = os.path.join(self.path, self.FILE)
+        if os.path.exists(index_path):
+            with np.load(index_path, allow_pickle=False) as data:
+                records = json.loads(str(data["records"]))
+                matrix = None if mmap else data["matrix"]
+            if matrix is None:
+                matrix = _mmap_npz_member(index_path, "matrix.npy")
+        else:
+            matrix_path, records_path = (os.path.join(self.path, name) for name in self.LEGACY_FILES)
+            if not (os.path.exists(matrix_path) and os.path.exists(records_path)):
+                return
+            with open(records_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            matrix = np.load(matrix_path, mmap_mode="r" if mmap else None)
+        self._matrix = matrix
+        self._ids = records["ids"]
+        self._metadatas = records["metadatas"]
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+
+    def _save(self):
+        if not self.path:
+            return
+        if self._bulk_depth:
+            self._dirty = True
+            return
+        index_path = os.path.join(self.path, self.FILE)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=f".{self.FILE}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, matrix=np.ascontiguousarray(self._matrix),
+                         records=np.array(json.dumps({"ids": self._ids, "metadatas": self._metadatas})))
+            os.replace(tmp_path, index_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._dirty = False
+        for name in self.LEGACY_FILES:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.path, name))
+
+    @contextlib.contextmanager
+    def bulk(self):
+        with self._lock:
+            self._bulk_depth += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._bulk_depth -= 1
+                if not self._bulk_depth and self._dirty:
+                    self._save()
+
+    @staticmethod
+    def _normalise(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    # ✏️ Writes (copy-on-write so readers never see a half-updated matrix)
+    def upsert(self, ids, embeddings, metadatas):
+        ids = list(ids)
+        if not ids:
+            return
+        vectors = self._normalise(embeddings)
+        with self._lock:
+            matrix = np.array(self._matrix, dtype=np.float32) if self._matrix.size else \
+                np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            new_rows = []
+            for doc_id, vector, metadata in zip(ids, vectors, metadatas):
+                pos = self._positions.get(doc_id)
+                if pos is None:
+                    self._positions[doc_id] = len(self._ids)
+                    self._ids.append(doc_id)
+                    self._metadatas.append(metadata)
+                    new_rows.append(vector)
+                else:
+                    matrix[pos] = vector
+                    self._metadatas[pos] = metadata
+            if new_rows:
+                matrix = np.vstack([matrix, np.stack(new_rows)])
+            self._matrix = np.ascontiguousarray(matrix)
+            self._save()
+
+    def delete(self, ids):
+        with self._lock:
+            drop = {self._positions[i] for i in ids if i in self._positions}
+            if not drop:
+                return
+            keep = [p for p in range(len(self._ids)) if p not in drop]
+            self._matrix = np.ascontiguousarray(np.asarray(self._matrix)[keep])
+            self._ids = [self._ids[p] for p in keep]
+            self._metadatas = [self._metadatas[p] for p in keep]
+            self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+            self._save()
+
+    # 🔍 Exact cosine top-k
+    def query(self, query_embeddings, n_results):
+        with self._lock:
+            matrix, metadatas = self._matrix, self._metadatas
+        if not len(query_embeddings):
+            return []
+        if matrix.shape[0] == 0:
+            return [[] for _ in query_embeddings]
+
+        sims = self._normalise(query_embeddings) @ matrix.T  # (queries, rows)
+        k = min(n_results, sims.shape[1])
+        if k < sims.shape[1]:
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(sims.shape[1]), (sims.shape[0], k))
+        out = []
+        for row, cols in zip(sims, top):
+            cols = cols[np.argsort(-row[cols])]
+            out.append([(metadatas[c], float(1.0 - row[c])) for c in cols])
+        return out
+
+    def count(self):
+        return len(self._ids)
+
+    def reload(self):
+        if self.path:
+            with self._lock:
+                self._load(self.mmap)
+
+    def ids(self):
+        with self._lock:
+            return list(self._ids)
+
+    def existing(self, ids):
+        with self._lock:
+            return {i for i in ids if i in self._positions}
+
+
+def _mmap_npz_member(path, member):
+    """Memory-maps an array stored uncompressed (np.savez) inside an .npz file."""
+    header_readers = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(member)
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        local_header = f.read(30)  # the local file header's name/extra lengths can differ from the directory's
+        name_length = int.from_bytes(local_header[26:28], "little")
+        extra_length = int.from_bytes(local_header[28:30], "little")
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f) if info.compress_type == zipfile.ZIP_STORED else None
+        if version not in header_readers:
+            with np.load(path, allow_pickle=False) as data:
+                return data[member[:-len(".npy")]]
+        shape, fortran_order, dtype = header_readers[version](f)
+        offset = f.tell()
+    if not shape or not np.prod(shape):
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape, order="F" if fortran_order else "C")
+
+
+CHROMA_COLLECTION = "sdlc-rag-index"
+PINECONE_INDEX = os.getenv("PINECONE_INDEX", "sdlc-rag-index")
+
+
+def _open_chroma_client(path):
+    import chromadb
+
+    return chromadb.PersistentClient(path=path)
+
+
+def _close_chroma_client(client):
+    """Stops the client's System (its segments and threads) instead of leaving it cached."""
+    close = getattr(client, "close", None)
+    if close is not None:
+        close()
+        return
+    from chromadb.api.client import SharedSystemClient  # chromadb without Client.close()
+
+    system = SharedSystemClient._identifier_to_system.pop(client._identifier, None)
+    if system is not None:
+        system.stop()
+
+
+def _chroma_collection(chroma_client):
+    # get_or_create so re‑starts keep the persisted index instead of rebuilding it
+    # Create with cosine distance and a higher construction ef for better index quality
+    return chroma_client.get_or_create_collection(
+        name=CHROMA_COLLECTION,
+        metadata={
+            "hnsw:space": "cosine",            # use cosine distance instead of L2
+            "hnsw:construction_ef": 200,       # build a richer graph
+            "hnsw:sync_threshold": 1000        # sync threshold (optional tweak)
+        }
+    )
+
+
+def open_vector_store(backend, path=None, pinecone_api_key=None, namespace=""):
+    """
+    Opens a backend by name: "chroma" (persistent collection under `path`),
+    "numpy" (matrix files under `path`) or "pinecone" (PINECONE_INDEX).
+    """
+    backend = backend.lower()
+    if backend == "chroma":
+        client = _open_chroma_client(path)
+        return ChromaVectorStore(_chroma_collection(client), path=path, client=client)
+    if backend == "numpy":
+        return NumpyVectorStore(path)
+    if backend == "pinecone":
+        from pinecone import Pinecone  # optional dependency, only needed for this backend
+
+        pc = Pinecone(api_key=pinecone_api_key or os.getenv("PINECONE_API_KEY"))
+        return PineconeVectorStore(pc.Index(PINECONE_INDEX), namespace=namespace)
+    raise ValueError(f"Unknown vector store backend: {backend}")